@@ -1,21 +1,28 @@
 import os
 from app import create_app
 from app.extensions import db
-from conf import DATABASE_URI
+from conf import QUERY_AUDIT, QUERY_AUDIT_IGNORE
+from app.database import init_database
 from app.scheduler import scheduler
+from app.migrations import run_migrations
+from app.utils.query_audit import install_query_audit
+from app.image_records import image_records
 
 app = create_app()
 
-# Configure database
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URI
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize extensions
-db.init_app(app)
+# Configure database and initialize extensions
+init_database(app)
 
 # Create database tables
 with app.app_context():
     db.create_all()
+    # 为已有数据库补充新增的索引等结构变更
+    run_migrations(db.engine)
+    if QUERY_AUDIT:
+        install_query_audit(db.engine, QUERY_AUDIT_IGNORE)
+
+# Start the batched image record writer, replaying records left by a crash
+image_records.init_app(app)
 
 # Initialize scheduler with app
 scheduler.init_app(app)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from app.models.agent import Agent, AgentStatus, ScheduleType
+from app.models.agent_run import AgentRun
 from app.extensions import db
 from app.scheduler import scheduler
 from app.models.workflow import Workflow
@@ -147,6 +148,27 @@ def list_agents():
             'data': None
         }), 400
 
+@bp.route('/agents/<int:agent_id>/runs', methods=['GET'])
+def list_agent_runs(agent_id):
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        runs = (AgentRun.query
+                .filter_by(agent_id=agent_id)
+                .order_by(AgentRun.id.desc())
+                .limit(limit)
+                .all())
+        return jsonify({
+            'success': True,
+            'message': '执行记录获取成功',
+            'data': [run.to_dict() for run in runs]
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'data': None
+        }), 400
+
 @bp.route('/agents/<int:agent_id>/toggle', methods=['PUT'])
 def toggle_agent(agent_id):
     try:
@@ -193,6 +215,7 @@ def delete_agent(agent_id):
             }), 404
         
         scheduler.remove_agent(agent.id)
+        AgentRun.query.filter_by(agent_id=agent.id).delete()
         db.session.delete(agent)
         db.session.commit()
         return jsonify({
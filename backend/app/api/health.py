@@ -2,6 +2,12 @@ from flask import Blueprint
 from app.utils.response import success_response
 import websocket
 from conf import COMFYUI_SERVER_ADDRESS
+from app.dispatcher import dispatcher
+from llm.gateway import llm_gateway
+from ratelimit.limiter import rate_limiter
+from app.renditions import renditions
+from app.database import pool_status
+from app.image_records import image_records
 
 bp = Blueprint('health', __name__, url_prefix='/api')
 
@@ -24,5 +30,12 @@ def health_check():
         'comfyui_status': {
             'running': comfyui_running,
             'message': comfyui_message
-        }
+        },
+        'generation_queue': dispatcher.stats(),
+        'llm': llm_gateway.metrics(),
+        'llm_cache': llm_gateway.cache.stats(),
+        'rate_limits': rate_limiter.metrics(),
+        'renditions': renditions.cache_stats(),
+        'database': pool_status(),
+        'image_records': image_records.writer_stats()
     }) 
\ No newline at end of file
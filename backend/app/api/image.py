@@ -1,17 +1,20 @@
 from flask import Blueprint, request, send_from_directory
 from app.utils.response import success_response, error_response
 from werkzeug.utils import secure_filename
-from conf import ALLOWED_EXTENSIONS, UPLOAD_FOLDER, OUTPUT_FOLDER, BASE_PATH
+from conf import ALLOWED_EXTENSIONS, UPLOAD_FOLDER, OUTPUT_FOLDER, BASE_PATH, THUMBNAIL_WIDTH
 import os
+from datetime import datetime
 from pathlib import Path
 from comfyui_api.utils.actions.prompt_to_image import prompt_to_image
 from comfyui_api.utils.actions.load_workflow import load_workflow
 from app.models.image import Image
-from app.extensions import db
 from app.utils.logger import logger
 from app.models.workflow import Workflow
 from app.models.variable_definitions import VariableDefinitions
 from app.models.workflow_variable import WorkflowVariable
+from app.dispatcher import dispatcher, JobPriority
+from app.image_records import image_records
+from app.utils.pagination import keyset_paginate, encode_cursor, count_rows, parse_date_range, InvalidCursor
 
 bp = Blueprint('image', __name__, url_prefix='/api')
 
@@ -123,10 +126,12 @@ def generate_image():
         logger.info(f"Variable mapping created: {variable_mapping}")
         logger.info(f"Output nodes: {output_nodes}")
         
-        # 调用生成方法
+        # 调用生成方法，交互请求优先于托管任务执行
         logger.info("Starting image generation process")
         try:
-            result = prompt_to_image(
+            result = dispatcher.run(
+                JobPriority.INTERACTIVE,
+                prompt_to_image,
                 workflow=workflow_data,
                 variable_values=variable_mapping,
                 output_node_ids=output_nodes,
@@ -141,18 +146,18 @@ def generate_image():
             
         logger.info(f"Image generation completed: {result}")
         
-        # 保存图片信息到数据库
+        # 保存图片信息到数据库，与同时完成的其他生成请求合并为一个事务
         try:
-            image = Image(
-                filename=os.path.basename(result[0]),
-                workflow_id=workflow_id,
-                workflow_name=workflow.name,
-                file_path=os.path.join(OUTPUT_FOLDER, result[0]),
-                variables=variable_mapping
-            )
-            db.session.add(image)
-            db.session.commit()
-            logger.info(f"Image record saved to database with ID: {image.id}")
+            record = {
+                'filename': os.path.basename(result[0]),
+                'workflow_id': workflow_id,
+                'workflow_name': workflow.name,
+                'file_path': os.path.join(OUTPUT_FOLDER, result[0]),
+                'variables': variable_mapping,
+                'created_at': datetime.utcnow()
+            }
+            image_id = image_records.write(**record)
+            logger.info(f"Image record saved to database with ID: {image_id}")
         except Exception as e:
             logger.error("Failed to save image record to database", exc_info=e)
             # 即使数据库保存失败，仍然返回生成的图片
@@ -165,7 +170,8 @@ def generate_image():
         return success_response({
             'message': 'Image generated successfully',
             'result': result,
-            'image_info': image.to_dict()
+            # 与 Image.to_dict() 的字段一致
+            'image_info': {**record, 'id': image_id, 'created_at': record['created_at'].isoformat()}
         })
 
     except Exception as e:
@@ -177,29 +183,49 @@ def list_images():
     try:
         logger.info("Starting image list request")
         
+        # 传入 cursor 参数（首页为空字符串）时使用游标分页，否则兼容原来的页码分页
+        cursor = request.args.get('cursor')
         page = int(request.args.get('page', 1))
         page_size = int(request.args.get('page_size', 20))
+        workflow_id = request.args.get('workflow_id', type=int)
+        start_at, end_at = parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+        count_mode = request.args.get('count', 'none' if cursor is not None else 'exact')
         
-        logger.info(f"Pagination parameters - page: {page}, page_size: {page_size}")
+        logger.info(f"Pagination parameters - page: {page}, page_size: {page_size}, cursor: {cursor}")
         
-        if page < 1 or page_size < 1:
-            logger.warning(f"Invalid pagination parameters: page={page}, page_size={page_size}")
+        if page < 1 or page_size < 1 or page_size > 100 or count_mode not in ('exact', 'approx', 'none'):
+            logger.warning(f"Invalid pagination parameters: page={page}, page_size={page_size}, count={count_mode}")
             return error_response('Invalid pagination parameters')
         
         # Query images from database instead of filesystem
-        pagination = Image.query.order_by(Image.created_at.desc()).paginate(
-            page=page, per_page=page_size, error_out=False
-        )
+        query = Image.query
+        if workflow_id:
+            query = query.filter(Image.workflow_id == workflow_id)
+        if start_at:
+            query = query.filter(Image.created_at >= start_at)
+        if end_at:
+            query = query.filter(Image.created_at < end_at)
+        
+        order_columns = [Image.created_at, Image.id]
+        total = count_rows(query, count_mode)
+        if cursor is not None:
+            items, next_cursor = keyset_paginate(query, order_columns, cursor, page_size)
+        else:
+            rows = query.order_by(Image.created_at.desc(), Image.id.desc()) \
+                .offset((page - 1) * page_size).limit(page_size + 1).all()
+            items = rows[:page_size]
+            next_cursor = encode_cursor(items[-1], order_columns) if len(rows) > page_size else None
         
-        logger.info(f"Found {pagination.total} total images, returning page {page} of {pagination.pages}")
+        logger.info(f"Returning {len(items)} images, total: {total}")
         
         # Convert file paths to browsable URLs and remove prompt fields
         images = []
-        for img in pagination.items:
+        for img in items:
             filename = os.path.basename(img.file_path)
             images.append({
                 'id': img.id,
                 'url': f'/images/output/{filename}',
+                'thumbnail_url': f'/images/output/{filename}?w={THUMBNAIL_WIDTH}&fmt=webp',
                 'created_at': img.created_at.isoformat(),
                 'variables': img.variables
             })
@@ -207,13 +233,18 @@ def list_images():
         return success_response({
             'images': images,
             'pagination': {
-                'current_page': page,
+                'current_page': page if cursor is None else None,
                 'page_size': page_size,
-                'total_images': pagination.total,
-                'total_pages': pagination.pages
+                'total_images': total,
+                'total_pages': -(-total // page_size) if total is not None else None,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
             }
         })
 
+    except InvalidCursor as e:
+        logger.warning(str(e))
+        return error_response(str(e))
     except ValueError:
         logger.warning("Invalid pagination parameters format")
         return error_response('Invalid pagination parameters')
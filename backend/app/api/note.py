@@ -57,7 +57,7 @@ def upload_note():
             logger.info(f"Validated image path: {file_path}")
 
         # 使用数据库中的cookie初始化上传器
-        uploader = XhsUploader(user.cookie)
+        uploader = XhsUploader(user.cookie, account=user.id)
         formatted_topics = []
         desc_append_topics = []
         for topic in topics:
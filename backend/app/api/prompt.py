@@ -1,11 +1,8 @@
-from flask import Blueprint, request
+from flask import Blueprint, request, Response, stream_with_context
 from app.utils.response import success_response, error_response
-import openai
 import json
 import os
 from conf import (
-    OPENAI_API_KEY, 
-    OPENAI_API_BASE, 
     BASE_PATH, 
     OPENAI_ENHANCE_MODEL,
     OPENAI_CAPTION_MODEL,
@@ -13,9 +10,34 @@ from conf import (
     PROMPT_CAPTION_SYSTEM_MESSAGE,
 )
 from app.utils.logger import logger
+from llm.gateway import llm_gateway
 
 bp = Blueprint('prompt', __name__, url_prefix='/api')
 
+def _enhance_messages(prompt):
+    return [
+        {"role": "system", "content": PROMPT_ENHANCE_SYSTEM_MESSAGE},
+        {"role": "user", "content": f"original image prompt：{prompt}"}
+    ]
+
+def _caption_messages(prompt):
+    return [
+        {"role": "system", "content": PROMPT_CAPTION_SYSTEM_MESSAGE},
+        {"role": "user", "content": f"请根据以下描述生成小红书文案，记住必须返回JSON格式：{prompt}"}
+    ]
+
+def _sse(data, event=None):
+    """格式化一条 Server-Sent Events 消息"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @bp.route('/enhance-prompt', methods=['POST'])
 def enhance_prompt():
     try:
@@ -28,21 +50,13 @@ def enhance_prompt():
 
         logger.info(f"Processing prompt: {prompt[:100]}...")
         
-        system_message = PROMPT_ENHANCE_SYSTEM_MESSAGE
-        
-        client = openai.OpenAI(
-            api_key=OPENAI_API_KEY,
-            base_url=OPENAI_API_BASE
-        )
-        
         logger.info(f"Sending request to OpenAI API using model: {OPENAI_ENHANCE_MODEL}")
-        response = client.chat.completions.create(
+        response = llm_gateway.chat_completion(
+            'enhance_prompt',
             model=OPENAI_ENHANCE_MODEL,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"original image prompt：{prompt}"}
-            ],
-            temperature=0.65
+            messages=_enhance_messages(prompt),
+            temperature=0.65,
+            cache=not request.json.get('no_cache', False)
         )
         
         content = response.choices[0].message.content.strip()
@@ -65,22 +79,14 @@ def generate_caption():
 
         logger.info(f"Processing prompt for caption: {prompt[:100]}...")
         
-        system_message = PROMPT_CAPTION_SYSTEM_MESSAGE
-        
-        client = openai.OpenAI(
-            api_key=OPENAI_API_KEY,
-            base_url=OPENAI_API_BASE
-        )
-        
         logger.info(f"Sending request to OpenAI API using model: {OPENAI_CAPTION_MODEL}")
-        response = client.chat.completions.create(
+        response = llm_gateway.chat_completion(
+            'generate_caption',
             model=OPENAI_CAPTION_MODEL,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"请根据以下描述生成小红书文案，记住必须返回JSON格式：{prompt}"}
-            ],
+            messages=_caption_messages(prompt),
             temperature=0.85,
-            response_format={ "type": "json_object" }
+            response_format={ "type": "json_object" },
+            cache=not request.json.get('no_cache', False)
         )
         
         content = json.loads(response.choices[0].message.content.strip())
@@ -92,4 +98,81 @@ def generate_caption():
         return error_response(f'Invalid response format from OpenAI: {str(e)}', 500)
     except Exception as e:
         logger.exception("Error during caption generation")
-        return error_response('Caption generation failed', 500)
\ No newline at end of file
+        return error_response('Caption generation failed', 500)
+
+@bp.route('/enhance-prompt/stream', methods=['POST'])
+def enhance_prompt_stream():
+    """
+    流式增强提示词，以 SSE 格式逐段返回：
+    data: {"delta": "..."} ... event: done / data: {"prompt": "..."}
+    请求中传 no_cache=true 可跳过响应缓存
+    """
+    data = request.json or {}
+    prompt = data.get('prompt')
+    use_cache = not data.get('no_cache', False)
+    if not prompt:
+        logger.warning("Missing prompt in request")
+        return error_response('Missing required field: prompt')
+
+    logger.info(f"Streaming prompt enhancement using model: {OPENAI_ENHANCE_MODEL}")
+
+    def events():
+        parts = []
+        try:
+            for delta in llm_gateway.stream_chat_completion(
+                'enhance_prompt_stream',
+                model=OPENAI_ENHANCE_MODEL,
+                messages=_enhance_messages(prompt),
+                temperature=0.65,
+                cache=use_cache
+            ):
+                parts.append(delta)
+                yield _sse({'delta': delta})
+            yield _sse({'prompt': ''.join(parts).strip()}, event='done')
+            logger.info("Successfully streamed enhanced prompt")
+        except Exception as e:
+            logger.exception("Error during streaming prompt enhancement")
+            yield _sse({'message': 'Prompt enhancement failed'}, event='error')
+
+    return _sse_response(events())
+
+@bp.route('/generate-caption/stream', methods=['POST'])
+def generate_caption_stream():
+    """
+    流式生成文案，逐段返回模型输出，结束时校验完整 JSON 后通过 done 事件返回解析结果
+    """
+    data = request.json or {}
+    prompt = data.get('prompt')
+    use_cache = not data.get('no_cache', False)
+    if not prompt:
+        logger.warning("Missing prompt in request")
+        return error_response('Missing required field: prompt')
+
+    logger.info(f"Streaming caption generation using model: {OPENAI_CAPTION_MODEL}")
+
+    def events():
+        parts = []
+        try:
+            for delta in llm_gateway.stream_chat_completion(
+                'generate_caption_stream',
+                model=OPENAI_CAPTION_MODEL,
+                messages=_caption_messages(prompt),
+                temperature=0.85,
+                response_format={ "type": "json_object" },
+                cache=use_cache
+            ):
+                parts.append(delta)
+                yield _sse({'delta': delta})
+            content = json.loads(''.join(parts).strip())
+            if not isinstance(content, dict):
+                raise json.JSONDecodeError("Caption must be a JSON object", ''.join(parts), 0)
+            yield _sse(content, event='done')
+            logger.info("Successfully streamed caption")
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse streamed OpenAI response as JSON: {str(e)}")
+            yield _sse({'message': f'Invalid response format from OpenAI: {str(e)}'}, event='error')
+        except Exception as e:
+            logger.exception("Error during streaming caption generation")
+            yield _sse({'message': 'Caption generation failed'}, event='error')
+
+    return _sse_response(events())
@@ -1,26 +1,95 @@
-from flask import Blueprint, send_from_directory
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from flask import Blueprint, send_file, request
+from werkzeug.security import safe_join
 from app.utils.response import error_response
-from conf import UPLOAD_FOLDER, OUTPUT_FOLDER
+from conf import UPLOAD_FOLDER, OUTPUT_FOLDER, IMAGE_CACHE_MAX_AGE
 from app.utils.logger import logger
+from app.renditions import renditions, FORMATS
 
 bp = Blueprint('static', __name__)
 
+# 文件内容哈希缓存，键为 (路径, 大小, 修改时间)，文件变化后自动失效
+_ETAG_CACHE_SIZE = 4096
+_etag_cache = OrderedDict()
+_etag_lock = threading.Lock()
+
+def content_etag(path):
+    """以文件内容的 sha256 作为强 ETag"""
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _etag_lock:
+        etag = _etag_cache.get(key)
+        if etag is not None:
+            _etag_cache.move_to_end(key)
+            return etag
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()[:32]
+    
+    with _etag_lock:
+        _etag_cache[key] = etag
+        while len(_etag_cache) > _ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    return etag
+
+def send_immutable(path, mimetype=None):
+    """
+    发送写入后不再变化的图片
+    
+    带强 ETag、Last-Modified 和 immutable 的 Cache-Control，支持 If-None-Match / If-Modified-Since
+    条件请求（返回 304）及 Range 请求（返回 206）。
+    """
+    response = send_file(path, mimetype=mimetype, etag=content_etag(path), conditional=True,
+                         max_age=IMAGE_CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.accept_ranges = 'bytes'
+    return response
+
+def serve_rendition(folder, filename):
+    """按 w（宽度）和 fmt（格式）参数返回缩略图，首次请求时生成并缓存"""
+    try:
+        width, fmt = renditions.normalize(request.args.get('w'), request.args.get('fmt'))
+    except ValueError as e:
+        return error_response(str(e), 400)
+    
+    source_path = safe_join(folder, filename)
+    if source_path is None or not os.path.isfile(source_path):
+        return error_response('Image not found', 404)
+    
+    rendition_path = renditions.get(source_path, width, fmt)
+    return send_immutable(rendition_path, mimetype=FORMATS[fmt][1])
+
 @bp.route('/images/<path:filename>')
 def serve_image(filename):
     try:
-        logger.info(f"Serving image request: {filename}")
+        logger.debug(f"Serving image request: {filename}")
         
         if filename.startswith('upload/'):
+            folder = UPLOAD_FOLDER
             actual_filename = filename.replace('upload/', '', 1)
-            logger.info(f"Serving upload image: {actual_filename}")
-            return send_from_directory(UPLOAD_FOLDER, actual_filename)
         elif filename.startswith('output/'):
+            folder = OUTPUT_FOLDER
             actual_filename = filename.replace('output/', '', 1)
-            logger.info(f"Serving output image: {actual_filename}")
-            return send_from_directory(OUTPUT_FOLDER, actual_filename)
         else:
             logger.warning(f"Invalid image path requested: {filename}")
             return error_response('Invalid image path', 400)
+        
+        if 'w' in request.args or 'fmt' in request.args:
+            logger.debug(f"Serving rendition of {filename}: {dict(request.args)}")
+            return serve_rendition(folder, actual_filename)
+        
+        path = safe_join(folder, actual_filename)
+        if path is None or not os.path.isfile(path):
+            logger.warning(f"Image not found: {filename}")
+            return error_response('Image not found', 404)
+        return send_immutable(path)
     except Exception as e:
         logger.exception(f"Error serving image: {filename}")
         return error_response('Image not found', 404) 
\ No newline at end of file
@@ -22,8 +22,7 @@ def translate_text():
             logger.warning("Missing text in translation request")
             return error_response('Missing required field: text')
 
-        logger.info("Initializing TencentTranslator")
-        translator = TencentTranslator()
+        translator = TencentTranslator.get_instance()
         
         logger.info("Sending translation request")
         translated_text = translator.translate(text, source_lang, target_lang)
@@ -36,4 +35,35 @@ def translate_text():
 
     except Exception as e:
         logger.exception("Error during translation")
-        return error_response('Translation failed', 500) 
\ No newline at end of file
+        return error_response('Translation failed', 500)
+
+@bp.route('/translate/batch', methods=['POST'])
+def translate_batch():
+    try:
+        logger.info("Starting batch translation request")
+        
+        data = request.json
+        texts = data.get('texts')
+        source_lang = data.get('source_lang', 'en')
+        target_lang = data.get('target_lang', 'zh')
+        
+        if not texts or not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            logger.warning("Missing or invalid texts in batch translation request")
+            return error_response('Missing required field: texts (array of strings)')
+
+        logger.info(f"Batch translation request - {len(texts)} texts from {source_lang} to {target_lang}")
+        
+        translator = TencentTranslator.get_instance()
+        translated_texts = translator.translate_batch(texts, source_lang, target_lang)
+        logger.info("Batch translation completed successfully")
+
+        return success_response({
+            'translations': [{
+                'original_text': text,
+                'translated_text': translated
+            } for text, translated in zip(texts, translated_texts)]
+        })
+
+    except Exception as e:
+        logger.exception("Error during batch translation")
+        return error_response('Translation failed', 500)
@@ -9,11 +9,17 @@ from app.utils.response import success_response, error_response
 from app.models.workflow_variable import WorkflowVariable
 from app.models.workflow import Workflow
 import hashlib
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from app.utils.logger import logger
+from conf import WORKFLOW_IMPORT_WORKERS, WORKFLOW_IMPORT_MAX_FILES
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, with_expression
 
-from app.utils.util import get_json_value_with_type
+from app.utils.util import get_json_value_by_keys
+from app.definition_index import definition_index
+from app.utils.pagination import keyset_paginate, encode_cursor, count_rows, parse_date_range
 
 bp = Blueprint('workflow', __name__, url_prefix='/api/workflow')
 
@@ -78,43 +84,122 @@ def validate_workflow_json(workflow_data):
     
     return True, ""
 
-def parse_workflow_variables(workflow_json: dict, db: Session, workflow_id: int):
-    """解析工作流变量并保存到数据库"""
+def match_node_variables(node_id: str, node_data: dict, definitions: dict) -> list:
+    """按变量定义索引找出单个节点的变量，返回待插入的 WorkflowVariable 字段（不含 workflow_id）"""
+    class_type = node_data.get("class_type")
+    if not class_type:
+        return []
+    
+    rows = []
+    for definition in definitions.get(class_type, []):
+        if definition.param_type == 'input':
+            # 对于输入类型，需要验证value_path和value_type
+            value, actual_type = get_json_value_by_keys(node_data, definition.value_keys)
+            if value is None or actual_type != definition.value_type:
+                logger.debug(f"Skip input variable definition: path={definition.value_path}, "
+                             f"expected_type={definition.value_type}, actual_type={actual_type}")
+                continue
+        # 对于输出类型，直接创建变量记录
+        logger.debug(f"创建变量记录: node_id={node_id}, class_type={class_type}, "
+                     f"value_path={definition.value_path}, param_type={definition.param_type}")
+        rows.append({
+            'node_id': node_id,
+            'class_type_id': definition.id,
+            'title': node_data['_meta']['title']
+        })
+    return rows
+
+def parse_workflow_variables(workflow_json: dict, db: Session, workflow_id: int) -> int:
+    """解析工作流变量并批量保存到数据库，返回创建的变量数"""
+    definitions = definition_index.snapshot()
+    rows = []
     for node_id, node_data in workflow_json.items():
-        class_type = node_data.get("class_type")
-        if not class_type:
-            continue
-            
-        # 检查是否已存在该类型的定义
-        definitions = VariableDefinitions.query.filter_by(class_type=class_type).all()
-        for definition in definitions:
-            should_create_variable = False
-            
-            if definition.param_type == 'input':
-                # 对于输入类型，需要验证value_path和value_type
-                value, actual_type = get_json_value_with_type(node_data, definition.value_path)
-                if value is not None and actual_type == definition.value_type.lower():
-                    should_create_variable = True
-                else:
-                    logger.debug(f"Skip input variable definition: path={definition.value_path}, "
-                               f"expected_type={definition.value_type}, actual_type={actual_type}")
-            else:
-                # 对于输出类型，直接创建变量记录
-                should_create_variable = True
-            
-            if should_create_variable:
-                variable = WorkflowVariable(
-                    workflow_id=workflow_id,
-                    node_id=node_id,
-                    class_type_id=definition.id,
-                    title=node_data['_meta']['title']
-                )
-                logger.info(f"创建变量记录: workflow_id={workflow_id}, node_id={node_id}, "
-                          f"class_type={class_type}, value_path={definition.value_path}, "
-                          f"param_type={definition.param_type}")
-                db.session.add(variable)
+        for row in match_node_variables(node_id, node_data, definitions):
+            row['workflow_id'] = workflow_id
+            rows.append(row)
+    
+    if rows:
+        db.session.execute(insert(WorkflowVariable), rows)
+    logger.info(f"创建变量记录: workflow_id={workflow_id}, {len(rows)} 个变量")
     
     db.session.commit()
+    return len(rows)
+
+def load_workflow_json(file_path: str) -> Optional[dict]:
+    """读取已保存的工作流文件，文件缺失或损坏时返回 None"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to load workflow file {file_path}: {str(e)}")
+        return None
+
+def sync_workflow_variables(workflow: Workflow, old_json: Optional[dict], new_json: dict) -> dict:
+    """
+    按节点对比新旧工作流，只重新计算新增、修改和删除的节点的变量（不提交事务）
+    
+    未变化节点的变量不做任何处理；变化节点中仍然匹配的变量保留原 ID，只更新标题，
+    因此 input_vars / output_vars 中引用的变量 ID 保持有效，被删除的变量会从中移除。
+    old_json 为 None（旧文件缺失）时对所有节点做同样的比对。
+    
+    Returns:
+        dict: 节点和变量的变化统计
+    """
+    if old_json is None:
+        changed_nodes = new_json
+        removed_nodes = set()
+    else:
+        changed_nodes = {node_id: node_data for node_id, node_data in new_json.items()
+                         if old_json.get(node_id) != node_data}
+        removed_nodes = set(old_json) - set(new_json)
+    stats = {
+        'unchanged_nodes': len(new_json) - len(changed_nodes),
+        'changed_nodes': len(changed_nodes),
+        'removed_nodes': len(removed_nodes),
+        'kept': 0, 'added': 0, 'deleted': 0
+    }
+    
+    query = WorkflowVariable.query.filter(WorkflowVariable.workflow_id == workflow.id)
+    if old_json is not None:
+        affected = set(changed_nodes) | removed_nodes
+        if not affected:
+            return stats
+        query = query.filter(WorkflowVariable.node_id.in_(affected))
+    
+    definitions = definition_index.snapshot()
+    desired = {}
+    for node_id, node_data in changed_nodes.items():
+        for row in match_node_variables(node_id, node_data, definitions):
+            desired[(node_id, row['class_type_id'])] = row
+    
+    deleted_ids = set()
+    for variable in query.all():
+        row = desired.pop((variable.node_id, variable.class_type_id), None)
+        if row is None:
+            deleted_ids.add(variable.id)
+            db.session.delete(variable)
+            continue
+        if variable.title != row['title']:
+            variable.title = row['title']
+        stats['kept'] += 1
+    
+    if desired:
+        db.session.execute(insert(WorkflowVariable), [
+            {**row, 'workflow_id': workflow.id} for row in desired.values()
+        ])
+    stats['added'] = len(desired)
+    stats['deleted'] = len(deleted_ids)
+    
+    # 已选择的输入输出变量中去掉被删除的变量
+    if deleted_ids:
+        for field in ('input_vars', 'output_vars'):
+            selected = json.loads(getattr(workflow, field)) if getattr(workflow, field) else []
+            remaining = [var_id for var_id in selected if var_id not in deleted_ids]
+            if len(remaining) != len(selected):
+                setattr(workflow, field, json.dumps(remaining))
+    
+    logger.info(f"Synced variables for workflow {workflow.id}: {stats}")
+    return stats
 
 @bp.route('/upload', methods=['POST'])
 def upload_workflow():
@@ -161,19 +246,19 @@ def upload_workflow():
                 if not is_valid:
                     raise ValueError(f"Invalid workflow format: {error_message}")
                 
+                # 读取旧版本，用于按节点对比变化
+                old_workflow_data = load_workflow_json(existing_workflow.file_path)
+                
                 # 生成新的存储文件名
                 timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
-                safe_filename = secure_filename(file.filename)
-                storage_filename = f"{os.path.splitext(safe_filename)[0]}_{timestamp}.json"
-                file_path = os.path.join(UPLOAD_FOLDER, storage_filename).replace('\\', '/')
+                storage_filename, file_path = storage_path_for(file.filename, timestamp)
                 
                 # 保存新文件
                 file.seek(0)
                 file.save(file_path)
                 
-                # 删除旧文件
-                if os.path.exists(existing_workflow.file_path):
-                    os.remove(existing_workflow.file_path)
+                # 旧文件在提交成功后再删除，失败时记录仍指向它
+                old_file_path = existing_workflow.file_path
                 
                 # 更新工作流记录
                 existing_workflow.name = storage_filename
@@ -182,14 +267,16 @@ def upload_workflow():
                 existing_workflow.content_md5 = content_md5
                 existing_workflow.updated_at = datetime.now(timezone.utc)
                 
-                # 删除旧的变量记录
-                WorkflowVariable.query.filter_by(workflow_id=existing_workflow.id).delete()
-                
-                # 重新解析并保存工作流变量
-                parse_workflow_variables(workflow_data, db, existing_workflow.id)
+                # 只重新计算变化节点的变量，未变化的变量保留原 ID
+                changes = sync_workflow_variables(existing_workflow, old_workflow_data, workflow_data)
                 
                 db.session.commit()
                 
+                # 删除旧文件
+                if old_file_path != file_path and os.path.exists(old_file_path):
+                    os.remove(old_file_path)
+                
+                variables_count = WorkflowVariable.query.filter_by(workflow_id=existing_workflow.id).count()
                 logger.info(f"Successfully updated workflow: {existing_workflow.id}")
                 return success_response(
                     message='Workflow updated successfully',
@@ -199,12 +286,14 @@ def upload_workflow():
                         'name': existing_workflow.name,
                         'file_size': existing_workflow.file_size,
                         'created_at': existing_workflow.created_at.isoformat(),
-                        'variables_count': len(workflow_data)
+                        'variables_count': variables_count,
+                        'changes': changes
                     }
                 )
                 
             except Exception as e:
                 logger.exception("Error while updating workflow")
+                db.session.rollback()
                 if 'file_path' in locals() and os.path.exists(file_path):
                     os.remove(file_path)
                 return error_response(f"An error occurred while updating workflow: {str(e)}")
@@ -249,7 +338,7 @@ def upload_workflow():
             db.session.flush()
             
             # 解析并保存工作流变量
-            parse_workflow_variables(workflow_data, db, workflow.id)
+            variables_count = parse_workflow_variables(workflow_data, db, workflow.id)
             
             db.session.commit()
             
@@ -262,7 +351,7 @@ def upload_workflow():
                     'name': workflow.name,
                     'file_size': workflow.file_size,
                     'created_at': workflow.created_at.isoformat(),
-                    'variables_count': len(workflow_data)
+                    'variables_count': variables_count
                 }
             )
             
@@ -283,6 +372,192 @@ def upload_workflow():
             os.remove(file_path)
         return error_response(f"An unexpected error occurred: {str(e)}")
 
+def prepare_workflow_file(item: tuple) -> dict:
+    """
+    在子进程中解析、校验并计算单个工作流文件的 MD5
+
+    Args:
+        item: (原始文件名, 文件内容)，超过大小限制的文件内容为 None
+
+    Returns:
+        dict: 成功时包含 data，失败时包含 error
+    """
+    filename, content = item
+    if content is None or len(content) > MAX_CONTENT_LENGTH:
+        return {'filename': filename, 'content_md5': None,
+                'error': f'File size exceeds {MAX_CONTENT_LENGTH/1024}KB limit'}
+    result = {'filename': filename, 'size': len(content), 'content_md5': hashlib.md5(content).hexdigest()}
+    try:
+        workflow_data = json.loads(content.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        result['error'] = 'Invalid JSON format'
+        return result
+    is_valid, error_message = validate_workflow_json(workflow_data)
+    if not is_valid:
+        result['error'] = f'Invalid workflow format: {error_message}'
+        return result
+    result['data'] = workflow_data
+    return result
+
+def read_import_files() -> list:
+    """从请求中读取待导入的工作流：zip 压缩包（archive 字段）或多个 JSON 文件（files 字段）"""
+    items = []
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        with zipfile.ZipFile(archive.stream) as zf:
+            for info in zf.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or info.filename.startswith('__MACOSX/') or not allowed_file(name):
+                    continue
+                # 超限的文件不解压，由校验步骤报告
+                items.append((name, zf.read(info) if info.file_size <= MAX_CONTENT_LENGTH else None))
+    for file in request.files.getlist('files'):
+        if file.filename and allowed_file(file.filename):
+            items.append((file.filename, file.read()))
+    return items
+
+def storage_path_for(original_name: str, timestamp: str) -> tuple:
+    """生成不与已有文件冲突的存储文件名和路径"""
+    base = os.path.splitext(secure_filename(original_name))[0]
+    storage_filename = f"{base}_{timestamp}.json"
+    counter = 1
+    while os.path.exists(os.path.join(UPLOAD_FOLDER, storage_filename)):
+        storage_filename = f"{base}_{timestamp}_{counter}.json"
+        counter += 1
+    return storage_filename, os.path.join(UPLOAD_FOLDER, storage_filename).replace('\\', '/')
+
+@bp.route('/import', methods=['POST'])
+def import_workflows():
+    """
+    批量导入工作流
+
+    文件在进程池中并行解析、校验和计算 MD5，按 content_md5 去重后，
+    所有工作流及其变量在一个事务中提交，返回每个文件的处理结果。
+    同名工作流按上传接口的规则更新。
+    """
+    written_files = []
+    try:
+        logger.info("Starting bulk workflow import")
+        items = read_import_files()
+        if not items:
+            return error_response('No workflow files found. Upload a zip archive as "archive" or JSON files as "files"')
+        if len(items) > WORKFLOW_IMPORT_MAX_FILES:
+            return error_response(f'Too many files: {len(items)}, limit is {WORKFLOW_IMPORT_MAX_FILES}')
+        logger.info(f"Validating {len(items)} workflow files")
+
+        if WORKFLOW_IMPORT_WORKERS > 1 and len(items) > 1:
+            with ProcessPoolExecutor(max_workers=min(WORKFLOW_IMPORT_WORKERS, len(items))) as executor:
+                prepared = list(executor.map(prepare_workflow_file, items, chunksize=8))
+        else:
+            prepared = [prepare_workflow_file(item) for item in items]
+
+        # 与已有工作流按 MD5 和文件名比对，只需两次查询
+        md5s = [item['content_md5'] for item in prepared if item['content_md5']]
+        names = [item['filename'] for item in prepared]
+        existing_by_md5 = dict(db.session.query(Workflow.content_md5, Workflow.id)
+                               .filter(Workflow.content_md5.in_(md5s)).all())
+        existing_by_name = {workflow.original_name: workflow
+                            for workflow in Workflow.query.filter(Workflow.original_name.in_(names)).all()}
+
+        definitions = definition_index.snapshot()
+        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
+        now = datetime.now(timezone.utc)
+        report = []
+        pending = []  # 新建的工作流：(报告项, 工作流记录, 工作流数据)
+        seen_md5, seen_names = {}, set()
+        for (_, content), item in zip(items, prepared):
+            entry = {'filename': item['filename'], 'content_md5': item['content_md5']}
+            report.append(entry)
+            if 'error' in item:
+                entry.update(status='invalid', message=item['error'])
+                continue
+            if item['content_md5'] in existing_by_md5:
+                entry.update(status='duplicate', id=existing_by_md5[item['content_md5']],
+                             message='Identical workflow already exists')
+                continue
+            if item['content_md5'] in seen_md5:
+                entry.update(status='duplicate', message=f"Same content as {seen_md5[item['content_md5']]}")
+                continue
+            if item['filename'] in seen_names:
+                entry.update(status='invalid', message='Duplicate file name in this import')
+                continue
+            seen_md5[item['content_md5']] = item['filename']
+            seen_names.add(item['filename'])
+
+            storage_filename, file_path = storage_path_for(item['filename'], timestamp)
+            with open(file_path, 'wb') as f:
+                f.write(content)
+            written_files.append(file_path)
+
+            workflow = existing_by_name.get(item['filename'])
+            if workflow:
+                entry['status'] = 'updated'
+                entry['replaced_file'] = workflow.file_path
+                # 同名工作流按节点对比更新，保留未变化变量的 ID
+                entry['changes'] = sync_workflow_variables(workflow, load_workflow_json(workflow.file_path),
+                                                           item['data'])
+                workflow.name = storage_filename
+                workflow.file_path = file_path
+                workflow.file_size = item['size']
+                workflow.content_md5 = item['content_md5']
+                workflow.updated_at = now
+                entry['id'] = workflow.id
+            else:
+                entry['status'] = 'created'
+                pending.append((entry, {
+                    'original_name': item['filename'],
+                    'name': storage_filename,
+                    'file_path': file_path,
+                    'file_size': item['size'],
+                    'content_md5': item['content_md5'],
+                    'status': True,
+                    'created_at': now,
+                    'updated_at': now
+                }, item['data']))
+
+        # 新工作流一次性插入，按唯一的 content_md5 取回 ID，再一次性插入全部变量
+        new_ids = dict(db.session.execute(
+            insert(Workflow).returning(Workflow.content_md5, Workflow.id), [workflow for _, workflow, _ in pending]
+        ).all()) if pending else {}
+        rows = []
+        for entry, workflow, workflow_data in pending:
+            workflow_id = new_ids[workflow['content_md5']]
+            variables = []
+            for node_id, node_data in workflow_data.items():
+                variables.extend(match_node_variables(node_id, node_data, definitions))
+            for row in variables:
+                row['workflow_id'] = workflow_id
+            rows.extend(variables)
+            entry.update(id=workflow_id, variables_count=len(variables))
+        if rows:
+            db.session.execute(insert(WorkflowVariable), rows)
+        db.session.commit()
+
+        # 提交成功后再删除被替换的旧文件
+        for entry in report:
+            old_path = entry.pop('replaced_file', None)
+            if old_path and os.path.exists(old_path):
+                os.remove(old_path)
+
+        summary = {status: sum(1 for entry in report if entry['status'] == status)
+                   for status in ('created', 'updated', 'duplicate', 'invalid')}
+        logger.info(f"Bulk workflow import finished: {summary}")
+        return success_response(
+            message='Workflows imported successfully',
+            data={'summary': summary, 'files': report}
+        )
+
+    except zipfile.BadZipFile:
+        logger.warning("Invalid zip archive in workflow import")
+        return error_response('Invalid zip archive')
+    except Exception as e:
+        logger.exception("Unexpected error during bulk workflow import")
+        db.session.rollback()
+        for file_path in written_files:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        return error_response(f"An unexpected error occurred: {str(e)}")
+
 @bp.route('/list', methods=['GET'])
 def list_workflows():
     try:
@@ -291,23 +566,41 @@ def list_workflows():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         search = request.args.get('search', '')
+        # 传入 cursor 参数（首页为空字符串）时使用游标分页，否则使用页码分页
+        cursor = request.args.get('cursor')
+        start_at, end_at = parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+        count_mode = request.args.get('count', 'none' if cursor is not None else 'exact')
         
-        logger.info(f"List params - page: {page}, per_page: {per_page}, search: {search}")
+        logger.info(f"List params - page: {page}, per_page: {per_page}, search: {search}, cursor: {cursor}")
         
         if per_page > 100:
             logger.warning(f"Requested per_page ({per_page}) exceeds limit, setting to 100")
             per_page = 100
+        if page < 1 or per_page < 1 or count_mode not in ('exact', 'approx', 'none'):
+            return error_response('Invalid pagination parameters')
             
         query = Workflow.query
         
         if search:
             query = query.filter(Workflow.original_name.ilike(f'%{search}%'))
             logger.info(f"Applying search filter: {search}")
+        if start_at:
+            query = query.filter(Workflow.created_at >= start_at)
+        if end_at:
+            query = query.filter(Workflow.created_at < end_at)
             
-        query = query.order_by(Workflow.status.desc(), Workflow.created_at.desc())
-        
-        pagination = query.paginate(page=page, per_page=per_page)
-        logger.info(f"Found {pagination.total} total workflows")
+        order_columns = [Workflow.status, Workflow.created_at, Workflow.id]
+        total = count_rows(query, count_mode)
+        # 变量数量作为子查询列一起查出，整页只需一条 SQL
+        query = query.options(with_expression(Workflow.variables_count, Workflow.variables_count_expression()))
+        if cursor is not None:
+            items, next_cursor = keyset_paginate(query, order_columns, cursor, per_page)
+        else:
+            rows = query.order_by(*[column.desc() for column in order_columns]) \
+                .offset((page - 1) * per_page).limit(per_page + 1).all()
+            items = rows[:per_page]
+            next_cursor = encode_cursor(items[-1], order_columns) if len(rows) > per_page else None
+        logger.info(f"Found {total} total workflows")
         
         workflows = [{
             'id': workflow.id,
@@ -316,11 +609,11 @@ def list_workflows():
             'status': workflow.status,
             'created_at': workflow.created_at.isoformat(),
             'updated_at': workflow.updated_at.isoformat(),
-            'variables_count': len(workflow.variables),
+            'variables_count': workflow.variables_count or 0,
             'input_vars': json.loads(workflow.input_vars) if workflow.input_vars else [],
             'output_vars': json.loads(workflow.output_vars) if workflow.output_vars else [],
             'preview_image': workflow.preview_image
-        } for workflow in pagination.items]
+        } for workflow in items]
         
         logger.info(f"Successfully retrieved {len(workflows)} workflows")
         return success_response(
@@ -328,16 +621,20 @@ def list_workflows():
             data={
                 'workflows': workflows,
                 'pagination': {
-                    'total': pagination.total,
-                    'pages': pagination.pages,
-                    'current_page': page,
+                    'total': total,
+                    'pages': -(-total // per_page) if total is not None else None,
+                    'current_page': page if cursor is None else None,
                     'per_page': per_page,
-                    'has_next': pagination.has_next,
-                    'has_prev': pagination.has_prev
+                    'has_next': next_cursor is not None,
+                    'has_prev': page > 1 if cursor is None else bool(cursor),
+                    'next_cursor': next_cursor
                 }
             }
         )
         
+    except ValueError as e:
+        logger.warning(f"Invalid workflow list parameters: {e}")
+        return error_response(str(e))
     except Exception as e:
         logger.exception("Error while retrieving workflow list")
         return error_response(f"An error occurred while retrieving workflows: {str(e)}")
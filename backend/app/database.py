@@ -0,0 +1,89 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from conf import (
+    DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    SQLITE_BUSY_TIMEOUT_MS, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE_MB,
+    PG_STATEMENT_TIMEOUT_MS, PG_APPLICATION_NAME
+)
+from app.extensions import db
+from app.utils.logger import logger
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.database in (None, '', ':memory:') or 'mode=memory' in str(url)
+
+
+def engine_options(uri: str = DATABASE_URI) -> dict:
+    """
+    根据数据库类型生成 SQLAlchemy engine 参数
+
+    - SQLite: 连接级 busy timeout，连接池（内存数据库除外）
+    - PostgreSQL: 连接前 ping，连接参数中设置语句超时和 application_name
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == 'sqlite':
+        options = {
+            # sqlite3 模块自身的等待锁超时（秒），与 PRAGMA busy_timeout 一致
+            'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False}
+        }
+        if not _is_memory_sqlite(url):
+            options.update({
+                'pool_size': DB_POOL_SIZE,
+                'max_overflow': DB_MAX_OVERFLOW,
+                'pool_timeout': DB_POOL_TIMEOUT
+            })
+        return options
+
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True
+    }
+    if backend == 'postgresql':
+        connect_args = {'application_name': PG_APPLICATION_NAME}
+        if PG_STATEMENT_TIMEOUT_MS:
+            connect_args['options'] = f'-c statement_timeout={PG_STATEMENT_TIMEOUT_MS}'
+        options['connect_args'] = connect_args
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL 下读写互不阻塞，写事务提交时不再需要每次 fsync 整个数据库
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+        cursor.execute(f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}')
+        cursor.execute(f'PRAGMA cache_size={-int(SQLITE_CACHE_SIZE_KB)}')
+        cursor.execute(f'PRAGMA mmap_size={int(SQLITE_MMAP_SIZE_MB) * 1024 * 1024}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+
+def init_database(app, uri: str = DATABASE_URI):
+    """配置数据库连接并初始化 Flask-SQLAlchemy，SQLite 连接建立时设置 PRAGMA"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _set_sqlite_pragmas)
+        logger.info(f"Database engine configured: {engine.dialect.name}, pool: {engine.pool.__class__.__name__}")
+
+
+def pool_status() -> dict:
+    """连接池状态，用于健康检查"""
+    pool = db.engine.pool
+    status = {'dialect': db.engine.dialect.name, 'pool': pool.__class__.__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
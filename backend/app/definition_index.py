@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from conf import DEFINITION_CACHE_TTL
+from app.models.variable_definitions import VariableDefinitions
+from app.utils.logger import logger
+
+# value_keys 为预先拆分好的 value_path，value_type 已转为小写
+CompiledDefinition = namedtuple(
+    'CompiledDefinition', ['id', 'class_type', 'value_path', 'value_keys', 'value_type', 'param_type']
+)
+
+
+class DefinitionIndex:
+    """
+    变量定义的内存索引：class_type -> [CompiledDefinition]
+
+    首次使用时一次性加载整张 variable_definitions 表。本进程内通过 ORM 增删改定义时
+    由 SQLAlchemy 事件立即失效，其他途径（如直接改库）的修改在 ttl 秒后重新加载。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, ttl: float = DEFINITION_CACHE_TTL):
+        self.ttl = ttl
+        self._index = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _load(self) -> dict:
+        index = {}
+        for definition in VariableDefinitions.query.order_by(VariableDefinitions.id).all():
+            index.setdefault(definition.class_type, []).append(CompiledDefinition(
+                id=definition.id,
+                class_type=definition.class_type,
+                value_path=definition.value_path,
+                value_keys=tuple(definition.value_path.split('.')),
+                value_type=definition.value_type.lower(),
+                param_type=definition.param_type
+            ))
+        logger.info(f"Loaded {sum(len(items) for items in index.values())} variable definitions "
+                    f"for {len(index)} class types")
+        return index
+
+    def snapshot(self) -> dict:
+        """返回当前的 class_type 索引，需要在应用上下文中调用"""
+        with self._lock:
+            if self._index is not None and (not self.ttl or time.monotonic() - self._loaded_at < self.ttl):
+                return self._index
+        index = self._load()
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.monotonic()
+        return index
+
+    def get(self, class_type: str) -> list:
+        return self.snapshot().get(class_type, [])
+
+
+# Create a global instance
+definition_index = DefinitionIndex.get_instance()
+
+
+@event.listens_for(VariableDefinitions, 'after_insert')
+@event.listens_for(VariableDefinitions, 'after_update')
+@event.listens_for(VariableDefinitions, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    definition_index.invalidate()
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_on_bulk_change(orm_execute_state):
+    # Query.update() / Query.delete() 等批量操作不会触发上面的实例事件
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and \
+            orm_execute_state.bind_mapper is not None and \
+            orm_execute_state.bind_mapper.class_ is VariableDefinitions:
+        definition_index.invalidate()
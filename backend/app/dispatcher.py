@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from enum import IntEnum
+from conf import COMFYUI_MAX_INFLIGHT, DISPATCH_STARVATION_LIMIT, DISPATCH_MAX_WAIT
+from app.utils.logger import logger
+
+
+class JobPriority(IntEnum):
+    INTERACTIVE = 0  # 前端交互请求，优先执行
+    AGENT = 1  # 托管后台任务
+
+
+class _Job:
+    def __init__(self, priority: JobPriority, fn, args, kwargs):
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class GenerationDispatcher:
+    """
+    ComfyUI 生成任务的优先级调度器
+
+    ComfyUI 自身按 FIFO 执行队列，所以这里限制同时提交给 ComfyUI 的任务数，
+    由本地优先级队列决定下一个执行的任务：交互任务优先，后台任务在交互任务
+    连续执行 starvation_limit 次或等待超过 max_wait 秒后强制获得执行机会。
+    """
+    _instance = None
+
+    def __init__(self, max_inflight: int = COMFYUI_MAX_INFLIGHT,
+                 starvation_limit: int = DISPATCH_STARVATION_LIMIT,
+                 max_wait: float = DISPATCH_MAX_WAIT):
+        self.max_inflight = max(1, max_inflight)
+        self.starvation_limit = max(1, starvation_limit)
+        self.max_wait = max_wait
+        self._queues = {priority: deque() for priority in JobPriority}
+        self._cond = threading.Condition()
+        self._workers = []
+        self._inflight = 0
+        self._interactive_streak = 0
+        self._completed = {priority: 0 for priority in JobPriority}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def _ensure_workers(self):
+        # 首次提交时再启动工作线程
+        while len(self._workers) < self.max_inflight:
+            worker = threading.Thread(
+                target=self._work_loop,
+                name=f'comfyui-dispatch-{len(self._workers)}',
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, priority: JobPriority, fn, *args, **kwargs) -> Future:
+        """提交一个生成任务，返回 Future"""
+        job = _Job(priority, fn, args, kwargs)
+        with self._cond:
+            self._ensure_workers()
+            self._queues[priority].append(job)
+            self._cond.notify()
+        logger.debug(f"Queued {priority.name} generation job, pending: {self._pending_counts()}")
+        return job.future
+
+    def run(self, priority: JobPriority, fn, *args, **kwargs):
+        """提交任务并阻塞等待结果"""
+        return self.submit(priority, fn, *args, **kwargs).result()
+
+    def _pending_counts(self) -> dict:
+        return {priority.name.lower(): len(queue) for priority, queue in self._queues.items()}
+
+    def _pop_next(self):
+        """选择下一个任务，调用方需持有锁"""
+        interactive = self._queues[JobPriority.INTERACTIVE]
+        background = self._queues[JobPriority.AGENT]
+        if not interactive and not background:
+            return None
+
+        if background:
+            oldest_wait = time.monotonic() - background[0].enqueued_at
+            starving = (self._interactive_streak >= self.starvation_limit
+                        or oldest_wait >= self.max_wait)
+            if not interactive or starving:
+                self._interactive_streak = 0
+                return background.popleft()
+            self._interactive_streak += 1
+        else:
+            # 只统计有 agent 任务等待时连续执行的交互任务，否则之后第一个 agent 任务会直接插队
+            self._interactive_streak = 0
+        return interactive.popleft()
+
+    def _work_loop(self):
+        while True:
+            with self._cond:
+                job = self._pop_next()
+                while job is None:
+                    self._cond.wait()
+                    job = self._pop_next()
+                self._inflight += 1
+
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.fn(*job.args, **job.kwargs))
+                except Exception as e:
+                    job.future.set_exception(e)
+
+            with self._cond:
+                self._inflight -= 1
+                self._completed[job.priority] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'inflight': self._inflight,
+                'max_inflight': self.max_inflight,
+                'pending': self._pending_counts(),
+                'completed': {priority.name.lower(): count for priority, count in self._completed.items()}
+            }
+
+
+# Create a global instance
+dispatcher = GenerationDispatcher.get_instance()
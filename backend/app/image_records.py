@@ -0,0 +1,179 @@
+import atexit
+import json
+import os
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from sqlalchemy import insert
+from conf import IMAGE_RECORD_BATCH_SIZE, IMAGE_RECORD_FLUSH_MS, IMAGE_RECORD_JOURNAL
+from app.extensions import db
+from app.models.image import Image
+from app.utils.logger import logger
+
+
+class ImageRecordWriter:
+    """
+    生成图片记录的批量写入器
+
+    add() 把记录放入缓冲区并立即返回 Future（结果为图片 ID），后台线程每 flush_ms 毫秒、
+    或缓冲区达到 batch_size 条时，用一个事务批量插入。记录在进入缓冲区前先追加到日志文件，
+    进程崩溃时尚未入库的记录在下次启动时按 file_path 去重后补写。写入失败的批次已经通过 Future
+    通知调用方，会从日志中移除，不会在下次启动时补写。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, batch_size: int = IMAGE_RECORD_BATCH_SIZE, flush_ms: int = IMAGE_RECORD_FLUSH_MS,
+                 journal_path: str = IMAGE_RECORD_JOURNAL):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_ms) / 1000
+        self.journal_path = journal_path
+        self.app = None
+        self._buffer = []  # [(记录, Future)]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._journal = None
+        self._thread = None
+        self.stats = {'written': 0, 'batches': 0, 'errors': 0, 'recovered': 0}
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def init_app(self, app):
+        self.app = app
+        if self.journal_path:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.recover()
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._flush_loop, name='image-record-writer', daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Image record flush failed: {str(e)}")
+
+    def add(self, filename: str, file_path: str, workflow_id=None, workflow_name=None, variables=None,
+            created_at: datetime = None) -> Future:
+        """加入一条图片记录，返回的 Future 在记录入库后得到图片 ID"""
+        record = {
+            'filename': filename,
+            'file_path': file_path,
+            'workflow_id': workflow_id,
+            'workflow_name': workflow_name,
+            'variables': variables,
+            'created_at': created_at or datetime.utcnow()
+        }
+        future = Future()
+        with self._lock:
+            if self._journal:
+                self._journal.write(self._journal_line(record))
+                self._journal.flush()
+            self._buffer.append((record, future))
+            full = len(self._buffer) >= self.batch_size
+            self._ensure_thread()
+        if full:
+            self._wakeup.set()
+        return future
+
+    def write(self, timeout: float = None, **record) -> int:
+        """加入一条记录并等待入库，返回图片 ID，同一批次内的其他请求一起提交"""
+        return self.add(**record).result(timeout=timeout)
+
+    def flush(self):
+        """立即写入缓冲区中的全部记录"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            try:
+                ids = self._insert([record for record, _ in batch])
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Failed to write {len(batch)} image records: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+                for (_, future), image_id in zip(batch, ids):
+                    future.set_result(image_id)
+            with self._lock:
+                # 本批记录已入库或已向调用方报告失败，日志中只保留缓冲区里尚未写入的记录
+                self._rewrite_journal()
+
+    @staticmethod
+    def _journal_line(record: dict) -> str:
+        return json.dumps({**record, 'created_at': record['created_at'].isoformat()}, ensure_ascii=False) + '\n'
+
+    def _rewrite_journal(self):
+        if not self._journal:
+            return
+        self._journal.truncate(0)
+        for record, _ in self._buffer:
+            self._journal.write(self._journal_line(record))
+        self._journal.flush()
+
+    def _insert(self, records: list) -> list:
+        # 新的应用上下文使用独立的 session，不影响调用方未提交的事务
+        with self.app.app_context():
+            try:
+                # 要求 RETURNING 按参数顺序返回时 SQLite 会退化为逐行插入，这里按 file_path 对应回每条记录
+                rows = db.session.execute(insert(Image).returning(Image.file_path, Image.id), records).all()
+                db.session.commit()
+                ids_by_path = {}
+                for file_path, image_id in sorted(rows, key=lambda row: row[1]):
+                    ids_by_path.setdefault(file_path, []).append(image_id)
+                return [ids_by_path[record['file_path']].pop(0) for record in records]
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def recover(self):
+        """补写上次进程退出前日志中未入库的记录"""
+        if not os.path.exists(self.journal_path):
+            return
+        records = []
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+                record['created_at'] = datetime.fromisoformat(record['created_at'])
+                records.append(record)
+        if records:
+            with self.app.app_context():
+                paths = [record['file_path'] for record in records]
+                existing = {row[0] for row in db.session.query(Image.file_path).filter(Image.file_path.in_(paths))}
+            missing = [record for record in records if record['file_path'] not in existing]
+            if missing:
+                self._insert(missing)
+                self.stats['recovered'] += len(missing)
+                logger.info(f"Recovered {len(missing)} image records from journal")
+        open(self.journal_path, 'w').close()
+
+    def writer_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'buffered': len(self._buffer)}
+
+
+# Create a global instance
+image_records = ImageRecordWriter.get_instance()
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from app.utils.logger import logger
+
+# (版本号, 说明, SQL 语句列表)，只能追加，已发布的迁移不要修改
+# 模型中也声明了同名索引，新建的数据库由 create_all 直接创建，这里的 IF NOT EXISTS 不会重复创建
+MIGRATIONS = [
+    (1, 'add indexes for hot filters and list pagination', [
+        'CREATE INDEX IF NOT EXISTS ix_images_created_at_id ON images (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_images_workflow_id_created_at_id ON images (workflow_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_workflows_status_created_at_id ON workflows (status, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_workflows_original_name ON workflows (original_name)',
+        'CREATE INDEX IF NOT EXISTS ix_workflow_variables_workflow_id ON workflow_variables (workflow_id)',
+        'CREATE INDEX IF NOT EXISTS ix_variable_definitions_class_type ON variable_definitions (class_type)',
+        'CREATE INDEX IF NOT EXISTS ix_agents_status ON agents (status)',
+    ]),
+]
+
+
+def applied_versions(engine) -> set:
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            ' version INTEGER PRIMARY KEY,'
+            ' description VARCHAR(255),'
+            ' applied_at VARCHAR(32) NOT NULL)'
+        ))
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def run_migrations(engine) -> list:
+    """
+    按版本号依次执行尚未执行的迁移，每个迁移在单独的事务中执行
+
+    Returns:
+        list: 本次执行的迁移版本号
+    """
+    applied = applied_versions(engine)
+    executed = []
+    for version, description, statements in sorted(MIGRATIONS, key=lambda migration: migration[0]):
+        if version in applied:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        try:
+            with engine.begin() as conn:
+                for statement in statements:
+                    conn.execute(text(statement))
+                conn.execute(
+                    text('INSERT INTO schema_migrations (version, description, applied_at) '
+                         'VALUES (:version, :description, :applied_at)'),
+                    {'version': version, 'description': description,
+                     'applied_at': datetime.now(timezone.utc).isoformat()}
+                )
+        except IntegrityError:
+            # 多个进程同时启动时，其他进程已经执行了这个迁移
+            logger.info(f"Schema migration {version} was applied by another process")
+            continue
+        executed.append(version)
+    return executed
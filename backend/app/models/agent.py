@@ -29,7 +29,7 @@ class Agent(db.Model):
     prompt_template = db.Column(db.Text)
     image_style = db.Column(db.Text)
     workflow_id = db.Column(db.Integer, db.ForeignKey('workflows.id'), nullable=True)
-    status = db.Column(db.Enum(AgentStatus), default=AgentStatus.PAUSED)
+    status = db.Column(db.Enum(AgentStatus), default=AgentStatus.PAUSED, index=True)
     last_run = db.Column(db.DateTime)
     next_run = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,74 @@
+from enum import Enum
+from datetime import datetime
+from app.extensions import db
+
+class AgentRunStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    FAILED = "failed"
+    SUCCESS = "success"
+
+class AgentRunStage(str, Enum):
+    CREATED = "created"
+    PROMPTS = "prompts"  # 提示词已生成
+    IMAGES = "images"  # 图片已全部生成
+    CAPTION = "caption"  # 文案已生成
+    TOPICS = "topics"  # 话题已解析
+    UPLOADED = "uploaded"  # 图片已上传到小红书
+    PUBLISHED = "published"  # 笔记已发布
+
+class AgentRun(db.Model):
+    """托管任务的一次执行记录，每个阶段的产出都会作为检查点保存，重试时从上次完成的阶段继续"""
+    __tablename__ = 'agent_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    agent_id = db.Column(db.Integer, db.ForeignKey('agents.id'), nullable=True)
+    status = db.Column(db.Enum(AgentRunStatus), default=AgentRunStatus.PENDING, nullable=False)
+    stage = db.Column(db.Enum(AgentRunStage), default=AgentRunStage.CREATED, nullable=False)
+    params = db.Column(db.JSON, nullable=False)  # 本次执行使用的 agent 参数
+
+    # 检查点数据
+    prompts = db.Column(db.JSON)  # [prompt, ...]
+    images = db.Column(db.JSON)  # [{index, prompt, seed, filename, path, image_id}, ...]
+    caption = db.Column(db.JSON)
+    topics = db.Column(db.JSON)  # {'topics': [...], 'desc_topics': [...]}
+    uploaded_files = db.Column(db.JSON)  # [{path, file_id}, ...]
+    note = db.Column(db.JSON)
+
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    next_retry_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    agent = db.relationship('Agent', backref=db.backref('runs', lazy='dynamic'))
+
+    def checkpoint(self, stage: AgentRunStage = None, **fields):
+        """保存阶段产出并立即提交"""
+        for key, value in fields.items():
+            setattr(self, key, value)
+        if stage is not None:
+            self.stage = stage
+        db.session.commit()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'agent_id': self.agent_id,
+            'status': self.status.value if self.status else None,
+            'stage': self.stage.value if self.stage else None,
+            'params': self.params,
+            'prompts': self.prompts,
+            'images': self.images,
+            'caption': self.caption,
+            'topics': self.topics,
+            'uploaded_files': self.uploaded_files,
+            'note': self.note,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'next_retry_at': self.next_retry_at.isoformat() if self.next_retry_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
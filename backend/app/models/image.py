@@ -3,6 +3,11 @@ from app.extensions import db
 
 class Image(db.Model):
     __tablename__ = 'images'
+    __table_args__ = (
+        # 列表接口按 (created_at, id) 游标分页，按工作流过滤时使用第二个索引
+        db.Index('ix_images_created_at_id', 'created_at', 'id'),
+        db.Index('ix_images_workflow_id_created_at_id', 'workflow_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
@@ -0,0 +1,13 @@
+from datetime import datetime
+from app.extensions import db
+
+class PromptCache(db.Model):
+    """托管任务生成的提示词缓存，key 为 (prompt_template, topic, style, count) 的哈希"""
+    __tablename__ = 'prompt_cache'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), nullable=False, index=True)
+    prompts = db.Column(db.JSON, nullable=False)
+    reuse_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_used_at = db.Column(db.DateTime)
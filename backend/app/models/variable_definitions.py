@@ -5,7 +5,7 @@ class VariableDefinitions(db.Model):
     __tablename__ = 'variable_definitions'
     
     id = db.Column(db.Integer, primary_key=True)
-    class_type = db.Column(db.String(255), nullable=False)
+    class_type = db.Column(db.String(255), nullable=False, index=True)
     value_path = db.Column(db.String(255), nullable=False)
     value_type = db.Column(db.String(50), nullable=False)
     param_type = db.Column(db.String(10), nullable=False)  # 'input' or 'output'
@@ -3,6 +3,12 @@ from app.extensions import db
 
 class Workflow(db.Model):
     __tablename__ = 'workflows'
+    __table_args__ = (
+        # 列表接口按 (status, created_at, id) 游标分页
+        db.Index('ix_workflows_status_created_at_id', 'status', 'created_at', 'id'),
+        # 上传时按文件名查找已有工作流
+        db.Index('ix_workflows_original_name', 'original_name'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     original_name = db.Column(db.String(200), nullable=False)
@@ -16,6 +22,17 @@ class Workflow(db.Model):
     input_vars = db.Column(db.ARRAY(db.String))
     output_vars = db.Column(db.ARRAY(db.String))
     preview_image = db.Column(db.Text)
+    # 列表查询时通过 with_expression 加载的变量数量，见 Workflow.variables_count_expression()
+    variables_count = db.query_expression()
+    
+    @classmethod
+    def variables_count_expression(cls):
+        """按 workflow_id 索引统计变量数量的关联子查询，避免逐行加载 variables"""
+        from app.models.workflow_variable import WorkflowVariable
+        return db.select(db.func.count(WorkflowVariable.id)) \
+            .where(WorkflowVariable.workflow_id == cls.id) \
+            .correlate(cls) \
+            .scalar_subquery()
     
     @property
     def normalized_file_path(self):
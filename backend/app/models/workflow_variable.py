@@ -5,7 +5,7 @@ class WorkflowVariable(db.Model):
     __tablename__ = 'workflow_variables'
     
     id = db.Column(db.Integer, primary_key=True)
-    workflow_id = db.Column(db.Integer, db.ForeignKey('workflows.id'), nullable=False)
+    workflow_id = db.Column(db.Integer, db.ForeignKey('workflows.id'), nullable=False, index=True)
     node_id = db.Column(db.String(255), nullable=False)
     class_type_id = db.Column(db.Integer, db.ForeignKey('variable_definitions.id'), nullable=False)
     title = db.Column(db.String(255), nullable=True)
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from conf import (
+    RENDITION_CACHE_FOLDER, RENDITION_CACHE_MAX_MB, RENDITION_WIDTHS, RENDITION_FORMATS, RENDITION_WORKERS
+)
+from app.utils.logger import logger
+
+# 格式 -> (PIL 保存格式, MIME 类型, 保存参数)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'image/png', {'optimize': True}),
+}
+
+
+def render(source_path: str, dest_path: str, width: int, fmt: str) -> int:
+    """在子进程中生成缩略图，宽度不超过 width（不放大），返回文件大小"""
+    pil_format, _, options = FORMATS[fmt]
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if width and img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        tmp_path = f'{dest_path}.{os.getpid()}.part'
+        img.save(tmp_path, pil_format, **options)
+    os.replace(tmp_path, dest_path)
+    return os.path.getsize(dest_path)
+
+
+class RenditionCache:
+    """
+    图片缩略图（多分辨率副本）服务
+
+    缩略图在首次请求时由进程池生成，保存到磁盘缓存目录，之后直接读取。
+    请求的宽度向上取整到配置的档位，避免任意宽度把缓存撑爆；缓存总大小超过上限时
+    按最近访问时间淘汰。同一副本的并发请求只生成一次。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str = RENDITION_CACHE_FOLDER, max_bytes: int = RENDITION_CACHE_MAX_MB * 1024 * 1024,
+                 widths=RENDITION_WIDTHS, formats=RENDITION_FORMATS, workers: int = RENDITION_WORKERS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.widths = sorted(widths)
+        self.formats = [fmt for fmt in formats if fmt in FORMATS]
+        self.workers = workers or None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._total_bytes = None
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def normalize(self, width, fmt):
+        """校验并规范化请求参数，返回 (宽度, 格式)，宽度为 0 表示保持原尺寸"""
+        fmt = (fmt or 'webp').lower()
+        if fmt not in self.formats:
+            raise ValueError(f"Unsupported format: {fmt}. Allowed formats are: {', '.join(self.formats)}")
+        if not width:
+            return 0, fmt
+        width = int(width)
+        if width <= 0:
+            raise ValueError('Width must be positive')
+        for allowed in self.widths:
+            if width <= allowed:
+                return allowed, fmt
+        return self.widths[-1], fmt
+
+    def _cache_path(self, source_path: str, width: int, fmt: str) -> str:
+        # 原图路径、大小和修改时间一起参与哈希，原图被替换后自动生成新副本
+        stat = os.stat(source_path)
+        digest = hashlib.sha1(f'{source_path}|{stat.st_size}|{stat.st_mtime_ns}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f'{digest[2:18]}_{width}.{fmt}')
+
+    def get(self, source_path: str, width: int, fmt: str) -> str:
+        """返回缩略图路径，不存在时生成"""
+        dest_path = self._cache_path(source_path, width, fmt)
+        if os.path.exists(dest_path):
+            self.stats['hits'] += 1
+            # 用修改时间记录最近访问时间，供淘汰时使用
+            os.utime(dest_path)
+            return dest_path
+
+        executor = self.executor
+        submitted = False
+        with self._lock:
+            future = self._inflight.get(dest_path)
+            if future is None:
+                self.stats['misses'] += 1
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                future = executor.submit(render, source_path, dest_path, width, fmt)
+                self._inflight[dest_path] = future
+                submitted = True
+        if submitted:
+            future.add_done_callback(lambda f: self._on_rendered(dest_path, f))
+        future.result()
+        return dest_path
+
+    def _on_rendered(self, dest_path: str, future):
+        with self._lock:
+            self._inflight.pop(dest_path, None)
+        if future.exception() is not None:
+            self.stats['errors'] += 1
+            logger.error(f"Failed to render {dest_path}: {future.exception()}")
+            return
+        self._add_bytes(future.result(), keep=dest_path)
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _add_bytes(self, size: int, keep: str = None):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(entry[1] for entry in self._scan())
+            else:
+                self._total_bytes += size
+            if self._total_bytes <= self.max_bytes:
+                return
+            # 淘汰最久未访问的副本，直到低于上限的 90%，刚生成的副本还要返回给请求方，不淘汰
+            target = self.max_bytes * 0.9
+            for _, entry_size, path in sorted(self._scan()):
+                if self._total_bytes <= target:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._total_bytes -= entry_size
+                self.stats['evictions'] += 1
+
+    def cache_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'bytes': self._total_bytes, 'max_bytes': self.max_bytes}
+
+
+# Create a global instance
+renditions = RenditionCache.get_instance()
@@ -1,10 +1,14 @@
 from datetime import datetime, timedelta
+import random
+import threading
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from app.models.agent import Agent, AgentStatus, ScheduleType
+from app.models.agent_run import AgentRun, AgentRunStatus, AgentRunStage
 from app.extensions import db
-from xhs_upload.auto_upload import auto_gen_and_upload
+from xhs_upload.auto_upload import auto_gen_and_upload, prepare_prompts
+from conf import AGENT_RUN_MAX_RETRIES, AGENT_RUN_RETRY_BASE_DELAY, AGENT_RUN_RETRY_MAX_DELAY, PROMPT_PREWARM_LEAD
 import logging
 from flask import current_app
 
@@ -18,6 +22,7 @@ class AgentScheduler:
             self.scheduler = BackgroundScheduler()
             self.scheduler.start()
             self.job_map = {}  # agent_id -> job_id
+            self.run_locks = {}  # agent_id -> Lock，防止定时任务与重试任务并发执行
             self.app = None
             self.initialized = True
 
@@ -139,44 +144,193 @@ class AgentScheduler:
         # 默认每天执行一次
         return CronTrigger(hour=10)
 
-    def execute_agent(self, agent_id: int):
-        """执行agent的任务"""
+    def get_agent_params(self, agent: Agent) -> dict:
+        """agent 当前的执行参数，与 AgentRun.params 比较判断检查点是否可复用"""
+        return {
+            'topic': agent.topic,
+            'image_count': min(agent.image_count, 15),
+            'prompt_template': agent.prompt_template,
+            'image_style': agent.image_style,
+            'account_id': agent.account_id,
+            'workflow_id': agent.workflow_id
+        }
+
+    def get_resumable_run(self, agent: Agent):
+        """获取 agent 最近一次未完成且参数未变化的执行记录"""
+        run = (AgentRun.query
+               .filter_by(agent_id=agent.id)
+               .order_by(AgentRun.id.desc())
+               .first())
+        if not run or run.status == AgentRunStatus.SUCCESS:
+            return None
+        if run.params == self.get_agent_params(agent):
+            return run
+        if run.status == AgentRunStatus.PENDING:
+            # 参数修改前预生成的执行记录还未开始执行，提示词已经过期，由调用方提交删除
+            db.session.delete(run)
+            logger.info(f"Agent {agent.id} params changed, discarded stale pending run {run.id}")
+        return None
+
+    def execute_agent(self, agent_id: int, run_id: int = None):
+        """执行agent的任务，run_id 不为空时表示重试指定的执行记录"""
         if not self.app:
             logger.error("Scheduler not properly initialized with Flask app")
             return
 
+        lock = self.run_locks.setdefault(agent_id, threading.Lock())
+        if not lock.acquire(blocking=False):
+            logger.warning(f"Agent {agent_id} is already running, skipping this trigger")
+            return
+
         with self.app.app_context():
             try:
                 agent = Agent.query.get(agent_id)
                 if not agent or agent.status != AgentStatus.RUNNING:
                     return
 
-                # 更新上次运行时间和下次运行时间
-                agent.last_run = datetime.utcnow()
-                agent.next_run = self.calculate_next_run(agent.schedule_type, agent.schedule_config)
+                if run_id is None:
+                    # 更新上次运行时间和下次运行时间
+                    agent.last_run = datetime.utcnow()
+                    agent.next_run = self.calculate_next_run(agent.schedule_type, agent.schedule_config)
+
+                    # 上次未完成的执行从检查点继续，否则新建执行记录
+                    run = self.get_resumable_run(agent)
+                    if run:
+                        self.cancel_retry(agent_id)
+                        # 新的定时触发重新计算重试次数
+                        run.attempts = 0
+                        logger.info(f"Agent {agent_id} resuming unfinished run {run.id}")
+                    else:
+                        run = AgentRun(agent_id=agent.id, params=self.get_agent_params(agent))
+                        db.session.add(run)
+                else:
+                    run = AgentRun.query.get(run_id)
+                    if not run or run.status == AgentRunStatus.SUCCESS:
+                        return
+                run.next_retry_at = None
                 db.session.commit()
 
                 # 执行Agent任务
-                auto_gen_and_upload(
-                    topic=agent.topic,
-                    image_count=agent.image_count,
-                    prompt_template=agent.prompt_template,
-                    image_style=agent.image_style,
-                    account_id=agent.account_id,
-                    workflow_id=agent.workflow_id
+                params = run.params
+                result = auto_gen_and_upload(
+                    topic=params['topic'],
+                    image_count=params['image_count'],
+                    prompt_template=params['prompt_template'],
+                    image_style=params['image_style'],
+                    account_id=params['account_id'],
+                    workflow_id=params['workflow_id'],
+                    run_id=run.id
                 )
-                
-                logger.info(f"Agent {agent_id} executed successfully")
+
+                if result['success']:
+                    logger.info(f"Agent {agent_id} executed successfully")
+                else:
+                    self.schedule_retry(agent_id, run.id, result.get('retryable', False))
+                # 失败时同样预生成下一次的提示词，未完成的执行会在预生成时被跳过
+                self.schedule_prewarm(agent_id)
                 
             except Exception as e:
                 logger.error(f"Error executing agent {agent_id}: {str(e)}")
                 try:
+                    db.session.rollback()
                     agent = Agent.query.get(agent_id)
                     if agent:
                         agent.status = AgentStatus.ERROR
                         db.session.commit()
                 except Exception as inner_e:
                     logger.error(f"Error updating agent status: {str(inner_e)}")
+            finally:
+                lock.release()
+
+    def schedule_retry(self, agent_id: int, run_id: int, retryable: bool):
+        """失败的执行按指数退避自动重试，超过次数后等待下一次定时触发时继续"""
+        run = AgentRun.query.get(run_id)
+        if not run:
+            return
+        if not retryable:
+            logger.error(f"Agent {agent_id} run {run_id} failed with a non-retryable error: {run.last_error}")
+            return
+        if run.attempts > AGENT_RUN_MAX_RETRIES:
+            logger.error(f"Agent {agent_id} run {run_id} failed after {run.attempts} attempts, "
+                         f"will resume on next scheduled run")
+            return
+
+        delay = min(AGENT_RUN_RETRY_BASE_DELAY * (2 ** (run.attempts - 1)), AGENT_RUN_RETRY_MAX_DELAY)
+        delay += random.uniform(0, delay * 0.1)
+        run.next_retry_at = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+
+        self.scheduler.add_job(
+            func=self.execute_agent,
+            trigger='date',
+            run_date=datetime.now() + timedelta(seconds=delay),
+            args=[agent_id],
+            kwargs={'run_id': run_id},
+            id=f'agent_{agent_id}_retry',
+            replace_existing=True
+        )
+        logger.info(f"Agent {agent_id} run {run_id} will retry in {delay:.0f}s (attempt {run.attempts + 1})")
+
+    def schedule_prewarm(self, agent_id: int):
+        """在下次执行前 PROMPT_PREWARM_LEAD 秒预生成提示词，使 LLM 调用不阻塞图片生成"""
+        if PROMPT_PREWARM_LEAD <= 0 or agent_id not in self.job_map:
+            return
+        job = self.scheduler.get_job(self.job_map[agent_id])
+        if not job or not job.next_run_time:
+            return
+
+        run_date = job.next_run_time - timedelta(seconds=PROMPT_PREWARM_LEAD)
+        self.scheduler.add_job(
+            func=self.prewarm_agent,
+            trigger='date',
+            run_date=max(run_date, datetime.now(run_date.tzinfo)),
+            args=[agent_id],
+            id=f'agent_{agent_id}_prewarm',
+            replace_existing=True
+        )
+        logger.info(f"Scheduled prompt prewarm for agent {agent_id} at {run_date}")
+
+    def prewarm_agent(self, agent_id: int):
+        """为 agent 的下一次执行预先生成提示词，保存为待执行的 AgentRun"""
+        if not self.app:
+            return
+        lock = self.run_locks.get(agent_id)
+        if lock and lock.locked():
+            logger.info(f"Agent {agent_id} is running, skipping prompt prewarm")
+            return
+
+        with self.app.app_context():
+            try:
+                agent = Agent.query.get(agent_id)
+                if not agent or agent.status != AgentStatus.RUNNING:
+                    return
+                if self.get_resumable_run(agent):
+                    logger.info(f"Agent {agent_id} already has a pending run, skipping prompt prewarm")
+                    return
+                db.session.commit()
+
+                params = self.get_agent_params(agent)
+                prompts = prepare_prompts(params['prompt_template'], params['topic'],
+                                          params['image_count'], params['image_style'])
+                run = AgentRun(
+                    agent_id=agent.id,
+                    params=params,
+                    prompts=prompts,
+                    stage=AgentRunStage.PROMPTS
+                )
+                db.session.add(run)
+                db.session.commit()
+                logger.info(f"Prewarmed {len(prompts)} prompts for agent {agent_id} in run {run.id}")
+            except Exception as e:
+                # 预生成失败不影响正式执行，执行时会重新生成提示词
+                db.session.rollback()
+                logger.warning(f"Prompt prewarm failed for agent {agent_id}: {str(e)}")
+
+    def cancel_retry(self, agent_id: int):
+        """取消 agent 待执行的重试任务"""
+        job_id = f'agent_{agent_id}_retry'
+        if self.scheduler.get_job(job_id):
+            self.scheduler.remove_job(job_id)
 
     def schedule_agent(self, agent: Agent):
         """为agent添加调度任务"""
@@ -196,9 +350,13 @@ class AgentScheduler:
         db.session.commit()
         
         logger.info(f"Scheduled agent {agent.id} with next run at {agent.next_run}")
+        self.schedule_prewarm(agent.id)
 
     def remove_agent(self, agent_id: int):
         """移除agent的调度任务"""
+        self.cancel_retry(agent_id)
+        if self.scheduler.get_job(f'agent_{agent_id}_prewarm'):
+            self.scheduler.remove_job(f'agent_{agent_id}_prewarm')
         if agent_id in self.job_map:
             try:
                 self.scheduler.remove_job(self.job_map[agent_id])
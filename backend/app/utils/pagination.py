@@ -0,0 +1,121 @@
+import base64
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_, func, select, text
+from app.extensions import db
+from conf import PAGINATION_COUNT_CACHE_SECONDS
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(item, columns) -> str:
+    """把最后一条记录的排序列的值编码为游标字符串"""
+    values = []
+    for column in columns:
+        value = getattr(item, column.key)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError('cursor length mismatch')
+        decoded = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type in (int, bool):
+                value = python_type(value)
+            decoded.append(value)
+        return decoded
+    except Exception as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+
+def keyset_paginate(query, columns, cursor=None, limit=20):
+    """
+    基于游标（keyset）的分页，按 columns 倒序排列
+
+    不使用 OFFSET，直接从上一页最后一条记录的位置继续扫描索引，翻到多深都是同样的开销。
+    columns 的最后一列必须唯一（一般是 id），并且应有对应顺序的联合索引。
+
+    Returns:
+        tuple: (本页记录, 下一页游标，没有下一页时为 None)
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        query = query.filter(tuple_(*columns) < tuple_(*[
+            db.literal(value, type_=column.type) for column, value in zip(columns, values)
+        ]))
+    rows = query.order_by(*[column.desc() for column in columns]).limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1], columns) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def count_rows(query, mode='exact'):
+    """
+    统计查询的总行数
+
+    mode:
+        exact  - 精确计数
+        approx - 近似计数。PostgreSQL 下无过滤条件时读取 pg_class 的统计值，
+                 其他情况缓存精确计数 PAGINATION_COUNT_CACHE_SECONDS 秒
+        none   - 不计数，返回 None
+    """
+    if mode == 'none':
+        return None
+    if mode != 'approx':
+        return query.order_by(None).count()
+
+    statement = query.order_by(None).statement
+    if db.engine.dialect.name == 'postgresql' and statement.whereclause is None:
+        froms = statement.get_final_froms()
+        if len(froms) == 1 and hasattr(froms[0], 'name'):
+            estimate = db.session.execute(
+                text('SELECT reltuples::bigint FROM pg_class WHERE relname = :name'), {'name': froms[0].name}
+            ).scalar()
+            # 表从未 ANALYZE 过时 reltuples 为 -1，退回缓存的精确计数
+            if estimate is not None and estimate >= 0:
+                return estimate
+
+    compiled = statement.compile(db.engine)
+    key = (str(compiled), tuple(sorted((k, str(v)) for k, v in compiled.params.items())))
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached and now - cached[1] < PAGINATION_COUNT_CACHE_SECONDS:
+            return cached[0]
+    total = db.session.execute(select(func.count()).select_from(statement.subquery())).scalar()
+    with _count_lock:
+        if len(_count_cache) > 1024:
+            _count_cache.clear()
+        _count_cache[key] = (total, now)
+    return total
+
+
+def parse_date_range(start, end):
+    """
+    解析 ISO 格式的起止时间过滤参数，只给日期时结束日期包含当天
+
+    Returns:
+        tuple: (开始时间, 结束时间（不含）)，未提供的为 None
+    """
+    start_at = datetime.fromisoformat(start) if start else None
+    end_at = None
+    if end:
+        end_at = datetime.fromisoformat(end)
+        if len(end) == 10:
+            end_at += timedelta(days=1)
+    return start_at, end_at
@@ -0,0 +1,136 @@
+import atexit
+import re
+import threading
+from sqlalchemy import event
+from app.utils.logger import logger
+
+_AUDITED = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+# SCAN CONSTANT ROW 是没有 FROM 的 SELECT，旧版本 SQLite 的子查询显示为 SCAN SUBQUERY n，新版本为 SCAN (subquery-n)
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(?!CONSTANT ROW$|SUBQUERY \d)(\w+)(.*)$')
+# 物化或协程执行的子查询、CTE，之后的 SCAN 遍历的是它们的结果而不是表
+_SQLITE_DERIVED = re.compile(r'^(?:MATERIALIZE|CO-ROUTINE) (\w+)')
+
+
+class QueryAuditor:
+    """
+    开发工具：对执行的每条 SQL 运行 EXPLAIN，找出全表扫描
+
+    监听 engine 的 after_cursor_execute 事件，在同一个数据库连接上执行 EXPLAIN
+    （SQLite 为 EXPLAIN QUERY PLAN，PostgreSQL 为 EXPLAIN (FORMAT JSON)），
+    同一条语句只分析一次。可以作为上下文管理器在测试中使用，也可以设置 QUERY_AUDIT=true
+    在整个服务运行期间开启，退出时输出汇总。
+
+        with QueryAuditor(db.engine) as audit:
+            client.get('/api/list-images')
+        assert not audit.full_scans()
+    """
+
+    def __init__(self, engine, ignore_tables=()):
+        self.engine = engine
+        self.ignore_tables = {table.lower() for table in ignore_tables} | {'schema_migrations'}
+        self.findings = {}  # SQL -> {'count': 执行次数, 'scans': 全表扫描的表, 'temp_sort': 是否需要临时排序}
+        self._lock = threading.Lock()
+        self._installed = False
+
+    def install(self):
+        if not self._installed:
+            event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._installed = True
+        return self
+
+    def uninstall(self):
+        if self._installed:
+            event.remove(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._installed = False
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.uninstall()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany or not _AUDITED.match(statement):
+            return
+        with self._lock:
+            finding = self.findings.get(statement)
+            if finding is not None:
+                finding['count'] += 1
+                return
+        try:
+            finding = self._explain(conn, statement, parameters)
+        except Exception as e:
+            logger.debug(f"EXPLAIN failed for query: {statement} ({e})")
+            return
+        finding['count'] = 1
+        with self._lock:
+            self.findings.setdefault(statement, finding)
+        if finding['scans']:
+            logger.warning(f"Full table scan on {', '.join(finding['scans'])}: {statement}")
+
+    def _explain(self, conn, statement, parameters) -> dict:
+        # 直接使用 DBAPI 游标，避免再次触发 SQLAlchemy 事件，同时能看到当前事务中的数据
+        raw_cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            if conn.dialect.name == 'postgresql':
+                raw_cursor.execute(f'EXPLAIN (FORMAT JSON) {statement}', parameters)
+                return self._parse_postgres(raw_cursor.fetchone()[0])
+            raw_cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+            return self._parse_sqlite(raw_cursor.fetchall(), statement)
+        finally:
+            raw_cursor.close()
+
+    def _parse_sqlite(self, rows, statement='') -> dict:
+        details = [row[-1] for row in rows]
+        derived = {match.group(1).lower() for match in map(_SQLITE_DERIVED.match, details) if match}
+        # 同一个 CTE 的其他别名（FROM w, w AS w2）
+        for name in list(derived):
+            for alias in re.finditer(rf'\b{re.escape(name)}\s+(?:AS\s+)?(\w+)', statement, re.IGNORECASE):
+                derived.add(alias.group(1).lower())
+
+        scans, temp_sort = [], False
+        for detail in details:
+            match = _SQLITE_SCAN.match(detail)
+            # SCAN ... USING (COVERING) INDEX 是按索引顺序遍历，不算全表扫描
+            if match and 'USING' not in match.group(2) and match.group(1).lower() not in derived and \
+                    match.group(1).lower() not in self.ignore_tables:
+                scans.append(match.group(1))
+            if detail.startswith('USE TEMP B-TREE'):
+                temp_sort = True
+        return {'scans': scans, 'temp_sort': temp_sort}
+
+    def _parse_postgres(self, plan) -> dict:
+        scans, temp_sort = [], False
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            relation = node.get('Relation Name', '')
+            if node.get('Node Type') == 'Seq Scan' and relation.lower() not in self.ignore_tables:
+                scans.append(relation)
+            if node.get('Node Type') == 'Sort':
+                temp_sort = True
+            nodes.extend(node.get('Plans', []))
+        return {'scans': scans, 'temp_sort': temp_sort}
+
+    def full_scans(self) -> dict:
+        """返回存在全表扫描的语句：{SQL: 分析结果}"""
+        with self._lock:
+            return {statement: finding for statement, finding in self.findings.items() if finding['scans']}
+
+    def report(self) -> str:
+        with self._lock:
+            findings = sorted(self.findings.items(), key=lambda item: -item[1]['count'])
+        flagged = [(statement, finding) for statement, finding in findings if finding['scans']]
+        lines = [f"Query audit: {len(findings)} distinct queries, {len(flagged)} with full table scans"]
+        for statement, finding in flagged:
+            sort_note = ', temp sort' if finding['temp_sort'] else ''
+            lines.append(f"  [{finding['count']}x] scan {', '.join(finding['scans'])}{sort_note}: "
+                         f"{' '.join(statement.split())}")
+        return '\n'.join(lines)
+
+
+def install_query_audit(engine, ignore_tables=()) -> QueryAuditor:
+    """在整个进程中开启查询审计，退出时把汇总写入日志"""
+    auditor = QueryAuditor(engine, ignore_tables).install()
+    atexit.register(lambda: logger.info(auditor.report()))
+    return auditor
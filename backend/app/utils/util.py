@@ -1,5 +1,42 @@
 import json
-from typing import Tuple, Any, Optional
+from typing import Tuple, Any, Optional, Sequence
+
+def normalize_json_type(value: Any) -> str:
+    """标准化类型名称"""
+    if isinstance(value, str):
+        return 'string'
+    elif isinstance(value, int):
+        return 'long'
+    elif isinstance(value, float):
+        return 'float'
+    elif isinstance(value, bool):
+        return 'boolean'
+    elif isinstance(value, list):
+        return 'array'
+    elif isinstance(value, dict):
+        return 'object'
+    elif value is None:
+        return 'null'
+    return type(value).__name__
+
+def get_json_value_by_keys(json_data: dict, keys: Sequence[str]) -> Tuple[Optional[Any], Optional[str]]:
+    """
+    按预先拆分好的路径获取值及其标准化类型，供需要反复按同一路径取值的场景使用。
+    
+    Args:
+        json_data: JSON 数据字典
+        keys: 路径的各级键，例如 ("inputs", "text")
+    
+    Returns:
+        Tuple[Any, str]: 返回 (值, 标准化类型名称) 或 (None, None)
+    """
+    current = json_data
+    try:
+        for key in keys:
+            current = current[key]
+    except (KeyError, TypeError, IndexError):
+        return None, None
+    return current, normalize_json_type(current)
 
 def get_json_value_with_type(json_data: dict, path: str) -> Tuple[Optional[Any], Optional[str]]:
     """
@@ -13,37 +50,12 @@ def get_json_value_with_type(json_data: dict, path: str) -> Tuple[Optional[Any],
         Tuple[Any, str]: 返回 (值, 标准化类型名称) 或 (None, None)
         标准化类型包括: 'string', 'long', 'float', 'boolean', 'array', 'object'
     """
-    def normalize_type(value: Any) -> str:
-        """标准化类型名称"""
-        if isinstance(value, str):
-            return 'string'
-        elif isinstance(value, int):
-            return 'long'
-        elif isinstance(value, float):
-            return 'float'
-        elif isinstance(value, bool):
-            return 'boolean'
-        elif isinstance(value, list):
-            return 'array'
-        elif isinstance(value, dict):
-            return 'object'
-        elif value is None:
-            return 'null'
-        return type(value).__name__
-
     try:
         # 如果是JSON字符串，先解析
         if isinstance(json_data, str):
             json_data = json.loads(json_data)
-        
-        # 按路径分割并遍历
-        current = json_data
-        for key in path.split('.'):
-            current = current[key]
-        
-        # 获取标准化类型
-        value_type = normalize_type(current)
-        return current, value_type
-        
-    except (KeyError, TypeError, json.JSONDecodeError):
-        return None, None
\ No newline at end of file
+    except json.JSONDecodeError:
+        return None, None
+    
+    # 按路径分割并遍历
+    return get_json_value_by_keys(json_data, path.split('.'))
\ No newline at end of file
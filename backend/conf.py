@@ -12,10 +12,56 @@ COMFYUI_HOST = os.getenv('COMFYUI_HOST', '127.0.0.1')
 COMFYUI_PORT = os.getenv('COMFYUI_PORT', '8188')
 COMFYUI_SERVER_ADDRESS = f"{COMFYUI_HOST}:{COMFYUI_PORT}"
 
+# ComfyUI 生成任务调度配置
+# 同时提交给 ComfyUI 的任务数，其余任务在本地按优先级排队
+COMFYUI_MAX_INFLIGHT = int(os.getenv('COMFYUI_MAX_INFLIGHT', '1'))
+# 托管任务每批提交的图片数
+AGENT_SLICE_SIZE = int(os.getenv('AGENT_SLICE_SIZE', '2'))
+# 交互任务连续执行多少次后必须让出一次给后台任务
+DISPATCH_STARVATION_LIMIT = int(os.getenv('DISPATCH_STARVATION_LIMIT', '4'))
+# 后台任务最长等待秒数，超过后优先执行
+DISPATCH_MAX_WAIT = float(os.getenv('DISPATCH_MAX_WAIT', '120'))
+
+# 托管任务失败重试配置，重试从上次完成的阶段继续
+AGENT_RUN_MAX_RETRIES = int(os.getenv('AGENT_RUN_MAX_RETRIES', '3'))
+# 首次重试等待秒数，之后每次翻倍
+AGENT_RUN_RETRY_BASE_DELAY = float(os.getenv('AGENT_RUN_RETRY_BASE_DELAY', '60'))
+AGENT_RUN_RETRY_MAX_DELAY = float(os.getenv('AGENT_RUN_RETRY_MAX_DELAY', '1800'))
+
+# 托管任务提示词预生成与缓存配置
+# 在下次执行前多少秒预生成提示词，0 表示不预生成
+PROMPT_PREWARM_LEAD = float(os.getenv('PROMPT_PREWARM_LEAD', '600'))
+# 相同 (模板, 主题, 风格, 数量) 的提示词缓存有效秒数，0 表示不复用
+PROMPT_CACHE_TTL = float(os.getenv('PROMPT_CACHE_TTL', '0'))
+# 每组缓存提示词最多被复用的次数
+PROMPT_CACHE_MAX_REUSE = int(os.getenv('PROMPT_CACHE_MAX_REUSE', '1'))
+
 # 图片相关配置
 ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'png,jpg,jpeg').split(','))
 UPLOAD_FOLDER = os.path.join(BASE_PATH, os.getenv('UPLOAD_FOLDER', 'upload/images'))
 OUTPUT_FOLDER = os.path.join(BASE_PATH, os.getenv('OUTPUT_FOLDER', 'output/images'))
+# 缩略图缓存目录及大小上限（MB），可选宽度档位和格式，生成缩略图的进程数（0 为 CPU 核数）
+RENDITION_CACHE_FOLDER = os.path.join(BASE_PATH, os.getenv('RENDITION_CACHE_FOLDER', 'output/renditions'))
+RENDITION_CACHE_MAX_MB = int(os.getenv('RENDITION_CACHE_MAX_MB', '1024'))
+RENDITION_WIDTHS = [int(width) for width in os.getenv('RENDITION_WIDTHS', '128,256,512,1024').split(',')]
+RENDITION_FORMATS = os.getenv('RENDITION_FORMATS', 'webp,jpeg,png').split(',')
+RENDITION_WORKERS = int(os.getenv('RENDITION_WORKERS', '2'))
+# 图片列表中缩略图的宽度
+THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', '256'))
+# 图片写入后不再变化，浏览器和 CDN 可以长期缓存（秒）
+IMAGE_CACHE_MAX_AGE = int(os.getenv('IMAGE_CACHE_MAX_AGE', '31536000'))
+# 生成图片记录批量入库：每批最多条数、最长等待毫秒数，写入前记录先追加到日志文件，留空则不记录日志
+IMAGE_RECORD_BATCH_SIZE = int(os.getenv('IMAGE_RECORD_BATCH_SIZE', '50'))
+IMAGE_RECORD_FLUSH_MS = int(os.getenv('IMAGE_RECORD_FLUSH_MS', '200'))
+IMAGE_RECORD_JOURNAL = os.getenv('IMAGE_RECORD_JOURNAL', 'output/image_records.journal')
+if IMAGE_RECORD_JOURNAL:
+    IMAGE_RECORD_JOURNAL = os.path.join(BASE_PATH, IMAGE_RECORD_JOURNAL)
+
+# 工作流变量定义缓存的最长有效秒数（直接修改数据库后多久生效），0 表示只在本进程修改时失效
+DEFINITION_CACHE_TTL = float(os.getenv('DEFINITION_CACHE_TTL', '300'))
+# 批量导入工作流时解析校验的进程数（1 为不使用进程池）和单次最多文件数
+WORKFLOW_IMPORT_WORKERS = int(os.getenv('WORKFLOW_IMPORT_WORKERS', '4'))
+WORKFLOW_IMPORT_MAX_FILES = int(os.getenv('WORKFLOW_IMPORT_MAX_FILES', '500'))
 
 # 提示词增强系统消息
 PROMPT_ENHANCE_SYSTEM_MESSAGE = os.getenv('PROMPT_ENHANCE_SYSTEM_MESSAGE')
@@ -28,6 +74,23 @@ OPENAI_API_BASE = os.getenv('OPENAI_API_BASE')
 OPENAI_ENHANCE_MODEL = os.getenv('OPENAI_ENHANCE_MODEL', 'gpt-4o')
 OPENAI_CAPTION_MODEL = os.getenv('OPENAI_CAPTION_MODEL', 'gpt-4o')
 
+# OpenAI 客户端连接池与并发配置
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+# 每个模型的默认最大并发请求数
+LLM_DEFAULT_CONCURRENCY = int(os.getenv('LLM_DEFAULT_CONCURRENCY', '4'))
+# 按模型单独设置并发，格式：gpt-4o=4,gpt-4o-mini=8
+LLM_MODEL_CONCURRENCY = os.getenv('LLM_MODEL_CONCURRENCY', '')
+
+# LLM 响应缓存配置（提示词增强接口），默认关闭，开启后请求中传 no_cache=true 可跳过缓存
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'false').lower() == 'true'
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '3600'))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000'))
+# 近似匹配：用户内容相似度不低于阈值时复用响应
+LLM_CACHE_NEAR_DUPLICATE = os.getenv('LLM_CACHE_NEAR_DUPLICATE', 'false').lower() == 'true'
+LLM_CACHE_NEAR_THRESHOLD = float(os.getenv('LLM_CACHE_NEAR_THRESHOLD', '0.9'))
+
 # 腾讯翻译配置
 TENCENT_SECRET_ID = os.getenv('TENCENT_SECRET_ID')
 TENCENT_SECRET_KEY = os.getenv('TENCENT_SECRET_KEY')
@@ -35,16 +98,93 @@ TENCENT_SERVICE = os.getenv('TENCENT_SERVICE', 'tmt')
 TENCENT_HOST = os.getenv('TENCENT_HOST', 'tmt.tencentcloudapi.com')
 TENCENT_VERSION = os.getenv('TENCENT_VERSION', '2018-03-21')
 TENCENT_REGION = os.getenv('TENCENT_REGION', 'ap-beijing')
+# 本地调试模拟服务时可设置为 http
+TENCENT_SCHEME = os.getenv('TENCENT_SCHEME', 'https')
+# 批量翻译单次请求的总字符数与条数上限
+TENCENT_BATCH_MAX_CHARS = int(os.getenv('TENCENT_BATCH_MAX_CHARS', '6000'))
+TENCENT_BATCH_MAX_ITEMS = int(os.getenv('TENCENT_BATCH_MAX_ITEMS', '100'))
+# 翻译接口保持的长连接数量及请求超时（秒）
+TENCENT_POOL_SIZE = int(os.getenv('TENCENT_POOL_SIZE', '4'))
+TENCENT_TIMEOUT = float(os.getenv('TENCENT_TIMEOUT', '10'))
+# 翻译记忆库路径，留空则不缓存译文
+TRANSLATION_MEMORY_PATH = os.getenv('TRANSLATION_MEMORY_PATH', 'translate/translation_memory.db')
+if TRANSLATION_MEMORY_PATH:
+    TRANSLATION_MEMORY_PATH = os.path.join(BASE_PATH, TRANSLATION_MEMORY_PATH)
+
+# 外部接口客户端限流配置，格式为 "provider=值"，provider 包括 tencent、openai、xhs_sign、xhs
+# 未配置的 provider 不限流；openai 按模型、xhs 按账号分别计算
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# 每秒请求数
+RATE_LIMITS = os.getenv('RATE_LIMITS', 'tencent=5,openai=5,xhs_sign=5,xhs=1')
+# 令牌桶容量，即允许的突发请求数
+RATE_LIMIT_BURST = os.getenv('RATE_LIMIT_BURST', 'tencent=5,openai=10,xhs_sign=5,xhs=3')
+# 并发上限，遇到限流错误时减半，之后逐步恢复
+RATE_LIMIT_CONCURRENCY = os.getenv('RATE_LIMIT_CONCURRENCY', 'tencent=5,openai=8,xhs_sign=4,xhs=2')
+# 等待限流配额的最长时间（秒），超时抛出异常
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '60'))
 
 # 小红书 cookie 配置
 XHS_COOKIE = os.getenv('XHS_COOKIE')
 
 # SQLite database configuration
 DATABASE_URI = os.getenv('DATABASE_URI', 'sqlite:///app.db')
+# 连接池大小、额外溢出连接数、获取连接的等待时间（秒）和连接回收时间（秒，仅 PostgreSQL 等服务端数据库）
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# SQLite 调优：等待写锁的超时（毫秒）、同步级别（WAL 下 NORMAL 即可保证不损坏）、页缓存和内存映射大小
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '30000'))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))
+SQLITE_MMAP_SIZE_MB = int(os.getenv('SQLITE_MMAP_SIZE_MB', '256'))
+# PostgreSQL：单条语句超时（毫秒，0 为不限制）和连接的 application_name
+PG_STATEMENT_TIMEOUT_MS = int(os.getenv('PG_STATEMENT_TIMEOUT_MS', '30000'))
+PG_APPLICATION_NAME = os.getenv('PG_APPLICATION_NAME', 'xhs_automate')
+# 列表接口近似总数（count=approx）的缓存时间（秒）
+PAGINATION_COUNT_CACHE_SECONDS = int(os.getenv('PAGINATION_COUNT_CACHE_SECONDS', '60'))
+# 开发用：对每条 SQL 执行 EXPLAIN 并在日志中标记全表扫描，QUERY_AUDIT_IGNORE 为不需要报告的小表（逗号分隔）
+QUERY_AUDIT = os.getenv('QUERY_AUDIT', 'false').lower() == 'true'
+QUERY_AUDIT_IGNORE = [table.strip() for table in os.getenv('QUERY_AUDIT_IGNORE', '').split(',') if table.strip()]
 
 # pinterest 爬虫配置，用于训练模型
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(BASE_DIR, os.getenv('IMAGE_DIR', 'spider/images'))
+# 图片下载并发数、单个主机的最大连接数、失败重试次数和单次下载超时（秒）
+SPIDER_DOWNLOAD_CONCURRENCY = int(os.getenv('SPIDER_DOWNLOAD_CONCURRENCY', '32'))
+SPIDER_DOWNLOAD_PER_HOST = int(os.getenv('SPIDER_DOWNLOAD_PER_HOST', '16'))
+SPIDER_DOWNLOAD_RETRIES = int(os.getenv('SPIDER_DOWNLOAD_RETRIES', '3'))
+SPIDER_DOWNLOAD_TIMEOUT = float(os.getenv('SPIDER_DOWNLOAD_TIMEOUT', '60'))
+# 下载去重索引路径，留空则只按文件名跳过已存在的图片
+SPIDER_DEDUP_PATH = os.getenv('SPIDER_DEDUP_PATH', 'spider/dedup.db')
+if SPIDER_DEDUP_PATH:
+    SPIDER_DEDUP_PATH = os.path.join(BASE_DIR, SPIDER_DEDUP_PATH)
+# 是否用感知哈希（dHash）识别缩放、重新压缩后的重复图片，以及判定为重复的最大汉明距离（不超过 3）
+SPIDER_DEDUP_PERCEPTUAL = os.getenv('SPIDER_DEDUP_PERCEPTUAL', 'false').lower() == 'true'
+SPIDER_DEDUP_MAX_DISTANCE = int(os.getenv('SPIDER_DEDUP_MAX_DISTANCE', '3'))
+# 爬取状态（已见过的图片、待下载队列、各画板进度）保存路径，留空则每次从头爬取
+SPIDER_FRONTIER_PATH = os.getenv('SPIDER_FRONTIER_PATH', 'spider/frontier.db')
+if SPIDER_FRONTIER_PATH:
+    SPIDER_FRONTIER_PATH = os.path.join(BASE_DIR, SPIDER_FRONTIER_PATH)
+# 增量爬取：连续若干次滚动只看到已见过的图片时停止
+SPIDER_INCREMENTAL = os.getenv('SPIDER_INCREMENTAL', 'true').lower() == 'true'
+SPIDER_INCREMENTAL_PATIENCE = int(os.getenv('SPIDER_INCREMENTAL_PATIENCE', '2'))
+# 每次滚动后等待新图片出现的最长时间，以及超时后等待网络空闲的时间（毫秒）
+SPIDER_SCROLL_WAIT_MS = int(os.getenv('SPIDER_SCROLL_WAIT_MS', '5000'))
+SPIDER_NETWORK_IDLE_MS = int(os.getenv('SPIDER_NETWORK_IDLE_MS', '1000'))
+# 多页面爬虫：浏览器上下文数量、同时爬取的页面数，以及逗号分隔的种子页面/画板 URL
+SPIDER_CONTEXTS = int(os.getenv('SPIDER_CONTEXTS', '2'))
+SPIDER_PAGE_CONCURRENCY = int(os.getenv('SPIDER_PAGE_CONCURRENCY', '4'))
+SPIDER_SEEDS = os.getenv('SPIDER_SEEDS', 'https://jp.pinterest.com/pin/17240411068831921/')
+
+# 训练数据集导出配置：输出目录、分桶基准分辨率、原图最小边长、每个 tar 分片的样本数、处理进程数（0 为 CPU 核数）
+DATASET_DIR = os.path.join(BASE_DIR, os.getenv('DATASET_DIR', 'spider/dataset'))
+DATASET_RESOLUTION = int(os.getenv('DATASET_RESOLUTION', '1024'))
+DATASET_MIN_SIZE = int(os.getenv('DATASET_MIN_SIZE', '512'))
+DATASET_SHARD_SIZE = int(os.getenv('DATASET_SHARD_SIZE', '1000'))
+DATASET_WORKERS = int(os.getenv('DATASET_WORKERS', '0'))
+# 写入每个描述文件开头的固定内容，例如 LoRA 触发词
+DATASET_CAPTION = os.getenv('DATASET_CAPTION', '')
 
 # 确保必要的目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
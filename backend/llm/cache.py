@@ -0,0 +1,193 @@
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(text: str) -> str:
+    """统一全半角和空白，使仅有格式差异的文本得到相同的缓存键，大小写不同的提示词视为不同"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _hash64(data: str) -> int:
+    return struct.unpack('<Q', hashlib.blake2b(data.encode('utf-8'), digest_size=8).digest())[0]
+
+
+class MinHasher:
+    """基于字符 shingle 的 MinHash 签名，中英文均适用，无需外部依赖"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 4, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # 以固定种子生成 (a, b) 参数，保证进程重启后签名一致
+        self._params = []
+        for i in range(num_perm):
+            a = _hash64(f'{seed}:a:{i}') % (_MERSENNE_PRIME - 1) + 1
+            b = _hash64(f'{seed}:b:{i}') % _MERSENNE_PRIME
+            self._params.append((a, b))
+
+    def shingles(self, text: str) -> set:
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> tuple:
+        hashes = [_hash64(shingle) for shingle in self.shingles(text)]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._params
+        )
+
+    @staticmethod
+    def similarity(sig1: tuple, sig2: tuple) -> float:
+        """估算两个签名对应文本的 Jaccard 相似度"""
+        return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+class _Entry:
+    __slots__ = ('content', 'expires_at', 'scope', 'signature')
+
+    def __init__(self, content, expires_at, scope, signature):
+        self.content = content
+        self.expires_at = expires_at
+        self.scope = scope
+        self.signature = signature
+
+
+class ResponseCache:
+    """
+    LLM 响应缓存
+
+    精确匹配层以规范化后的 (model, system, user, temperature, 其他参数) 为键；
+    近似匹配层（可选）在相同 (model, system, temperature, 其他参数) 范围内，
+    用 MinHash + LSH 分桶查找用户内容（忽略大小写）相似度不低于阈值的已缓存响应。
+    缓存按 TTL 过期，超过 max_entries 时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, ttl: float, max_entries: int, near_duplicate: bool = False,
+                 threshold: float = 0.9, num_perm: int = 64, bands: int = 16):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.near_duplicate = near_duplicate
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._hasher = MinHasher(num_perm=self.rows * bands)
+        self._entries = OrderedDict()  # key -> _Entry，按最近使用排序
+        self._buckets = defaultdict(set)  # (scope, band, band_hash) -> {key}
+        self._lock = threading.Lock()
+        self._stats = {'exact_hits': 0, 'near_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    @staticmethod
+    def _split_messages(messages: list) -> tuple:
+        system = '\n'.join(m.get('content') or '' for m in messages if m.get('role') == 'system')
+        user = '\n'.join(m.get('content') or '' for m in messages if m.get('role') != 'system')
+        return normalize_text(system), normalize_text(user)
+
+    @staticmethod
+    def _digest(*parts) -> str:
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _keys(self, model: str, messages: list, temperature, options: dict) -> tuple:
+        system, user = self._split_messages(messages)
+        temperature = round(float(temperature), 2) if temperature is not None else None
+        scope = self._digest(model, system, temperature, options or {})
+        return scope, self._digest(scope, user), user
+
+    def _band_keys(self, scope: str, signature: tuple) -> list:
+        return [(scope, band, hash(signature[band * self.rows:(band + 1) * self.rows]))
+                for band in range(self.bands)]
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry and entry.signature is not None:
+            for band_key in self._band_keys(entry.scope, entry.signature):
+                bucket = self._buckets.get(band_key)
+                if bucket:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band_key]
+
+    def _live(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._remove(key)
+            self._stats['expirations'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, model: str, messages: list, temperature=None, options: dict = None):
+        """
+        查找缓存的响应
+
+        Returns:
+            tuple: (content, tier)，tier 为 'exact' 或 'near'；未命中时返回 (None, None)
+        """
+        scope, key, user = self._keys(model, messages, temperature, options)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry:
+                self._stats['exact_hits'] += 1
+                return entry.content, 'exact'
+
+            if self.near_duplicate and user:
+                signature = self._hasher.signature(user.lower())
+                candidates = set()
+                for band_key in self._band_keys(scope, signature):
+                    candidates.update(self._buckets.get(band_key, ()))
+                best_key, best_score = None, 0.0
+                for candidate in candidates:
+                    candidate_entry = self._entries.get(candidate)
+                    if candidate_entry is None or candidate_entry.expires_at <= now:
+                        continue
+                    score = MinHasher.similarity(signature, candidate_entry.signature)
+                    if score > best_score:
+                        best_key, best_score = candidate, score
+                if best_key and best_score >= self.threshold:
+                    self._stats['near_hits'] += 1
+                    return self._live(best_key, now).content, 'near'
+
+            self._stats['misses'] += 1
+            return None, None
+
+    def put(self, model: str, messages: list, content: str, temperature=None, options: dict = None):
+        scope, key, user = self._keys(model, messages, temperature, options)
+        signature = self._hasher.signature(user.lower()) if self.near_duplicate and user else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(content, time.monotonic() + self.ttl, scope, signature)
+            if signature is not None:
+                for band_key in self._band_keys(scope, signature):
+                    self._buckets[band_key].add(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats['exact_hits'] + self._stats['near_hits'] + self._stats['misses']
+            hits = self._stats['exact_hits'] + self._stats['near_hits']
+            return {
+                **self._stats,
+                'size': len(self._entries),
+                'hit_rate': hits / lookups if lookups else 0.0
+            }
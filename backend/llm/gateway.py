@@ -0,0 +1,268 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+import httpx
+import openai
+from openai.types.chat import ChatCompletion
+from conf import (
+    OPENAI_API_KEY,
+    OPENAI_API_BASE,
+    LLM_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_MAX_CONNECTIONS,
+    LLM_DEFAULT_CONCURRENCY,
+    LLM_MODEL_CONCURRENCY,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_TTL,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_NEAR_DUPLICATE,
+    LLM_CACHE_NEAR_THRESHOLD,
+)
+from ratelimit.limiter import rate_limiter
+from llm.cache import ResponseCache
+
+# 与 app.utils.logger 使用同一个 logger，不导入 app 包以免循环导入
+logger = logging.getLogger('app')
+
+# 可以重试的错误，每次重试都重新经过限流器
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def _parse_model_concurrency(raw: str) -> dict:
+    """解析 "gpt-4o=4,gpt-4o-mini=8" 格式的每模型并发配置"""
+    limits = {}
+    for item in (raw or '').split(','):
+        if '=' not in item:
+            continue
+        model, limit = item.split('=', 1)
+        try:
+            limits[model.strip()] = max(1, int(limit))
+        except ValueError:
+            logger.warning(f"Invalid LLM concurrency limit: {item}")
+    return limits
+
+
+class LLMGateway:
+    """
+    OpenAI 调用的统一入口
+
+    所有调用共享同一个带连接池的客户端，按模型限制并发和速率，
+    并按调用位置（call_site）统计调用次数、错误数、token 用量和延迟。
+    调用方传入 cache=True 时先查询响应缓存，命中则不请求 OpenAI。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._model_limits = _parse_model_concurrency(LLM_MODEL_CONCURRENCY)
+        self._semaphores = {}
+        self._metrics = defaultdict(lambda: {
+            'calls': 0,
+            'errors': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0,
+            'streams': 0,
+            'total_ttft': 0.0,
+            'cache_hits': 0
+        })
+        self._metrics_lock = threading.Lock()
+        self.cache = ResponseCache(
+            ttl=LLM_CACHE_TTL,
+            max_entries=LLM_CACHE_MAX_ENTRIES,
+            near_duplicate=LLM_CACHE_NEAR_DUPLICATE,
+            threshold=LLM_CACHE_NEAR_THRESHOLD
+        )
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    @property
+    def client(self) -> openai.OpenAI:
+        with self._client_lock:
+            if self._client is None:
+                self._client = openai.OpenAI(
+                    api_key=OPENAI_API_KEY,
+                    base_url=OPENAI_API_BASE,
+                    timeout=LLM_TIMEOUT,
+                    # 由 _create 重试，SDK 内部重试时限流器看不到中间的 429
+                    max_retries=0,
+                    http_client=httpx.Client(
+                        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                            max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                        timeout=LLM_TIMEOUT
+                    )
+                )
+        return self._client
+
+    def _model_limit(self, model: str) -> int:
+        return self._model_limits.get(model, LLM_DEFAULT_CONCURRENCY)
+
+    def _semaphore(self, model: str) -> threading.BoundedSemaphore:
+        with self._client_lock:
+            if model not in self._semaphores:
+                self._semaphores[model] = threading.BoundedSemaphore(self._model_limit(model))
+            return self._semaphores[model]
+
+    def _create(self, model: str, **kwargs):
+        """
+        调用 chat.completions.create，失败时最多重试 LLM_MAX_RETRIES 次
+
+        每次尝试单独经过限流器，429 会立即收缩并发并清空令牌，重试按新的速率排队。
+        """
+        attempt = 0
+        while True:
+            try:
+                with rate_limiter.limit('openai', model):
+                    return self.client.chat.completions.create(model=model, **kwargs)
+            except _RETRYABLE_ERRORS as e:
+                if attempt >= LLM_MAX_RETRIES:
+                    raise
+                delay = min(0.5 * 2 ** attempt, 8.0)
+                attempt += 1
+                logger.warning(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                               f"(attempt {attempt}/{LLM_MAX_RETRIES})")
+                time.sleep(delay)
+
+    def _record(self, call_site: str, model: str, latency: float, usage=None, error: bool = False,
+                ttft: float = None):
+        with self._metrics_lock:
+            stats = self._metrics[call_site]
+            stats['calls'] += 1
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+            if ttft is not None:
+                stats['streams'] += 1
+                stats['total_ttft'] += ttft
+            if error:
+                stats['errors'] += 1
+            if usage is not None:
+                stats['prompt_tokens'] += getattr(usage, 'prompt_tokens', 0) or 0
+                stats['completion_tokens'] += getattr(usage, 'completion_tokens', 0) or 0
+        logger.debug(f"LLM call {call_site} model={model} latency={latency:.2f}s error={error}")
+
+    def _cache_lookup(self, call_site: str, model: str, messages: list, kwargs: dict):
+        options = {key: value for key, value in kwargs.items() if key != 'temperature'}
+        content, tier = self.cache.get(model, messages, kwargs.get('temperature'), options)
+        if content is not None:
+            with self._metrics_lock:
+                self._metrics[call_site]['cache_hits'] += 1
+            logger.info(f"LLM cache {tier} hit for {call_site}")
+        return content
+
+    def _cache_store(self, model: str, messages: list, kwargs: dict, content: str):
+        if content:
+            options = {key: value for key, value in kwargs.items() if key != 'temperature'}
+            self.cache.put(model, messages, content, kwargs.get('temperature'), options)
+
+    @staticmethod
+    def _cached_completion(model: str, content: str) -> ChatCompletion:
+        return ChatCompletion(
+            id='cached',
+            object='chat.completion',
+            created=int(time.time()),
+            model=model,
+            choices=[{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': content}
+            }]
+        )
+
+    def chat_completion(self, call_site: str, model: str, messages: list, cache: bool = False, **kwargs):
+        """
+        同步调用 chat completions 接口
+
+        Args:
+            call_site: 调用位置标识，用于统计指标
+            model: 模型名称
+            messages: 消息列表
+            cache: 是否使用响应缓存，需要全新结果时传 False
+            **kwargs: 透传给 chat.completions.create 的其他参数
+
+        Returns:
+            ChatCompletion: OpenAI 响应对象
+        """
+        use_cache = cache and LLM_CACHE_ENABLED
+        if use_cache:
+            content = self._cache_lookup(call_site, model, messages, kwargs)
+            if content is not None:
+                return self._cached_completion(model, content)
+
+        with self._semaphore(model):
+            start = time.monotonic()
+            try:
+                response = self._create(model, messages=messages, **kwargs)
+            except Exception:
+                self._record(call_site, model, time.monotonic() - start, error=True)
+                raise
+        self._record(call_site, model, time.monotonic() - start, usage=response.usage)
+        if use_cache and response.choices:
+            self._cache_store(model, messages, kwargs, response.choices[0].message.content)
+        return response
+
+    def stream_chat_completion(self, call_site: str, model: str, messages: list, cache: bool = False, **kwargs):
+        """
+        流式调用 chat completions 接口，模型每输出一段文本就产出一段
+
+        参数同 chat_completion，额外统计首个 token 的延迟（ttft）。缓存命中时一次性产出完整内容。
+        """
+        use_cache = cache and LLM_CACHE_ENABLED
+        if use_cache:
+            content = self._cache_lookup(call_site, model, messages, kwargs)
+            if content is not None:
+                yield content
+                return
+
+        parts = []
+        # 限流器只覆盖建立流式请求（429 在此时返回），流式输出期间的并发由模型信号量限制
+        with self._semaphore(model):
+            start = time.monotonic()
+            ttft = None
+            stream = None
+            error = False
+            try:
+                stream = self._create(model, messages=messages, stream=True, **kwargs)
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if ttft is None:
+                            ttft = time.monotonic() - start
+                        parts.append(delta)
+                        yield delta
+            except Exception:
+                error = True
+                raise
+            finally:
+                if stream is not None:
+                    stream.close()
+                # 调用方提前关闭生成器（GeneratorExit）时同样记录本次调用
+                self._record(call_site, model, time.monotonic() - start, error=error, ttft=ttft)
+        if use_cache:
+            self._cache_store(model, messages, kwargs, ''.join(parts))
+
+    def metrics(self) -> dict:
+        """按调用位置汇总的调用指标"""
+        with self._metrics_lock:
+            result = {}
+            for call_site, stats in self._metrics.items():
+                result[call_site] = dict(stats)
+                result[call_site]['avg_latency'] = (stats['total_latency'] / stats['calls']
+                                                    if stats['calls'] else 0.0)
+                result[call_site]['avg_ttft'] = (stats['total_ttft'] / stats['streams']
+                                                 if stats['streams'] else 0.0)
+            return result
+
+
+# Create a global instance
+llm_gateway = LLMGateway.get_instance()
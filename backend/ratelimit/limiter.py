@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from conf import RATE_LIMIT_ENABLED, RATE_LIMITS, RATE_LIMIT_BURST, RATE_LIMIT_CONCURRENCY, RATE_LIMIT_MAX_WAIT
+
+# 与 app.utils.logger 使用同一个 logger，但不导入 app 包，translate、llm 等模块可以单独使用限流器
+logger = logging.getLogger('app')
+
+
+class RateLimitTimeout(Exception):
+    """等待限流配额超时"""
+
+
+def parse_limits(raw: str) -> dict:
+    """解析 "tencent=5,openai=10" 格式的按 provider 配置"""
+    limits = {}
+    for item in (raw or '').split(','):
+        if '=' not in item:
+            continue
+        name, value = item.split('=', 1)
+        try:
+            limits[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"Invalid rate limit setting: {item}")
+    return limits
+
+
+def is_throttle_error(exc: Exception) -> bool:
+    """判断异常是否由对方限流引起（HTTP 429、腾讯云 LimitExceeded、小红书风控等）"""
+    status = getattr(exc, 'status_code', None)
+    response = getattr(exc, 'response', None)
+    if status is None and response is not None:
+        status = getattr(response, 'status_code', None)
+    if status == 429:
+        return True
+    if type(exc).__name__ in ('RateLimitError', 'IPBlockError', 'NeedVerifyError'):
+        return True
+    message = str(exc)
+    return 'LimitExceeded' in message or 'Too Many Requests' in message
+
+
+class TokenBucket:
+    """令牌桶，按 rate 个/秒补充令牌，最多积累 burst 个"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预占一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def refund(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    def drain(self):
+        """清空令牌，被限流后让后续请求重新按速率排队"""
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = time.monotonic()
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 自适应并发上限
+
+    每次成功把上限增加 1/limit（约每一轮并发增加 1），遇到限流错误时减半，
+    上限在 [1, max_limit] 之间变化。
+    """
+
+    def __init__(self, max_limit: int, backoff: float = 0.5):
+        self.max_limit = max(1, int(max_limit))
+        self.limit = float(self.max_limit)
+        self.backoff = backoff
+        self.inflight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float = None) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.inflight < int(self.limit), timeout):
+                return False
+            self.inflight += 1
+            return True
+
+    def cancel(self):
+        """归还未使用的并发额度，不调整上限"""
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify_all()
+
+    def release(self, throttled: bool = False):
+        with self._cond:
+            self.inflight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit * self.backoff)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: float, concurrency: int):
+        self.tokens = TokenBucket(rate, burst) if rate > 0 else None
+        self.concurrency = AdaptiveConcurrency(concurrency) if concurrency > 0 else None
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'timeouts': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0
+        }
+
+
+class RateLimiter:
+    """
+    外部接口的客户端限流
+
+    每个 provider（可再按账号、模型等 key 细分）有独立的令牌桶和自适应并发上限，
+    调用前按速率排队，遇到限流错误时收缩并发并清空令牌，避免错误重试风暴。
+    未在配置中出现的 provider 不做限制。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED, rates: dict = None, bursts: dict = None,
+                 concurrency: dict = None, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.enabled = enabled
+        self.rates = parse_limits(RATE_LIMITS) if rates is None else rates
+        self.bursts = parse_limits(RATE_LIMIT_BURST) if bursts is None else bursts
+        self.concurrency = parse_limits(RATE_LIMIT_CONCURRENCY) if concurrency is None else concurrency
+        self.max_wait = max_wait
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    def _bucket(self, provider: str, key=None):
+        if not self.enabled or (provider not in self.rates and provider not in self.concurrency):
+            return None
+        name = provider if key is None else f'{provider}:{key}'
+        with self._lock:
+            if name not in self._buckets:
+                rate = self.rates.get(provider, 0)
+                self._buckets[name] = _Bucket(rate, self.bursts.get(provider, rate),
+                                              int(self.concurrency.get(provider, 0)))
+            return self._buckets[name]
+
+    def _record_wait(self, bucket: _Bucket, waited: float):
+        with self._lock:
+            bucket.stats['requests'] += 1
+            bucket.stats['total_wait'] += waited
+            bucket.stats['max_wait'] = max(bucket.stats['max_wait'], waited)
+
+    def _on_timeout(self, bucket: _Bucket, provider: str, key):
+        with self._lock:
+            bucket.stats['timeouts'] += 1
+        raise RateLimitTimeout(f"Timed out waiting for {provider} rate limit" + (f" ({key})" if key else ''))
+
+    def _release(self, bucket: _Bucket, exc: Exception = None):
+        throttled = exc is not None and is_throttle_error(exc)
+        if throttled:
+            with self._lock:
+                bucket.stats['throttled'] += 1
+            if bucket.tokens:
+                bucket.tokens.drain()
+            logger.warning(f"Upstream throttled request: {exc}")
+        if bucket.concurrency:
+            bucket.concurrency.release(throttled)
+
+    @contextmanager
+    def limit(self, provider: str, key=None):
+        """
+        在限流配额内执行一次调用
+
+        Args:
+            provider: 接口提供方，例如 tencent、openai、xhs_sign、xhs
+            key: 细分维度，例如账号或模型，不同 key 使用独立的桶
+        """
+        bucket = self._bucket(provider, key)
+        if bucket is None:
+            yield
+            return
+
+        start = time.monotonic()
+        if bucket.concurrency and not bucket.concurrency.acquire(self.max_wait):
+            self._on_timeout(bucket, provider, key)
+        if bucket.tokens:
+            delay = bucket.tokens.reserve()
+            if time.monotonic() - start + delay > self.max_wait:
+                bucket.tokens.refund()
+                if bucket.concurrency:
+                    bucket.concurrency.cancel()
+                self._on_timeout(bucket, provider, key)
+            if delay:
+                time.sleep(delay)
+        self._record_wait(bucket, time.monotonic() - start)
+
+        try:
+            yield
+        except BaseException as e:
+            self._release(bucket, e if isinstance(e, Exception) else None)
+            raise
+        self._release(bucket)
+
+    def metrics(self) -> dict:
+        """按桶汇总的等待时间、限流次数和当前并发上限"""
+        with self._lock:
+            result = {}
+            for name, bucket in self._buckets.items():
+                stats = dict(bucket.stats)
+                stats['avg_wait'] = stats['total_wait'] / stats['requests'] if stats['requests'] else 0.0
+                if bucket.concurrency:
+                    stats['concurrency_limit'] = int(bucket.concurrency.limit)
+                    stats['inflight'] = bucket.concurrency.inflight
+                result[name] = stats
+            return result
+
+
+# Create a global instance
+rate_limiter = RateLimiter.get_instance()
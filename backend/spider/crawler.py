@@ -0,0 +1,131 @@
+import os
+import sys
+import asyncio
+from playwright.async_api import async_playwright
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conf import (
+    IMAGE_DIR, SPIDER_DEDUP_PATH, SPIDER_DEDUP_MAX_DISTANCE, SPIDER_FRONTIER_PATH,
+    SPIDER_CONTEXTS, SPIDER_PAGE_CONCURRENCY, SPIDER_SEEDS
+)
+from spider.pintest_spider import PinterestSpider, new_crawl_context, PENDING_MAX_ATTEMPTS
+from spider.downloader import ImageDownloader
+from spider.dedup import DedupIndex
+from spider.frontier import CrawlFrontier
+
+
+class PinterestCrawler:
+    """
+    多页面并行爬虫
+
+    共用一个 Chromium，创建若干浏览器上下文组成池，N 个页面并发爬取种子列表，
+    滚动中发现的新图片立即进入同一个下载队列，爬取与下载同时进行。
+    """
+
+    def __init__(self, contexts=SPIDER_CONTEXTS, concurrency=SPIDER_PAGE_CONCURRENCY, frontier=None, dedup=None):
+        self.context_count = max(1, contexts)
+        self.concurrency = max(1, concurrency)
+        self.frontier = frontier
+        self.dedup = dedup
+        self.playwright = None
+        self.browser = None
+        self.contexts = []
+        self.downloader = None
+        self.queued_urls = set()  # 本次运行已加入下载队列的原图URL
+        self.results = {}
+
+    async def initialize(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=True)
+        self.contexts = [await new_crawl_context(self.browser) for _ in range(self.context_count)]
+
+    def _on_download_result(self, url, path):
+        if path:
+            self.frontier.mark_done(url)
+        else:
+            self.frontier.mark_failed(url)
+
+    def enqueue_images(self, seed, img_urls):
+        """把新发现的图片转换为原图URL并加入下载队列"""
+        original_urls = {PinterestSpider.convert_to_original_url(url) for url in img_urls}
+        original_urls.discard(None)
+        original_urls -= self.queued_urls
+        if not original_urls:
+            return
+        if self.frontier:
+            self.frontier.add_pending(seed, original_urls)
+        for url in original_urls:
+            self.downloader.submit(url)
+        self.queued_urls.update(original_urls)
+
+    async def _page_worker(self, index, seeds, scroll_times):
+        # 页面按顺序分配到各个上下文，同一上下文可以承载多个页面
+        context = self.contexts[index % len(self.contexts)]
+        page = await context.new_page()
+        spider = PinterestSpider(frontier=self.frontier, page=page, on_new_images=self.enqueue_images)
+        try:
+            while True:
+                try:
+                    seed = seeds.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    found = await spider.crawl_seed(seed, scroll_times)
+                    self.results[seed] = len(found)
+                except Exception as e:
+                    print(f"爬取失败: {str(e)}, 页面: {seed}")
+                    self.results[seed] = None
+        finally:
+            await page.close()
+
+    async def crawl(self, seed_urls, scroll_times=5):
+        """并发爬取所有种子页面并下载新图片，返回 {种子: 新图片数量}"""
+        seeds = asyncio.Queue()
+        for url in dict.fromkeys(seed_urls):
+            seeds.put_nowait(url)
+
+        on_result = self._on_download_result if self.frontier else None
+        async with ImageDownloader(IMAGE_DIR, dedup=self.dedup, on_result=on_result) as downloader:
+            self.downloader = downloader
+            # 先继续上次未完成的下载
+            if self.frontier:
+                for url in self.frontier.pending_urls(max_attempts=PENDING_MAX_ATTEMPTS):
+                    downloader.submit(url)
+                    self.queued_urls.add(url)
+
+            workers = min(self.concurrency, seeds.qsize())
+            await asyncio.gather(*[self._page_worker(i, seeds, scroll_times) for i in range(workers)])
+            print(f"页面爬取完成，等待剩余 {downloader.queue.qsize()} 个下载")
+            await downloader.join()
+        return self.results
+
+    async def cleanup(self):
+        for context in self.contexts:
+            await context.close()
+        self.contexts = []
+        if self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
+
+
+async def main(seed_urls):
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+
+    frontier = CrawlFrontier(SPIDER_FRONTIER_PATH) if SPIDER_FRONTIER_PATH else None
+    dedup = DedupIndex(SPIDER_DEDUP_PATH, SPIDER_DEDUP_MAX_DISTANCE) if SPIDER_DEDUP_PATH else None
+    crawler = PinterestCrawler(frontier=frontier, dedup=dedup)
+    await crawler.initialize()
+    try:
+        results = await crawler.crawl(seed_urls, scroll_times=4)
+        print(f"爬取结果: {results}")
+    finally:
+        await crawler.cleanup()
+        if frontier:
+            frontier.close()
+        if dedup:
+            dedup.close()
+
+if __name__ == "__main__":
+    # 种子页面可以通过命令行参数传入，否则使用 SPIDER_SEEDS 配置
+    seeds = sys.argv[1:] or [url.strip() for url in SPIDER_SEEDS.split(',') if url.strip()]
+    asyncio.run(main(seeds))
@@ -0,0 +1,344 @@
+import os
+import io
+import re
+import sys
+import json
+import math
+import sqlite3
+import tarfile
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conf import (
+    IMAGE_DIR, DATASET_DIR, DATASET_RESOLUTION, DATASET_MIN_SIZE, DATASET_SHARD_SIZE,
+    DATASET_WORKERS, DATASET_CAPTION
+)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+BUCKET_STEP = 64
+
+
+def make_buckets(resolution, step=BUCKET_STEP):
+    """生成面积不超过 resolution² 、边长为 step 倍数、宽高比在 1:2 到 2:1 之间的分桶尺寸"""
+    buckets = set()
+    for width in range(resolution // 2, resolution * 2 + 1, step):
+        height = (resolution * resolution // width) // step * step
+        if height and 0.5 <= width / height <= 2:
+            buckets.add((width, height))
+            buckets.add((height, width))
+    return sorted(buckets)
+
+
+def choose_bucket(width, height, buckets):
+    """选择宽高比最接近的分桶"""
+    ratio = math.log(width / height)
+    return min(buckets, key=lambda bucket: abs(ratio - math.log(bucket[0] / bucket[1])))
+
+
+def sample_key(file_name):
+    """
+    WebDataset 以第一个点之前的部分作为样本 key，这里把点等特殊字符替换为下划线
+
+    保留扩展名（a.jpg -> a_jpg），同名不同格式的原图不会得到相同的 key
+    """
+    return re.sub(r'[^0-9A-Za-z_-]', '_', file_name)
+
+
+def read_caption(source_path, prefix=''):
+    """原图旁有同名 .txt（如人工标注）时作为描述，prefix 为 LoRA 触发词等固定前缀"""
+    caption = ''
+    caption_path = os.path.splitext(source_path)[0] + '.txt'
+    if os.path.exists(caption_path):
+        with open(caption_path, 'r', encoding='utf-8') as f:
+            caption = f.read().strip()
+    return ', '.join(part for part in (prefix.strip(), caption) if part)
+
+
+def process_image(task):
+    """
+    在子进程中处理单张图片：按分桶缩放并居中裁剪，写出训练图片和描述文件
+
+    Args:
+        task: (原图路径, 输出目录, 分桶列表, 最小边长, 描述前缀)
+
+    Returns:
+        dict: 处理结果，失败或被跳过时包含 error
+    """
+    source_path, output_dir, buckets, min_size, caption_prefix = task
+    key = sample_key(os.path.basename(source_path))
+    try:
+        with Image.open(source_path) as img:
+            img = img.convert('RGB')
+            width, height = img.size
+            if min(width, height) < min_size:
+                return {'source': source_path, 'key': key, 'error': f'too small: {width}x{height}'}
+
+            bucket = choose_bucket(width, height, buckets)
+            scale = max(bucket[0] / width, bucket[1] / height)
+            resized = img.resize((max(bucket[0], round(width * scale)), max(bucket[1], round(height * scale))),
+                                 Image.LANCZOS)
+            left = (resized.width - bucket[0]) // 2
+            top = (resized.height - bucket[1]) // 2
+            resized = resized.crop((left, top, left + bucket[0], top + bucket[1]))
+
+        bucket_dir = os.path.join(output_dir, 'images', f'{bucket[0]}x{bucket[1]}')
+        os.makedirs(bucket_dir, exist_ok=True)
+        image_path = os.path.join(bucket_dir, f'{key}.jpg')
+        buffer = io.BytesIO()
+        resized.save(buffer, 'JPEG', quality=95)
+        # 先写临时文件再重命名，中断时不会留下损坏的训练图片
+        with open(image_path + '.part', 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(image_path + '.part', image_path)
+
+        caption = read_caption(source_path, caption_prefix)
+        caption_path = os.path.join(bucket_dir, f'{key}.txt')
+        with open(caption_path, 'w', encoding='utf-8') as f:
+            f.write(caption)
+
+        return {
+            'source': source_path,
+            'key': key,
+            'bucket': f'{bucket[0]}x{bucket[1]}',
+            'original_size': [width, height],
+            'image_path': image_path,
+            'caption_path': caption_path
+        }
+    except Exception as e:
+        return {'source': source_path, 'key': key, 'error': str(e)}
+
+
+def read_shard_keys(path):
+    """
+    读取已有分片中完整写入的样本 key，返回 (key 集合, 最后一个完整样本的结束位置)
+
+    每个样本最后写入 .json，只有 .json 已写入的样本才算完整。中断时写了一半的样本在结束位置之后。
+    """
+    keys, end = set(), 0
+    try:
+        with tarfile.open(path, 'r') as tar:
+            for member in tar:
+                if member.name.endswith('.json'):
+                    keys.add(member.name[:-len('.json')])
+                    end = member.offset_data + math.ceil(member.size / tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+    except tarfile.ReadError:
+        # 最后一个成员被截断，之前完整的部分已读取
+        pass
+    return keys, end
+
+
+class ShardWriter:
+    """
+    按样本数切分的 WebDataset tar 分片，上次未写满的分片会继续追加
+
+    继续追加前会读取分片中已有的样本：manifest.db 尚未记录的样本不会重复写入，
+    中断时写了一半的样本被截掉。
+    """
+
+    def __init__(self, shard_dir, shard_size, last_shard=None, last_count=0):
+        self.shard_dir = shard_dir
+        self.shard_size = max(1, shard_size)
+        os.makedirs(shard_dir, exist_ok=True)
+        self.index = last_shard if last_shard is not None else -1
+        self.count = last_count if last_shard is not None else self.shard_size
+        self.tar = None
+        self.written = {}  # 本次运行打开过的分片中的样本：key -> 分片名
+
+    @property
+    def shard_name(self):
+        return f'shard-{self.index:06d}.tar'
+
+    def _open(self):
+        if self.tar is not None and self.count < self.shard_size:
+            return
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+        while True:
+            if self.count >= self.shard_size:
+                self.index += 1
+                self.count = 0
+            path = os.path.join(self.shard_dir, self.shard_name)
+            if not os.path.exists(path):
+                self.tar = tarfile.open(path, 'w')
+                return
+            keys, end = read_shard_keys(path)
+            self.written.update((key, self.shard_name) for key in keys)
+            self.count = max(self.count, len(keys))
+            if end:
+                # 截掉写了一半的样本并补上 tar 结束标记，追加模式要求已有内容是完整的 tar
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+                    f.seek(end)
+                    f.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+            self.tar = tarfile.open(path, 'a' if end else 'w')
+            if self.count < self.shard_size:
+                return
+            self.tar.close()
+            self.tar = None
+
+    def add(self, key, image_path, caption_path, metadata):
+        self._open()
+        if key in self.written:
+            # 上次运行已写入分片，但 manifest.db 还没来得及提交
+            return self.written[key]
+        self.tar.add(image_path, arcname=f'{key}.jpg')
+        self.tar.add(caption_path, arcname=f'{key}.txt')
+        data = json.dumps(metadata, ensure_ascii=False).encode('utf-8')
+        info = tarfile.TarInfo(f'{key}.json')
+        info.size = len(data)
+        info.mtime = int(datetime.now(timezone.utc).timestamp())
+        self.tar.addfile(info, io.BytesIO(data))
+        self.written[key] = self.shard_name
+        self.count += 1
+        return self.shard_name
+
+    def flush(self):
+        """把已写入的样本刷到磁盘，manifest.db 提交前调用，保证其中记录的样本都已在分片中"""
+        if self.tar is not None:
+            self.tar.fileobj.flush()
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+
+class DatasetExporter:
+    """
+    把爬虫下载的原图整理成训练数据集
+
+    原图经进程池按宽高比分桶缩放裁剪，输出 images/<宽>x<高>/<key>.jpg 及同名 .txt 描述，
+    同时打包为 WebDataset 格式的 tar 分片（每个样本含 .jpg/.txt/.json）并生成 index.json。
+    manifest.db 记录已处理的原图，重复运行时只处理新增的文件。
+    """
+
+    def __init__(self, source_dir=IMAGE_DIR, output_dir=DATASET_DIR, resolution=DATASET_RESOLUTION,
+                 min_size=DATASET_MIN_SIZE, shard_size=DATASET_SHARD_SIZE, workers=DATASET_WORKERS,
+                 caption_prefix=DATASET_CAPTION):
+        self.source_dir = source_dir
+        self.output_dir = output_dir
+        self.buckets = make_buckets(resolution)
+        self.min_size = min_size
+        self.shard_size = shard_size
+        self.workers = workers or os.cpu_count()
+        self.caption_prefix = caption_prefix
+        os.makedirs(output_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(output_dir, 'manifest.db'))
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS samples ('
+            ' source TEXT PRIMARY KEY,'
+            ' size INTEGER NOT NULL,'
+            ' mtime REAL NOT NULL,'
+            ' key TEXT,'
+            ' bucket TEXT,'
+            ' shard TEXT,'
+            ' error TEXT,'
+            ' processed_at TEXT NOT NULL)'
+        )
+        self.conn.commit()
+
+    def find_new_images(self):
+        """找出尚未处理的原图（Pinterest 原图以内容哈希命名，处理过的文件不会再变化）"""
+        processed = {row[0] for row in self.conn.execute('SELECT source FROM samples')}
+        new_images = []
+        with os.scandir(self.source_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                if entry.name not in processed:
+                    stat = entry.stat()
+                    new_images.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(new_images)
+
+    def _last_shard(self):
+        row = self.conn.execute(
+            'SELECT shard, COUNT(*) FROM samples WHERE shard IS NOT NULL GROUP BY shard ORDER BY shard DESC LIMIT 1'
+        ).fetchone()
+        if not row:
+            return None, 0
+        return int(re.search(r'(\d+)', row[0]).group(1)), row[1]
+
+    def export(self):
+        new_images = self.find_new_images()
+        print(f"发现 {len(new_images)} 张新图片，使用 {self.workers} 个进程处理")
+        if not new_images:
+            self.write_index()
+            return {'processed': 0, 'skipped': 0}
+
+        last_shard, last_count = self._last_shard()
+        writer = ShardWriter(os.path.join(self.output_dir, 'shards'), self.shard_size, last_shard, last_count)
+        stats = {'processed': 0, 'skipped': 0}
+        file_info = {path: (size, mtime) for path, size, mtime in new_images}
+        tasks = [(path, self.output_dir, self.buckets, self.min_size, self.caption_prefix) for path, _, _ in new_images]
+        now = datetime.now(timezone.utc).isoformat()
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                for done, result in enumerate(executor.map(process_image, tasks, chunksize=16), 1):
+                    size, mtime = file_info[result['source']]
+                    shard = None
+                    if 'error' in result:
+                        stats['skipped'] += 1
+                    else:
+                        shard = writer.add(result['key'], result['image_path'], result['caption_path'], {
+                            'source': os.path.basename(result['source']),
+                            'bucket': result['bucket'],
+                            'original_size': result['original_size']
+                        })
+                        stats['processed'] += 1
+                    self.conn.execute(
+                        'INSERT OR REPLACE INTO samples (source, size, mtime, key, bucket, shard, error, processed_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (os.path.basename(result['source']), size, mtime, result['key'], result.get('bucket'),
+                         shard, result.get('error'), now)
+                    )
+                    if done % 100 == 0:
+                        writer.flush()
+                        self.conn.commit()
+                        print(f"处理进度: {done}/{len(tasks)}")
+        finally:
+            writer.close()
+            self.conn.commit()
+
+        self.write_index()
+        print(f"处理完成: 成功 {stats['processed']}，跳过 {stats['skipped']}")
+        return stats
+
+    def write_index(self):
+        """写出分片索引，训练任务据此选择分片和分桶"""
+        shards = [
+            {'name': shard, 'samples': count,
+             'size': os.path.getsize(os.path.join(self.output_dir, 'shards', shard))}
+            for shard, count in self.conn.execute(
+                'SELECT shard, COUNT(*) FROM samples WHERE shard IS NOT NULL GROUP BY shard ORDER BY shard'
+            )
+        ]
+        buckets = dict(self.conn.execute(
+            'SELECT bucket, COUNT(*) FROM samples WHERE bucket IS NOT NULL GROUP BY bucket ORDER BY bucket'
+        ).fetchall())
+        index = {
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+            'total_samples': sum(shard['samples'] for shard in shards),
+            'shards': shards,
+            'buckets': buckets
+        }
+        with open(os.path.join(self.output_dir, 'index.json.part'), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(os.path.join(self.output_dir, 'index.json.part'), os.path.join(self.output_dir, 'index.json'))
+        return index
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    exporter = DatasetExporter()
+    try:
+        exporter.export()
+    finally:
+        exporter.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import os
+import sqlite3
+from datetime import datetime, timezone
+from PIL import Image
+
+# dHash 按 16 位分成 4 段建索引，汉明距离不超过 3 的两张图至少有一段完全相同
+DHASH_BANDS = 4
+MAX_INDEXED_DISTANCE = DHASH_BANDS - 1
+
+
+def dhash(path, size=8):
+    """计算图片的差值哈希（64 位），缩放、压缩后的同一张图哈希值接近"""
+    with Image.open(path) as img:
+        pixels = list(img.convert('L').resize((size + 1, size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _bands(value):
+    return [(value >> (16 * i)) & 0xFFFF for i in range(DHASH_BANDS)]
+
+
+class DedupIndex:
+    """
+    爬虫下载的去重索引（SQLite）
+
+    urls 表记录 URL -> sha256，files 表记录 sha256 -> 文件路径及 dHash。
+    下载前按 URL 查询，下载后按内容哈希查询，开启感知哈希时再按 dHash 查找相似图片。
+    """
+
+    def __init__(self, path, max_distance=MAX_INDEXED_DISTANCE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_distance = min(max_distance, MAX_INDEXED_DISTANCE)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(
+            'CREATE TABLE IF NOT EXISTS urls ('
+            ' url TEXT PRIMARY KEY,'
+            ' sha256 TEXT NOT NULL,'
+            ' created_at TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS files ('
+            ' sha256 TEXT PRIMARY KEY,'
+            ' path TEXT NOT NULL,'
+            ' size INTEGER,'
+            ' dhash TEXT,'
+            ' band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,'
+            ' created_at TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS ix_files_band0 ON files (band0);'
+            'CREATE INDEX IF NOT EXISTS ix_files_band1 ON files (band1);'
+            'CREATE INDEX IF NOT EXISTS ix_files_band2 ON files (band2);'
+            'CREATE INDEX IF NOT EXISTS ix_files_band3 ON files (band3);'
+        )
+        self.conn.commit()
+
+    def lookup_url(self, url):
+        """URL 已下载过且文件仍存在时返回文件路径"""
+        row = self.conn.execute(
+            'SELECT f.path FROM urls u JOIN files f ON f.sha256 = u.sha256 WHERE u.url = ?', (url,)
+        ).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+
+    def lookup_hash(self, sha256):
+        row = self.conn.execute('SELECT path FROM files WHERE sha256 = ?', (sha256,)).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+
+    def find_similar(self, value):
+        """查找 dHash 汉明距离在阈值内的已有图片，返回 (sha256, 路径)"""
+        bands = _bands(value)
+        rows = self.conn.execute(
+            'SELECT sha256, path, dhash FROM files WHERE dhash IS NOT NULL AND '
+            '(band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)', bands
+        ).fetchall()
+        best = None
+        for sha256, path, other in rows:
+            distance = bin(value ^ int(other, 16)).count('1')
+            if distance <= self.max_distance and os.path.exists(path):
+                if best is None or distance < best[0]:
+                    best = (distance, sha256, path)
+        return best[1:] if best else None
+
+    def add_file(self, sha256, path, size=None, dhash_value=None):
+        now = datetime.now(timezone.utc).isoformat()
+        bands = _bands(dhash_value) if dhash_value is not None else [None] * DHASH_BANDS
+        self.conn.execute(
+            'INSERT OR REPLACE INTO files (sha256, path, size, dhash, band0, band1, band2, band3, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [sha256, path, size, f'{dhash_value:016x}' if dhash_value is not None else None, *bands, now]
+        )
+        self.conn.commit()
+
+    def add_url(self, url, sha256):
+        now = datetime.now(timezone.utc).isoformat()
+        self.conn.execute('INSERT OR REPLACE INTO urls (url, sha256, created_at) VALUES (?, ?, ?)',
+                          (url, sha256, now))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import hashlib
+import tempfile
+import aiohttp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conf import (
+    IMAGE_DIR, SPIDER_DOWNLOAD_CONCURRENCY, SPIDER_DOWNLOAD_PER_HOST,
+    SPIDER_DOWNLOAD_RETRIES, SPIDER_DOWNLOAD_TIMEOUT, SPIDER_DEDUP_PERCEPTUAL
+)
+from spider.dedup import dhash
+
+# 这些状态码通常是临时性的，值得重试
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class ImageDownloader:
+    """
+    异步图片下载器
+
+    所有请求共享一个带连接池的 aiohttp 会话，按主机限制并发连接数；
+    响应分块写入同目录的临时文件，完成后原子重命名，中断时不会留下半个文件。
+    传入 dedup 索引时，下载前按 URL、下载后按内容哈希（及可选的 dHash）跳过重复图片。
+    使用方式：
+
+        async with ImageDownloader() as downloader:
+            downloader.submit(url)
+            await downloader.join()
+    """
+
+    def __init__(self, dest_dir=IMAGE_DIR, concurrency=SPIDER_DOWNLOAD_CONCURRENCY,
+                 per_host=SPIDER_DOWNLOAD_PER_HOST, retries=SPIDER_DOWNLOAD_RETRIES,
+                 timeout=SPIDER_DOWNLOAD_TIMEOUT, progress_every=50, dedup=None,
+                 perceptual=SPIDER_DEDUP_PERCEPTUAL, on_result=None):
+        self.dest_dir = dest_dir
+        # 每个 URL 处理完成后回调 on_result(url, path)，失败时 path 为 None
+        self.on_result = on_result
+        self.dedup = dedup
+        self.perceptual = perceptual
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.retries = retries
+        self.timeout = timeout
+        self.progress_every = progress_every
+        self.session = None
+        self.queue = None
+        self.workers = []
+        self.started_at = None
+        self.stats = {
+            'queued': 0,
+            'downloaded': 0,
+            'skipped': 0,
+            'duplicates': 0,
+            'failed': 0,
+            'retries': 0,
+            'bytes': 0
+        }
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        os.makedirs(self.dest_dir, exist_ok=True)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': 'Mozilla/5.0'}
+        )
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self.started_at = time.monotonic()
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    def submit(self, url, file_name=None):
+        """加入下载队列，file_name 默认取 URL 最后一段"""
+        self.stats['queued'] += 1
+        self.queue.put_nowait((url, file_name or url.split('/')[-1]))
+
+    async def join(self):
+        """等待队列中的下载全部完成"""
+        await self.queue.join()
+        self.print_progress()
+
+    async def download_all(self, urls):
+        for url in urls:
+            self.submit(url)
+        await self.join()
+        return self.stats
+
+    async def _worker(self):
+        while True:
+            url, file_name = await self.queue.get()
+            try:
+                try:
+                    path = await self.download(url, file_name)
+                except Exception as e:
+                    # 未预料的异常不能让 worker 退出，否则 queue.join() 会一直等待
+                    print(f"下载图片出错: {str(e)}, URL: {url}")
+                    self.stats['failed'] += 1
+                    path = None
+                if self.on_result:
+                    try:
+                        self.on_result(url, path)
+                    except Exception as e:
+                        print(f"处理下载结果出错: {str(e)}, URL: {url}")
+            finally:
+                self.queue.task_done()
+
+    async def download(self, url, file_name):
+        """下载单个图片，返回保存路径，失败返回 None"""
+        file_path = os.path.join(self.dest_dir, file_name)
+        existing = self.dedup.lookup_url(url) if self.dedup else None
+        if existing or os.path.exists(file_path):
+            self.stats['skipped'] += 1
+            return existing or file_path
+
+        for attempt in range(self.retries + 1):
+            try:
+                saved_path = await self._fetch(url, file_path)
+                self._maybe_print_progress()
+                return saved_path
+            except (aiohttp.ClientError, asyncio.TimeoutError, DownloadError) as e:
+                retryable = getattr(e, 'retryable', True)
+                if not retryable or attempt >= self.retries:
+                    print(f"下载图片失败: {str(e)}, URL: {url}")
+                    break
+                self.stats['retries'] += 1
+                # 指数退避加随机抖动，避免同时重试
+                await asyncio.sleep(2 ** attempt + random.random())
+
+        self.stats['failed'] += 1
+        self._maybe_print_progress()
+        return None
+
+    async def _fetch(self, url, file_path):
+        async with self.session.get(url) as response:
+            if response.status != 200:
+                raise DownloadError(f"状态码: {response.status}", retryable=response.status in RETRY_STATUS)
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.dest_dir, suffix='.part')
+            size = 0
+            digest = hashlib.sha256()
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                self.stats['bytes'] += size
+                return await self._store(url, tmp_path, file_path, digest.hexdigest(), size)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    async def _store(self, url, tmp_path, file_path, sha256, size):
+        """下载完成后按内容去重，重复时丢弃临时文件并返回已有文件路径"""
+        existing, dhash_value = None, None
+        if self.dedup:
+            existing = self.dedup.lookup_hash(sha256)
+            if existing is None and self.perceptual:
+                try:
+                    # 解码图片是 CPU 密集操作，放到线程池中执行
+                    dhash_value = await asyncio.get_running_loop().run_in_executor(None, dhash, tmp_path)
+                except Exception as e:
+                    print(f"计算感知哈希失败: {str(e)}, URL: {url}")
+                else:
+                    similar = self.dedup.find_similar(dhash_value)
+                    if similar:
+                        sha256, existing = similar
+
+        if existing:
+            os.remove(tmp_path)
+            self.dedup.add_url(url, sha256)
+            self.stats['duplicates'] += 1
+            return existing
+
+        os.replace(tmp_path, file_path)
+        if self.dedup:
+            self.dedup.add_file(sha256, file_path, size, dhash_value)
+            self.dedup.add_url(url, sha256)
+        self.stats['downloaded'] += 1
+        return file_path
+
+    def _maybe_print_progress(self):
+        done = self.stats['downloaded'] + self.stats['duplicates'] + self.stats['failed']
+        if self.progress_every and done % self.progress_every == 0:
+            self.print_progress()
+
+    def progress(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            **self.stats,
+            'pending': self.queue.qsize() if self.queue else 0,
+            'elapsed': round(elapsed, 2),
+            'files_per_second': round(self.stats['downloaded'] / elapsed, 2) if elapsed else 0.0,
+            'mb_per_second': round(self.stats['bytes'] / 1024 / 1024 / elapsed, 2) if elapsed else 0.0
+        }
+
+    def print_progress(self):
+        p = self.progress()
+        print(f"下载进度: 成功 {p['downloaded']}，跳过 {p['skipped']}，重复 {p['duplicates']}，失败 {p['failed']}，"
+              f"排队 {p['pending']}，重试 {p['retries']}，{p['files_per_second']} 张/秒，{p['mb_per_second']} MB/秒")
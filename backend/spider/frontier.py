@@ -0,0 +1,134 @@
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class CrawlFrontier:
+    """
+    持久化的爬取状态（SQLite）
+
+    - seen: 历次爬取见过的图片 URL，增量模式下滚动到已见过的图片即可停止
+    - pending: 已发现但尚未下载完成的原图 URL，崩溃重启后继续下载
+    - cursors: 每个种子页面（画板）的爬取进度，记录上次滚动到的深度及是否完整爬完
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(
+            'CREATE TABLE IF NOT EXISTS seen ('
+            ' url TEXT PRIMARY KEY,'
+            ' seed TEXT,'
+            ' first_seen TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS pending ('
+            ' url TEXT PRIMARY KEY,'
+            ' seed TEXT,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' added_at TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS cursors ('
+            ' seed TEXT PRIMARY KEY,'
+            ' depth INTEGER NOT NULL DEFAULT 0,'
+            ' complete INTEGER NOT NULL DEFAULT 0,'
+            ' total_seen INTEGER NOT NULL DEFAULT 0,'
+            ' started_at TEXT,'
+            ' finished_at TEXT);'
+        )
+        self.conn.commit()
+
+    def add_seen(self, seed, urls, to_pending=None):
+        """
+        记录本次发现的图片 URL，返回其中以前从未见过的部分
+
+        传入 to_pending(url) 时，新图片转换后的下载地址在同一事务中加入待下载队列，
+        避免中途退出后图片已标记为见过、却没有进入待下载队列
+        """
+        urls = list(urls)
+        if not urls:
+            return set()
+        known = set()
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            rows = self.conn.execute(
+                f'SELECT url FROM seen WHERE url IN ({",".join("?" * len(chunk))})', chunk
+            ).fetchall()
+            known.update(row[0] for row in rows)
+        unseen = set(urls) - known
+        now = _now()
+        self.conn.executemany('INSERT OR IGNORE INTO seen (url, seed, first_seen) VALUES (?, ?, ?)',
+                              [(url, seed, now) for url in unseen])
+        if to_pending:
+            pending = {to_pending(url) for url in unseen}
+            pending.discard(None)
+            self.conn.executemany('INSERT OR IGNORE INTO pending (url, seed, added_at) VALUES (?, ?, ?)',
+                                  [(url, seed, now) for url in pending])
+        self.conn.execute('UPDATE cursors SET total_seen = total_seen + ? WHERE seed = ?', (len(unseen), seed))
+        self.conn.commit()
+        return unseen
+
+    def add_pending(self, seed, urls):
+        now = _now()
+        self.conn.executemany('INSERT OR IGNORE INTO pending (url, seed, added_at) VALUES (?, ?, ?)',
+                              [(url, seed, now) for url in urls])
+        self.conn.commit()
+
+    def pending_urls(self, max_attempts=None):
+        """待下载的 URL，包括上次运行中断或失败留下的"""
+        if max_attempts is None:
+            rows = self.conn.execute('SELECT url FROM pending ORDER BY added_at').fetchall()
+        else:
+            rows = self.conn.execute('SELECT url FROM pending WHERE attempts < ? ORDER BY added_at',
+                                     (max_attempts,)).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_done(self, url):
+        self.conn.execute('DELETE FROM pending WHERE url = ?', (url,))
+        self.conn.commit()
+
+    def mark_failed(self, url):
+        self.conn.execute('UPDATE pending SET attempts = attempts + 1 WHERE url = ?', (url,))
+        self.conn.commit()
+
+    def get_cursor(self, seed):
+        row = self.conn.execute(
+            'SELECT depth, complete, total_seen, started_at, finished_at FROM cursors WHERE seed = ?', (seed,)
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            'depth': row[0],
+            'complete': bool(row[1]),
+            'total_seen': row[2],
+            'started_at': row[3],
+            'finished_at': row[4]
+        }
+
+    def start_seed(self, seed):
+        self.conn.execute(
+            'INSERT INTO cursors (seed, started_at) VALUES (?, ?) '
+            'ON CONFLICT(seed) DO UPDATE SET started_at = excluded.started_at, finished_at = NULL',
+            (seed, _now())
+        )
+        self.conn.commit()
+
+    def update_depth(self, seed, depth):
+        """记录滚动深度，只增不减，用于中断后判断上次爬到了哪里"""
+        self.conn.execute('UPDATE cursors SET depth = MAX(depth, ?) WHERE seed = ?', (depth, seed))
+        self.conn.commit()
+
+    def finish_seed(self, seed, complete):
+        """complete 表示这次滚动到了页面底部，之后的爬取只需要增量进行"""
+        self.conn.execute(
+            'UPDATE cursors SET finished_at = ?, complete = MAX(complete, ?) WHERE seed = ?',
+            (_now(), int(complete), seed)
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -1,79 +1,168 @@
 import os
 import time
 import asyncio
-import requests
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import sys
 import re
-from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from conf import IMAGE_DIR
+from conf import (
+    IMAGE_DIR, SPIDER_DEDUP_PATH, SPIDER_DEDUP_MAX_DISTANCE, SPIDER_FRONTIER_PATH,
+    SPIDER_INCREMENTAL, SPIDER_INCREMENTAL_PATIENCE, SPIDER_SCROLL_WAIT_MS, SPIDER_NETWORK_IDLE_MS
+)
+from spider.downloader import ImageDownloader
+from spider.dedup import DedupIndex
+from spider.frontier import CrawlFrontier
+
+# 下载失败超过该次数的 URL 不再重试
+PENDING_MAX_ATTEMPTS = 5
+# 只需要 img 的 src 属性，不加载图片、字体和媒体资源以减少渲染开销
+BLOCKED_RESOURCE_TYPES = {'image', 'font', 'media'}
+# 瀑布流中图片的选择器
+IMAGE_SELECTOR = 'img.hCL.kVc.L4E.MIw'
+
+# 在页面中安装 MutationObserver，把新出现（或 src 变化）的图片 URL 放入 window.__pinQueue，
+# 安装时页面上已有的图片也会放入队列
+INSTALL_IMAGE_OBSERVER_JS = """
+(selector) => {
+    if (window.__pinQueue) return;
+    const seen = new Set();
+    window.__pinQueue = [];
+    const push = (img) => {
+        const src = img.getAttribute('src');
+        if (src && src.includes('i.pinimg.com') && !seen.has(src)) {
+            seen.add(src);
+            window.__pinQueue.push(src);
+        }
+    };
+    document.querySelectorAll(selector).forEach(push);
+    new MutationObserver((mutations) => {
+        for (const mutation of mutations) {
+            if (mutation.type === 'attributes') {
+                if (mutation.target.matches(selector)) push(mutation.target);
+                continue;
+            }
+            for (const node of mutation.addedNodes) {
+                if (node.nodeType !== Node.ELEMENT_NODE) continue;
+                if (node.matches(selector)) push(node);
+                node.querySelectorAll(selector).forEach(push);
+            }
+        }
+    }).observe(document.body, {childList: true, subtree: true, attributes: true, attributeFilter: ['src']});
+}
+"""
+# 取出并清空队列中的图片 URL
+DRAIN_IMAGE_QUEUE_JS = '() => window.__pinQueue ? window.__pinQueue.splice(0) : []'
+HAS_NEW_IMAGES_JS = '() => window.__pinQueue && window.__pinQueue.length > 0'
+
+async def _block_heavy_resources(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def new_crawl_context(browser):
+    """创建屏蔽图片、字体和媒体请求的浏览器上下文"""
+    context = await browser.new_context()
+    await context.route('**/*', _block_heavy_resources)
+    return context
 
 class PinterestSpider:
-    def __init__(self):
+    def __init__(self, frontier=None, incremental=SPIDER_INCREMENTAL, page=None, on_new_images=None):
         self.playwright = None
         self.browser = None
         self.context = None
-        self.page = None
+        self.page = page  # 由 PinterestCrawler 统一管理浏览器时传入
         self.all_image_urls = set()  # 存储所有发现的图片URL
+        self.frontier = frontier  # 持久化的爬取状态，为空时每次从头爬取
+        self.incremental = incremental
+        self.seed = None  # 当前爬取的页面
+        self.cursor = None  # 当前页面上次爬取的进度
+        self.unseen_image_urls = set()  # 历次爬取中从未见过的图片URL
+        # 每次发现新图片时回调 on_new_images(seed, urls)，用于边滚动边下载
+        self.on_new_images = on_new_images
         
     async def initialize(self):
         """初始化 Playwright"""
         self.playwright = await async_playwright().start()
         self.browser = await self.playwright.chromium.launch(headless=True)
-        self.context = await self.browser.new_context()
+        self.context = await new_crawl_context(self.browser)
         self.page = await self.context.new_page()
 
     async def collect_current_images(self):
-        """收集当前页面上的图片"""
-        new_images = await self.page.query_selector_all('img.hCL.kVc.L4E.MIw')
-        new_urls = set()
-        for img in new_images:
-            src = await img.get_attribute('src')
-            if src and 'i.pinimg.com' in src:
-                new_urls.add(src)
+        """收集观察器记录的新图片，不再每次遍历页面上的全部图片"""
+        new_urls = set(await self.page.evaluate(DRAIN_IMAGE_QUEUE_JS))
         
         # 计算新增的URL数量
-        new_added = len(new_urls - self.all_image_urls)
-        self.all_image_urls.update(new_urls)
+        added_urls = new_urls - self.all_image_urls
+        self.all_image_urls.update(added_urls)
+        if self.frontier:
+            unseen_urls = self.frontier.add_seen(self.seed, added_urls, to_pending=self.convert_to_original_url)
+        else:
+            unseen_urls = added_urls
+        self.unseen_image_urls.update(unseen_urls)
+        if self.on_new_images and unseen_urls:
+            self.on_new_images(self.seed, unseen_urls)
         
-        return new_added
+        return len(added_urls)
+
+    async def wait_for_new_images(self):
+        """等待观察器发现新图片，最多等待 SPIDER_SCROLL_WAIT_MS，超时后再短暂等待网络空闲"""
+        try:
+            await self.page.wait_for_function(HAS_NEW_IMAGES_JS, timeout=SPIDER_SCROLL_WAIT_MS)
+        except PlaywrightTimeoutError:
+            try:
+                await self.page.wait_for_load_state('networkidle', timeout=SPIDER_NETWORK_IDLE_MS)
+            except PlaywrightTimeoutError:
+                pass
 
     async def auto_scroll(self, scroll_times=5):
-        """自动滚动页面指定次数"""
+        """自动滚动页面指定次数，滚动到页面底部或增量模式下后面只剩已见过的图片时返回 True"""
         last_height = await self.page.evaluate('document.body.scrollHeight')
         no_new_images_count = 0  # 连续没有新图片的次数
+        no_unseen_count = 0  # 连续只有已见过图片的次数
+        cursor = self.cursor
         
         for i in range(scroll_times):
+            unseen_before = len(self.unseen_image_urls)
             # 滚动到页面底部
             await self.page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
             print(f"第 {i+1}/{scroll_times} 次滚动")
             
             # 等待新内容加载
-            await self.page.wait_for_timeout(2000)
+            await self.wait_for_new_images()
             
             # 收集新图片
             new_images_count = await self.collect_current_images()
             print(f"本次滚动新增 {new_images_count} 张图片，当前总共 {len(self.all_image_urls)} 张")
+            if self.frontier:
+                self.frontier.update_depth(self.seed, i + 1)
             
-            # 检查是否有新内容加载
-            new_height = await self.page.evaluate('document.body.scrollHeight')
-            if new_height == last_height:
-                print("页面高度未变化，等待更长时间...")
-                await self.page.wait_for_timeout(3000)
-                new_height = await self.page.evaluate('document.body.scrollHeight')
-                
-                if new_height == last_height and new_images_count == 0:
-                    no_new_images_count += 1
-                    if no_new_images_count >= 3:  # 连续3次没有新图片就退出
-                        print("连续多次没有新图片，停止滚动")
-                        break
+            # 增量模式：上次已完整爬过（或已超过上次中断的深度）且连续几次只看到旧图片时停止
+            if self.incremental and cursor and (cursor['complete'] or i + 1 >= cursor['depth']):
+                if len(self.unseen_image_urls) == unseen_before:
+                    no_unseen_count += 1
+                    if no_unseen_count >= SPIDER_INCREMENTAL_PATIENCE:
+                        print("已到达上次爬取过的图片，停止滚动")
+                        return True
                 else:
-                    no_new_images_count = 0
+                    no_unseen_count = 0
+            
+            # 检查是否有新内容加载，等待已有超时上限，这里不再额外等待
+            new_height = await self.page.evaluate('document.body.scrollHeight')
+            if new_height == last_height and new_images_count == 0:
+                no_new_images_count += 1
+                if no_new_images_count >= 3:  # 连续3次没有新图片就退出
+                    print("连续多次没有新图片，停止滚动")
+                    return True
+            else:
+                no_new_images_count = 0
             
             last_height = new_height
+        
+        return False
 
-    def convert_to_original_url(self, url):
+    @staticmethod
+    def convert_to_original_url(url):
         """将Pinterest缩略图URL转换为原始图片URL"""
         pattern = r'https://i\.pinimg\.com/\w+/(\w{2}/\w{2}/\w{2}/\w+\.\w+)'
         match = re.match(pattern, url)
@@ -82,49 +171,61 @@ class PinterestSpider:
             return f'https://i.pinimg.com/originals/{image_path}'
         return None
 
-    def download_image(self, img_url):
-        """使用requests下载单个图片"""
+    def _on_download_result(self, url, path):
+        if path:
+            self.frontier.mark_done(url)
+        else:
+            self.frontier.mark_failed(url)
+
+    async def download_images(self, img_urls):
+        """异步并发下载图片原图，有爬取状态时连同上次未完成的下载一起处理"""
+        original_urls = {self.convert_to_original_url(url) for url in img_urls}
+        original_urls.discard(None)
+        on_result = None
+        if self.frontier:
+            # 新图片在 collect_current_images 中已经加入待下载队列
+            original_urls = self.frontier.pending_urls(max_attempts=PENDING_MAX_ATTEMPTS)
+            on_result = self._on_download_result
+        dedup = DedupIndex(SPIDER_DEDUP_PATH, SPIDER_DEDUP_MAX_DISTANCE) if SPIDER_DEDUP_PATH else None
         try:
-            original_url = self.convert_to_original_url(img_url)
-            if not original_url:
-                return
-            
-            file_name = original_url.split('/')[-1]
-            file_path = os.path.join(IMAGE_DIR, file_name)
-            
-            if os.path.exists(file_path):
-                print(f"文件已存在，跳过: {file_name}")
-                return
-            
-            response = requests.get(original_url, timeout=10)
-            if response.status_code == 200:
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
-                print(f"成功下载图片: {file_name}")
-            else:
-                print(f"下载失败，状态码: {response.status_code}, URL: {original_url}")
-                    
-        except Exception as e:
-            print(f"下载图片失败: {str(e)}, URL: {img_url}")
+            async with ImageDownloader(IMAGE_DIR, dedup=dedup, on_result=on_result) as downloader:
+                return await downloader.download_all(original_urls)
+        finally:
+            if dedup:
+                dedup.close()
+
+    async def crawl_seed(self, url, scroll_times=5):
+        """打开页面并滚动收集图片，返回本次新发现的图片URL"""
+        self.seed = url
+        self.all_image_urls = set()
+        self.unseen_image_urls = set()
+        if self.frontier:
+            self.cursor = self.frontier.get_cursor(url)
+            self.frontier.start_seed(url)
+        
+        await self.page.goto(url, wait_until='domcontentloaded')
+        await self.page.evaluate(INSTALL_IMAGE_OBSERVER_JS, IMAGE_SELECTOR)
+        await self.wait_for_new_images()
+        
+        # 收集初始页面的图片
+        await self.collect_current_images()
+        print(f"初始页面找到 {len(self.all_image_urls)} 张图片")
+        
+        # 开始滚动收集
+        complete = await self.auto_scroll(scroll_times)
+        if self.frontier:
+            self.frontier.finish_seed(url, complete)
+        
+        print(f"滚动完成，共收集到 {len(self.all_image_urls)} 张独特图片，其中 {len(self.unseen_image_urls)} 张为新图片，页面: {url}")
+        return self.unseen_image_urls
 
     async def scrape_images(self, url, scroll_times=5):
         """爬取指定Pinterest页面的图片"""
         try:
-            await self.page.goto(url)
-            await self.page.wait_for_timeout(3000)
-            
-            # 收集初始页面的图片
-            await self.collect_current_images()
-            print(f"初始页面找到 {len(self.all_image_urls)} 张图片")
-            
-            # 开始滚动收集
-            await self.auto_scroll(scroll_times)
-            
-            print(f"滚动完成，共收集到 {len(self.all_image_urls)} 张独特图片")
+            await self.crawl_seed(url, scroll_times)
             
-            # 使用线程池并发下载所有收集到的图片
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                executor.map(self.download_image, self.all_image_urls)
+            # 并发下载新发现的图片
+            await self.download_images(self.unseen_image_urls)
             
         except Exception as e:
             print(f"爬取失败: {str(e)}")
@@ -143,11 +244,16 @@ class PinterestSpider:
 async def main():
     os.makedirs(IMAGE_DIR, exist_ok=True)
     
-    spider = PinterestSpider()
+    frontier = CrawlFrontier(SPIDER_FRONTIER_PATH) if SPIDER_FRONTIER_PATH else None
+    spider = PinterestSpider(frontier=frontier)
     await spider.initialize()
     
     target_url = "https://jp.pinterest.com/pin/17240411068831921/"
-    await spider.scrape_images(target_url, scroll_times=4)
+    try:
+        await spider.scrape_images(target_url, scroll_times=4)
+    finally:
+        if frontier:
+            frontier.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
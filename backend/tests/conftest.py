@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试使用临时目录中的数据库和输出目录，不影响本地数据。conf 在导入时读取环境变量，
+# 所以要在导入任何项目模块之前设置；日志和工作流上传目录是相对当前目录的，一并切换到临时目录
+WORK_DIR = tempfile.mkdtemp(prefix='backend-tests-')
+os.environ.update({
+    'DATABASE_URI': f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}",
+    'UPLOAD_FOLDER': os.path.join(WORK_DIR, 'upload', 'images'),
+    'OUTPUT_FOLDER': os.path.join(WORK_DIR, 'output', 'images'),
+    'RENDITION_CACHE_FOLDER': os.path.join(WORK_DIR, 'output', 'renditions'),
+    'IMAGE_RECORD_JOURNAL': '',
+    'TRANSLATION_MEMORY_PATH': '',
+    'WORKFLOW_IMPORT_WORKERS': '1',
+})
+os.chdir(WORK_DIR)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from sqlalchemy import JSON
+    from app import create_app
+    from app.database import init_database
+    from app.extensions import db
+    from app.migrations import run_migrations
+    from app.models.workflow import Workflow
+
+    # ARRAY 列只有 PostgreSQL 支持，SQLite 测试库中按 JSON 存储
+    for column in ('input_vars', 'output_vars'):
+        Workflow.__table__.c[column].type = JSON()
+
+    flask_app = create_app()
+    flask_app.config['TESTING'] = True
+    init_database(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        run_migrations(db.engine)
+    return flask_app
+
+
+@pytest.fixture
+def db(app):
+    """在应用上下文中使用数据库，测试结束后清空所有表"""
+    from app.definition_index import definition_index
+    from app.extensions import db as database
+
+    with app.app_context():
+        yield database
+        database.session.rollback()
+        for table in reversed(database.metadata.sorted_tables):
+            database.session.execute(table.delete())
+        database.session.commit()
+        database.session.remove()
+    definition_index.invalidate()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
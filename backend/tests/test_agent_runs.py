@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+import importlib
+from types import SimpleNamespace
+
+import pytest
+from app.models.agent import Agent, AgentStatus, ScheduleType
+from app.models.agent_run import AgentRun, AgentRunStage, AgentRunStatus
+from xhs_upload import auto_upload
+
+# app 包把 scheduler 实例绑定到了同名属性上，通过 sys.modules 取模块本身
+scheduler_module = importlib.import_module('app.scheduler')
+
+PROMPTS = ['p0', 'p1', 'p2']
+
+
+class FakePipeline:
+    """替换各阶段的外部调用，记录调用并可以让指定的调用失败"""
+
+    def __init__(self, monkeypatch):
+        self.calls = []
+        self.fail = {}  # 阶段 -> 第几次调用时失败
+        for name in ('prepare_prompts', '_get_workflow_info', '_generate_images', '_generate_caption',
+                     '_get_uploader'):
+            monkeypatch.setattr(auto_upload, name, getattr(self, name))
+        self.xhs_client = SimpleNamespace(
+            get_suggest_topic=lambda text: self._call('topics', text) or [{'id': text, 'name': text, 'link': ''}])
+
+    def _call(self, stage, *args):
+        self.calls.append((stage, *args))
+        if self.fail.get(stage) == sum(1 for call in self.calls if call[0] == stage):
+            raise RuntimeError(f'{stage} failed')
+
+    def prepare_prompts(self, prompt_template, topic, image_count, image_style):
+        self._call('prompts')
+        return PROMPTS[:image_count]
+
+    def _get_workflow_info(self, workflow_id):
+        return (None,) * 5
+
+    def _generate_images(self, workflow_data, prompt_var, seed_var, output_var, prompts, workflow, image_style,
+                         topic, done_indexes=(), on_images=None):
+        for index, prompt in enumerate(prompts):
+            if index in done_indexes:
+                continue
+            self._call('image', index)
+            on_images([{'index': index, 'prompt': prompt, 'path': f'/images/{index}.png', 'image_id': index}])
+
+    def _generate_caption(self, image_style, topic, prompts):
+        self._call('caption')
+        return {'title': 'title', 'topics': ['wallpaper']}
+
+    def _get_uploader(self, account_id):
+        return SimpleNamespace(xhs_client=self.xhs_client, upload_image_file=self.upload_image_file,
+                               publish_image_note=self.publish_image_note)
+
+    def upload_image_file(self, image_path):
+        self._call('upload', image_path)
+        return f'file-{image_path}'
+
+    def publish_image_note(self, title, desc, file_ids, topics, is_private=True):
+        self._call('publish', file_ids)
+        return {'id': 'note'}
+
+    def stages(self):
+        return [call[0] for call in self.calls]
+
+
+def run_pipeline(run_id=None):
+    return auto_upload.auto_gen_and_upload('topic', len(PROMPTS), 'template', 'style', 'account', 1, run_id=run_id)
+
+
+@pytest.mark.parametrize('stage, failing_call, expected_stage', [
+    ('prompts', 1, AgentRunStage.CREATED),
+    ('image', 2, AgentRunStage.PROMPTS),
+    ('caption', 1, AgentRunStage.IMAGES),
+    ('topics', 1, AgentRunStage.CAPTION),
+    ('upload', 2, AgentRunStage.TOPICS),
+    ('publish', 1, AgentRunStage.UPLOADED),
+])
+def test_resume_continues_from_failed_stage(db, monkeypatch, stage, failing_call, expected_stage):
+    pipeline = FakePipeline(monkeypatch)
+    pipeline.fail[stage] = failing_call
+
+    result = run_pipeline()
+
+    assert result['success'] is False and result['retryable'] is True
+    run = db.session.get(AgentRun, result['run_id'])
+    assert (run.status, run.stage, run.last_error) == (AgentRunStatus.FAILED, expected_stage, f'{stage} failed')
+    first_attempt = pipeline.stages()
+
+    pipeline.calls.clear()
+    pipeline.fail.clear()
+    result = run_pipeline(run.id)
+
+    assert result['success'] is True
+    db.session.refresh(run)
+    assert (run.status, run.stage, run.attempts) == (AgentRunStatus.SUCCESS, AgentRunStage.PUBLISHED, 2)
+    # 每一步在两次执行中合计只成功一次，失败的那一步重试一次
+    resumed = pipeline.stages()
+    assert sorted(first_attempt + resumed) == sorted(
+        ['prompts', 'image', 'image', 'image', 'caption', 'topics', 'upload', 'upload', 'upload', 'publish', stage])
+    assert [call[1] for call in pipeline.calls if call[0] == 'publish'] == \
+        [[f'file-/images/{index}.png' for index in range(3)]]
+
+
+def test_non_retryable_error(db, monkeypatch):
+    pipeline = FakePipeline(monkeypatch)
+    monkeypatch.setattr(auto_upload, '_get_uploader',
+                        lambda account_id: (_ for _ in ()).throw(auto_upload.NonRetryableError('no account')))
+
+    result = run_pipeline()
+
+    assert result['success'] is False and result['retryable'] is False
+    assert db.session.get(AgentRun, result['run_id']).stage == AgentRunStage.CAPTION
+    assert 'upload' not in pipeline.stages()
+
+
+@pytest.fixture
+def agent_scheduler(app, monkeypatch):
+    scheduler = scheduler_module.AgentScheduler.get_instance()
+    monkeypatch.setattr(scheduler, 'app', app)
+    return scheduler
+
+
+@pytest.fixture
+def agent(db):
+    agent = Agent(name='agent', topic='topic', account_id='1', schedule_type=ScheduleType.FIXED_TIME,
+                  schedule_config={'hour': 10, 'minute': 0}, image_count=3, prompt_template='template',
+                  image_style='style', status=AgentStatus.RUNNING)
+    db.session.add(agent)
+    db.session.commit()
+    return agent
+
+
+def add_run(db, agent, params, **fields):
+    run = AgentRun(agent_id=agent.id, params=params, **fields)
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def test_get_resumable_run(db, agent, agent_scheduler):
+    params = agent_scheduler.get_agent_params(agent)
+    add_run(db, agent, params, status=AgentRunStatus.SUCCESS)
+    assert agent_scheduler.get_resumable_run(agent) is None
+
+    failed = add_run(db, agent, params, status=AgentRunStatus.FAILED)
+    assert agent_scheduler.get_resumable_run(agent) is failed
+
+    # 参数变化后失败的执行不再继续，但保留记录
+    agent.topic = 'new topic'
+    db.session.commit()
+    assert agent_scheduler.get_resumable_run(agent) is None
+    assert db.session.get(AgentRun, failed.id) is not None
+
+
+def test_stale_pending_run_deleted_when_params_change(db, agent, agent_scheduler):
+    pending = add_run(db, agent, agent_scheduler.get_agent_params(agent), prompts=PROMPTS,
+                      stage=AgentRunStage.PROMPTS)
+    agent.image_count = 2
+
+    assert agent_scheduler.get_resumable_run(agent) is None
+    db.session.commit()
+    assert db.session.get(AgentRun, pending.id) is None
+
+
+def test_execute_resumes_unfinished_run_and_prewarms_after_failure(db, agent, agent_scheduler, monkeypatch):
+    failed = add_run(db, agent, agent_scheduler.get_agent_params(agent), status=AgentRunStatus.FAILED,
+                     attempts=4, prompts=PROMPTS, stage=AgentRunStage.PROMPTS)
+    calls = []
+
+    def fake_run(run_id, **params):
+        calls.append((run_id, db.session.get(AgentRun, run_id).attempts))
+        return {'success': False, 'retryable': True, 'run_id': run_id}
+
+    monkeypatch.setattr(scheduler_module, 'auto_gen_and_upload', fake_run)
+    monkeypatch.setattr(agent_scheduler, 'schedule_retry',
+                        lambda agent_id, run_id, retryable: calls.append(('retry', run_id, retryable)))
+    monkeypatch.setattr(agent_scheduler, 'schedule_prewarm', lambda agent_id: calls.append(('prewarm', agent_id)))
+    monkeypatch.setattr(agent_scheduler, 'cancel_retry', lambda agent_id: None)
+
+    agent_scheduler.execute_agent(agent.id)
+
+    # 新的定时触发继续上次的执行并重新计算重试次数，失败后仍然预生成下一次的提示词
+    assert calls == [(failed.id, 0), ('retry', failed.id, True), ('prewarm', agent.id)]
+    assert AgentRun.query.count() == 1
+
+
+def test_prewarm_skips_agent_with_unfinished_run(db, agent, agent_scheduler, monkeypatch):
+    prompts_calls = []
+    monkeypatch.setattr(scheduler_module, 'prepare_prompts',
+                        lambda *args: prompts_calls.append(args) or PROMPTS)
+
+    agent_scheduler.prewarm_agent(agent.id)
+    agent_scheduler.prewarm_agent(agent.id)
+
+    run = AgentRun.query.one()
+    assert (run.status, run.stage, run.prompts) == (AgentRunStatus.PENDING, AgentRunStage.PROMPTS, PROMPTS)
+    assert run.params == agent_scheduler.get_agent_params(agent)
+    assert len(prompts_calls) == 1
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import tarfile
+
+import pytest
+from PIL import Image
+from spider.dataset import DatasetExporter, ShardWriter, read_shard_keys, sample_key
+
+
+def make_image(directory, name, size=(320, 256)):
+    Image.new('RGB', size, (200, 100, 50)).save(os.path.join(directory, name))
+
+
+@pytest.fixture
+def make_exporter(tmp_path):
+    source_dir = tmp_path / 'images'
+    source_dir.mkdir()
+    exporters = []
+
+    def make(**options):
+        exporter = DatasetExporter(source_dir=str(source_dir), output_dir=str(tmp_path / 'dataset'), resolution=256,
+                                   min_size=128, workers=1, **{'shard_size': 10, **options})
+        exporters.append(exporter)
+        return exporter
+
+    make.source_dir = str(source_dir)
+    yield make
+    for exporter in exporters:
+        exporter.close()
+
+
+def shard_members(exporter, shard='shard-000000.tar'):
+    with tarfile.open(os.path.join(exporter.output_dir, 'shards', shard)) as tar:
+        return tar.getnames()
+
+
+def test_sample_key_keeps_extension():
+    assert sample_key('a.jpg') == 'a_jpg'
+    assert sample_key('a.png') != sample_key('a.jpg')
+    assert sample_key('中文 name.webp') == '___name_webp'
+
+
+def test_export_skips_processed_images(make_exporter):
+    for name in ('a.jpg', 'a.png', 'small.png'):
+        make_image(make_exporter.source_dir, name, (64, 64) if name == 'small.png' else (320, 256))
+    exporter = make_exporter()
+
+    assert exporter.export() == {'processed': 2, 'skipped': 1}
+    make_image(make_exporter.source_dir, 'b.jpg')
+    assert exporter.export() == {'processed': 1, 'skipped': 0}
+
+    assert sorted(shard_members(exporter)) == sorted(
+        f'{key}.{ext}' for key in ('a_jpg', 'a_png', 'b_jpg') for ext in ('jpg', 'txt', 'json'))
+    with open(os.path.join(exporter.output_dir, 'index.json'), encoding='utf-8') as f:
+        assert json.load(f)['total_samples'] == 3
+
+
+def test_shards_roll_over_at_shard_size(make_exporter):
+    for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+        make_image(make_exporter.source_dir, name)
+    exporter = make_exporter(shard_size=2)
+    exporter.export()
+
+    make_image(make_exporter.source_dir, 'd.jpg')
+    make_image(make_exporter.source_dir, 'e.jpg')
+    exporter.export()
+
+    # 第二次运行继续写未满的 shard-000001，写满后新开 shard-000002
+    assert [len(shard_members(exporter, f'shard-{i:06d}.tar')) // 3 for i in range(3)] == [2, 2, 1]
+
+
+def test_resume_skips_samples_missing_from_manifest_and_drops_partial_sample(make_exporter, tmp_path):
+    for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+        make_image(make_exporter.source_dir, name)
+    exporter = make_exporter()
+    exporter.export()
+    # 模拟中断：b、c 已写入分片但 manifest.db 未提交，并且 d 只写了一半
+    exporter.conn.execute("DELETE FROM samples WHERE source IN ('b.jpg', 'c.jpg')")
+    exporter.conn.commit()
+    shard_path = os.path.join(exporter.output_dir, 'shards', 'shard-000000.tar')
+    with tarfile.open(shard_path, 'a') as tar:
+        info = tarfile.TarInfo('d_jpg.jpg')
+        info.size = 4096
+        tar.addfile(info, io.BytesIO(b'\xff' * 4096))
+    with open(shard_path, 'r+b') as f:
+        f.truncate(os.path.getsize(shard_path) - 3000)
+    make_image(make_exporter.source_dir, 'd.jpg')
+
+    assert exporter.export() == {'processed': 3, 'skipped': 0}
+
+    names = shard_members(exporter)
+    assert len(names) == len(set(names)) == 12
+    assert {name.split('.')[0] for name in names} == {'a_jpg', 'b_jpg', 'c_jpg', 'd_jpg'}
+    shards = dict(exporter.conn.execute('SELECT source, shard FROM samples'))
+    assert shards == {name: 'shard-000000.tar' for name in ('a.jpg', 'b.jpg', 'c.jpg', 'd.jpg')}
+
+
+def test_read_shard_keys_stops_at_truncated_sample(tmp_path):
+    image_path, caption_path = tmp_path / 'x.jpg', tmp_path / 'x.txt'
+    make_image(str(tmp_path), 'x.jpg')
+    caption_path.write_text('caption', encoding='utf-8')
+    writer = ShardWriter(str(tmp_path / 'shards'), 10)
+    writer.add('a', str(image_path), str(caption_path), {})
+    first_end = writer.tar.offset
+    writer.add('b', str(image_path), str(caption_path), {})
+    second_end = writer.tar.offset
+    writer.close()
+    path = str(tmp_path / 'shards' / 'shard-000000.tar')
+
+    assert read_shard_keys(path) == ({'a', 'b'}, second_end)
+
+    # b 的 .json 被截断时只有 a 是完整样本
+    with open(path, 'r+b') as f:
+        f.truncate(second_end - 700)
+    assert read_shard_keys(path) == ({'a'}, first_end)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from datetime import datetime
+
+import pytest
+from app.image_records import ImageRecordWriter
+from app.models.image import Image
+
+
+@pytest.fixture
+def make_writer(app, db, tmp_path):
+    writers = []
+
+    def make(journal=True, **options):
+        options.setdefault('flush_ms', 60000)  # 测试中手动 flush，避免后台线程抢先写入
+        writer = ImageRecordWriter(journal_path=str(tmp_path / 'records.journal') if journal else '', **options)
+        writer.init_app(app)
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer.flush()
+        if writer._journal:
+            # 进程退出时 atexit 还会调用 flush，关闭后不再写日志
+            writer._journal.close()
+            writer._journal = None
+
+
+def journal_lines(writer):
+    with open(writer.journal_path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_batch_ids_map_back_to_records(make_writer, db):
+    writer = make_writer()
+    # 同一个 file_path 出现两次时按插入顺序对应
+    futures = {name: writer.add(filename=name, file_path=path)
+               for name, path in [('first.png', 'output/a.png'), ('other.png', 'output/b.png'),
+                                  ('second.png', 'output/a.png')]}
+    assert len(journal_lines(writer)) == 3
+
+    writer.flush()
+
+    for name, future in futures.items():
+        assert db.session.get(Image, future.result(timeout=1)).filename == name
+    assert writer.writer_stats() == {'written': 3, 'batches': 1, 'errors': 0, 'recovered': 0, 'buffered': 0}
+    assert journal_lines(writer) == []
+
+
+def test_recover_replays_records_missing_from_database(app, db, tmp_path, make_writer):
+    db.session.add(Image(filename='saved.png', file_path='output/saved.png'))
+    db.session.commit()
+    created_at = datetime(2024, 5, 1, 8, 30)
+    records = [
+        {'filename': 'saved.png', 'file_path': 'output/saved.png'},
+        {'filename': 'lost.png', 'file_path': 'output/lost.png', 'workflow_name': 'wf', 'variables': {'seed': 1}},
+    ]
+    with open(tmp_path / 'records.journal', 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps({'workflow_id': None, 'workflow_name': None, 'variables': None,
+                                **record, 'created_at': created_at.isoformat()}) + '\n')
+        # 崩溃时只写了一半的最后一行
+        f.write('{"filename": "half')
+
+    writer = make_writer()
+
+    images = {image.filename: image for image in Image.query.all()}
+    assert set(images) == {'saved.png', 'lost.png'}
+    assert images['lost.png'].variables == {'seed': 1}
+    assert images['lost.png'].created_at == created_at
+    assert writer.stats['recovered'] == 1
+    assert journal_lines(writer) == []
+
+
+def test_failed_batch_is_reported_and_dropped_from_journal(make_writer, db, monkeypatch):
+    writer = make_writer()
+    with monkeypatch.context() as patch:
+        patch.setattr(writer, '_insert', lambda records: (_ for _ in ()).throw(RuntimeError('database is locked')))
+        failed = writer.add(filename='failed.png', file_path='output/failed.png')
+        writer.flush()
+
+    with pytest.raises(RuntimeError):
+        failed.result(timeout=1)
+    # 调用方已经收到失败，下次启动时不会再补写这条记录
+    assert journal_lines(writer) == []
+    assert writer.stats['errors'] == 1
+
+    future = writer.add(filename='ok.png', file_path='output/ok.png')
+    writer.flush()
+    image_id = future.result(timeout=1)
+
+    assert [image.id for image in Image.query.all()] == [image_id]
+    assert journal_lines(writer) == []
+
+
+def test_concurrent_writes_share_batches(make_writer, db):
+    writer = make_writer(journal=False, batch_size=5, flush_ms=50)
+    ids = []
+    lock = threading.Lock()
+
+    def write(index):
+        image_id = writer.write(filename=f'{index}.png', file_path=f'output/{index}.png', timeout=5)
+        with lock:
+            ids.append(image_id)
+
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids)) == 20
+    assert Image.query.count() == 20
+    assert writer.stats['batches'] < 20
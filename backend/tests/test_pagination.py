@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+import pytest
+from app.models.image import Image
+from app.utils.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_paginate, parse_date_range
+
+COLUMNS = [Image.created_at, Image.id]
+BASE_TIME = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def add_images(db, count, same_time_every=3):
+    """每 same_time_every 张图片使用相同的 created_at，覆盖排序列相等、只靠 id 区分的边界"""
+    images = [Image(filename=f'{i}.png', file_path=f'output/images/{i}.png',
+                    created_at=BASE_TIME + timedelta(minutes=i // same_time_every))
+              for i in range(count)]
+    db.session.add_all(images)
+    db.session.commit()
+    return sorted(images, key=lambda image: (image.created_at, image.id), reverse=True)
+
+
+def walk_pages(query, limit):
+    pages, cursor = [], ''
+    while True:
+        items, cursor = keyset_paginate(query, COLUMNS, cursor, limit)
+        pages.append([image.id for image in items])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    image = Image(id=42, created_at=datetime(2024, 5, 1, 12, 30, 15, 123456))
+    cursor = encode_cursor(image, COLUMNS)
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor, COLUMNS) == [image.created_at, 42]
+
+
+@pytest.mark.parametrize('cursor', ['not-base64!', 'WzFd', 'eyJhIjogMX0', 'WyJub3QgYSBkYXRlIiwgMV0'])
+def test_invalid_cursor_rejected(cursor):
+    # 依次为：非 base64、列数不对、不是列表、日期格式错误
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, COLUMNS)
+
+
+def test_pages_cover_every_row_once_across_ties(db):
+    expected = [image.id for image in add_images(db, 10)]
+
+    pages = walk_pages(Image.query, 4)
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert [image_id for page in pages for image_id in page] == expected
+
+
+def test_last_full_page_has_no_next_cursor(db):
+    expected = [image.id for image in add_images(db, 8)]
+
+    pages = walk_pages(Image.query, 4)
+
+    assert pages == [expected[:4], expected[4:]]
+
+
+def test_empty_result(db):
+    assert keyset_paginate(Image.query, COLUMNS, None, 5) == ([], None)
+
+
+def test_cursor_continues_after_boundary_row(db):
+    images = add_images(db, 6)
+    # 游标指向一组相同 created_at 中间的一条，下一页从同一时间、id 更小的记录开始
+    cursor = encode_cursor(images[1], COLUMNS)
+
+    items, _ = keyset_paginate(Image.query, COLUMNS, cursor, 10)
+
+    assert [image.id for image in items] == [image.id for image in images[2:]]
+
+
+def test_list_images_rejects_invalid_cursor(client):
+    response = client.get('/api/list-images?cursor=bogus')
+
+    assert response.json['success'] is False
+    assert 'Invalid cursor' in response.json['message']
+
+
+def test_list_images_cursor_pages(client, db):
+    expected = [image.id for image in add_images(db, 5)]
+
+    first = client.get('/api/list-images?cursor=&page_size=3').json['data']
+    second = client.get(f"/api/list-images?cursor={first['pagination']['next_cursor']}&page_size=3").json['data']
+
+    assert [image['id'] for image in first['images'] + second['images']] == expected
+    assert first['pagination']['has_next'] is True
+    assert second['pagination']['next_cursor'] is None
+    assert first['pagination']['total_images'] is None
+
+
+def test_parse_date_range_includes_end_date():
+    assert parse_date_range('2024-05-01', '2024-05-02') == (datetime(2024, 5, 1), datetime(2024, 5, 3))
+    assert parse_date_range(None, '2024-05-02T10:00:00') == (None, datetime(2024, 5, 2, 10))
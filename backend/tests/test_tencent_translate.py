@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""使用本地模拟服务测试 TencentTranslator，不访问真实接口"""
+import pytest
+import translate.tencent_translate as tencent_translate
+from translate.stub_server import STUB_SECRET_ID, STUB_SECRET_KEY, TencentStubHandler, start_stub_server
+from translate.tencent_translate import TencentTranslator
+
+
+@pytest.fixture(scope='module')
+def stub_server():
+    server = start_stub_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_requests():
+    TencentStubHandler.requests.clear()
+    return TencentStubHandler.requests
+
+
+@pytest.fixture
+def make_translator(stub_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(tencent_translate, 'TENCENT_HOST', f'127.0.0.1:{stub_server.server_address[1]}')
+    monkeypatch.setattr(tencent_translate, 'TENCENT_SCHEME', 'http')
+    monkeypatch.setattr(tencent_translate, 'TENCENT_SECRET_ID', STUB_SECRET_ID)
+    monkeypatch.setattr(tencent_translate, 'TENCENT_SECRET_KEY', STUB_SECRET_KEY)
+    monkeypatch.setattr(tencent_translate, 'TRANSLATION_MEMORY_PATH', str(tmp_path / 'translation_memory.db'))
+    translators = []
+
+    def make():
+        translator = TencentTranslator()
+        translators.append(translator)
+        return translator
+
+    yield make
+    for translator in translators:
+        translator.memory.close()
+
+
+def sent_texts(requests):
+    return [r['payload'].get('SourceTextList') or r['payload'].get('SourceText') for r in requests]
+
+
+def test_translate_batch_packs_by_item_limit(make_translator, stub_server, stub_requests, monkeypatch):
+    monkeypatch.setattr(stub_server, 'max_batch_items', 2)
+    monkeypatch.setattr(tencent_translate, 'TENCENT_BATCH_MAX_ITEMS', 2)
+    translator = make_translator()
+
+    result = translator.translate_batch(['a', 'b', 'c', 'a', 'd', 'e'])
+
+    assert result == ['[zh] a', '[zh] b', '[zh] c', '[zh] a', '[zh] d', '[zh] e']
+    # 重复文本只发送一次，最后剩下的单条文本走 TextTranslate
+    assert [r['action'] for r in stub_requests] == ['TextTranslateBatch', 'TextTranslateBatch', 'TextTranslate']
+    assert sent_texts(stub_requests) == [['a', 'b'], ['c', 'd'], 'e']
+
+
+def test_translate_batch_packs_by_char_limit(make_translator, stub_server, stub_requests, monkeypatch):
+    monkeypatch.setattr(stub_server, 'max_text_length', 10)
+    monkeypatch.setattr(tencent_translate, 'TENCENT_BATCH_MAX_CHARS', 10)
+    translator = make_translator()
+
+    assert translator.translate_batch(['aaaa', 'bbbb', 'cccc', 'dd']) == \
+        ['[zh] aaaa', '[zh] bbbb', '[zh] cccc', '[zh] dd']
+    assert sent_texts(stub_requests) == [['aaaa', 'bbbb'], ['cccc', 'dd']]
+
+
+def test_stub_rejects_oversized_batch(make_translator, stub_server, monkeypatch):
+    monkeypatch.setattr(stub_server, 'max_batch_items', 2)
+    monkeypatch.setattr(stub_server, 'max_text_length', 10)
+    translator = make_translator()
+    params = {'Source': 'en', 'Target': 'zh', 'ProjectId': 0}
+
+    with pytest.raises(Exception, match='InvalidParameterValue'):
+        translator._request(translator.batch_action, {**params, 'SourceTextList': ['a', 'b', 'c']})
+    with pytest.raises(Exception, match='TextTooLong'):
+        translator._request(translator.batch_action, {**params, 'SourceTextList': ['aaaaaa', 'bbbbbb']})
+
+
+def test_signing_key_cached_per_date(make_translator, monkeypatch):
+    translator = make_translator()
+    calls = []
+    sign = translator._sign
+    monkeypatch.setattr(translator, '_sign', lambda key, msg: calls.append(msg) or sign(key, msg))
+
+    first = translator._get_signing_key('2024-01-01')
+    assert translator._get_signing_key('2024-01-01') is first
+    assert len(calls) == 3
+
+    second = translator._get_signing_key('2024-01-02')
+    assert second != first
+    assert len(calls) == 6
+
+
+def test_signed_requests_accepted(make_translator, stub_requests):
+    translator = make_translator()
+
+    assert translator.translate('hello') == '[zh] hello'
+    assert translator.translate('world', target_lang='ja') == '[ja] world'
+    assert len(stub_requests) == 2
+
+
+def test_wrong_secret_key_rejected(make_translator, monkeypatch):
+    monkeypatch.setattr(tencent_translate, 'TENCENT_SECRET_KEY', 'wrong-key')
+    translator = make_translator()
+
+    with pytest.raises(Exception, match='AuthFailure.SignatureFailure'):
+        translator.translate('hello')
+
+
+def test_translation_memory_round_trip(make_translator, stub_requests):
+    translator = make_translator()
+    assert translator.translate_batch(['cat', 'dog']) == ['[zh] cat', '[zh] dog']
+    assert len(stub_requests) == 1
+
+    # 新实例使用同一个记忆库文件，已翻译过的文本不再请求接口
+    reopened = make_translator()
+    assert reopened.translate_batch(['dog', 'cat', 'bird']) == ['[zh] dog', '[zh] cat', '[zh] bird']
+    assert reopened.translate('cat') == '[zh] cat'
+    assert sent_texts(stub_requests[1:]) == ['bird']
+    assert reopened.memory.get('en', 'zh', 'bird') == '[zh] bird'
+
+
+def test_empty_strings_not_sent(make_translator, stub_requests):
+    translator = make_translator()
+
+    assert translator.translate_batch(['', 'hi', '']) == ['', '[zh] hi', '']
+    assert translator.translate('') == ''
+    assert sent_texts(stub_requests) == ['hi']
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import zipfile
+
+import pytest
+from app.api import workflow as workflow_api
+from app.models.variable_definitions import VariableDefinitions
+from app.models.workflow import Workflow
+from app.models.workflow_variable import WorkflowVariable
+
+
+def workflow_json(prompt='a cat', title='Prompt'):
+    return {
+        '1': {'inputs': {'text': prompt}, 'class_type': 'CLIPTextEncode', '_meta': {'title': title}},
+        '2': {'inputs': {'images': ['1', 0]}, 'class_type': 'SaveImage', '_meta': {'title': 'Save'}},
+    }
+
+
+def as_file(data, name):
+    return io.BytesIO(json.dumps(data).encode('utf-8')), name
+
+
+@pytest.fixture
+def upload_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(workflow_api, 'UPLOAD_FOLDER', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def definitions(db):
+    db.session.add_all([
+        VariableDefinitions(class_type='CLIPTextEncode', value_path='inputs.text', value_type='string',
+                            param_type='input'),
+        VariableDefinitions(class_type='SaveImage', value_path='inputs.images', value_type='array',
+                            param_type='output'),
+    ])
+    db.session.commit()
+
+
+def import_files(client, *files):
+    response = client.post('/api/workflow/import', data={'files': list(files)}, content_type='multipart/form-data')
+    return response.status_code, response.json
+
+
+def test_import_classifies_files(client, db, upload_folder, definitions):
+    _, first = import_files(client, as_file(workflow_json(), 'existing.json'))
+    existing = first['data']['files'][0]
+
+    status, body = import_files(
+        client,
+        as_file(workflow_json('a dog'), 'new.json'),
+        as_file(workflow_json(), 'same-content.json'),  # 与已有工作流内容相同
+        as_file(workflow_json('a bird'), 'copy-a.json'),
+        as_file(workflow_json('a bird'), 'copy-b.json'),  # 与本批前一个文件内容相同
+        as_file(workflow_json('a fish'), 'existing.json'),  # 同名工作流更新
+        as_file(workflow_json('a fish', title='Other'), 'new.json'),  # 本批内重名
+        as_file({'1': {'inputs': {}}}, 'broken.json'),
+    )
+
+    assert status == 200
+    files = body['data']['files']
+    assert [(entry['filename'], entry['status']) for entry in files] == [
+        ('new.json', 'created'), ('same-content.json', 'duplicate'), ('copy-a.json', 'created'),
+        ('copy-b.json', 'duplicate'), ('existing.json', 'updated'), ('new.json', 'invalid'),
+        ('broken.json', 'invalid'),
+    ]
+    assert body['data']['summary'] == {'created': 2, 'updated': 1, 'duplicate': 2, 'invalid': 2}
+    assert files[1]['id'] == existing['id']
+    assert files[3]['message'] == 'Same content as copy-a.json'
+    assert files[4]['id'] == existing['id']
+    assert [files[0]['variables_count'], files[2]['variables_count']] == [2, 2]
+    assert 'replaced_file' not in files[4]
+
+    # 新建的工作流按 content_md5 对应到正确的 ID
+    for entry in (files[0], files[2]):
+        workflow = db.session.get(Workflow, entry['id'])
+        assert (workflow.original_name, workflow.content_md5) == (entry['filename'], entry['content_md5'])
+        assert WorkflowVariable.query.filter_by(workflow_id=workflow.id).count() == 2
+    assert Workflow.query.count() == 3
+
+
+def test_update_keeps_variables_and_removes_old_file(client, db, upload_folder, definitions):
+    _, first = import_files(client, as_file(workflow_json(), 'flow.json'))
+    workflow = db.session.get(Workflow, first['data']['files'][0]['id'])
+    old_path, variable_ids = workflow.file_path, {v.id for v in WorkflowVariable.query}
+
+    _, body = import_files(client, as_file(workflow_json('a dog', title='New prompt'), 'flow.json'))
+
+    entry = body['data']['files'][0]
+    assert entry['status'] == 'updated'
+    assert entry['changes']['kept'] == 1 and entry['changes']['unchanged_nodes'] == 1
+    db.session.refresh(workflow)
+    assert workflow.content_md5 == entry['content_md5']
+    assert not os.path.exists(old_path)
+    with open(workflow.file_path, encoding='utf-8') as f:
+        assert json.load(f) == workflow_json('a dog', title='New prompt')
+    # 变量保留原 ID，只更新标题
+    assert {v.id for v in WorkflowVariable.query} == variable_ids
+    assert sorted(v.title for v in WorkflowVariable.query) == ['New prompt', 'Save']
+
+
+def test_failed_commit_removes_written_files(client, db, upload_folder, definitions, monkeypatch):
+    _, first = import_files(client, as_file(workflow_json(), 'flow.json'))
+    workflow = db.session.get(Workflow, first['data']['files'][0]['id'])
+    files_before = sorted(os.listdir(upload_folder))
+
+    def fail_commit():
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(db.session, 'commit', fail_commit)
+    status, body = import_files(client, as_file(workflow_json('a dog'), 'flow.json'),
+                                as_file(workflow_json('a cat', title='Other'), 'other.json'))
+    monkeypatch.undo()
+
+    assert status == 400 and 'disk full' in body['message']
+    # 新写入的文件被删除，被替换的旧文件保留，数据库不变
+    assert sorted(os.listdir(upload_folder)) == files_before
+    db.session.expire_all()
+    assert Workflow.query.count() == 1
+    assert db.session.get(Workflow, workflow.id).content_md5 == first['data']['files'][0]['content_md5']
+    assert WorkflowVariable.query.count() == 2
+
+
+def test_import_from_zip_archive(client, db, upload_folder, definitions):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('flows/a.json', json.dumps(workflow_json('a')))
+        zf.writestr('__MACOSX/flows/._a.json', 'ignored')
+        zf.writestr('flows/readme.txt', 'ignored')
+    archive.seek(0)
+
+    response = client.post('/api/workflow/import', data={'archive': (archive, 'flows.zip')},
+                           content_type='multipart/form-data')
+
+    assert [entry['filename'] for entry in response.json['data']['files']] == ['a.json']
+    assert response.json['data']['summary']['created'] == 1
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+
+class TranslationMemory:
+    """
+    持久化的翻译记忆库（SQLite）
+
+    以 (源语言, 目标语言, 原文哈希) 为键保存译文，重复出现的短语无需再次请求翻译接口。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS translation_memory ('
+            ' source TEXT NOT NULL,'
+            ' target TEXT NOT NULL,'
+            ' text_hash TEXT NOT NULL,'
+            ' source_text TEXT NOT NULL,'
+            ' translated_text TEXT NOT NULL,'
+            ' hits INTEGER NOT NULL DEFAULT 0,'
+            ' created_at TEXT NOT NULL,'
+            ' PRIMARY KEY (source, target, text_hash))'
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, source: str, target: str, texts: List[str]) -> Dict[str, str]:
+        """批量查询译文，返回 {原文: 译文}，未命中的原文不在结果中"""
+        hashes = {self.text_hash(text): text for text in set(texts)}
+        if not hashes:
+            return {}
+
+        found = {}
+        keys = list(hashes)
+        with self._lock:
+            # SQLite 默认最多 999 个绑定参数
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT text_hash, source_text, translated_text FROM translation_memory '
+                    f'WHERE source = ? AND target = ? AND text_hash IN ({placeholders})',
+                    [source, target, *chunk]
+                ).fetchall()
+                for text_hash, source_text, translated_text in rows:
+                    # 防止哈希碰撞
+                    if source_text == hashes[text_hash]:
+                        found[source_text] = translated_text
+                if rows:
+                    self._conn.execute(
+                        f'UPDATE translation_memory SET hits = hits + 1 '
+                        f'WHERE source = ? AND target = ? AND text_hash IN ({placeholders})',
+                        [source, target, *chunk]
+                    )
+            self._conn.commit()
+        return found
+
+    def get(self, source: str, target: str, text: str):
+        return self.get_many(source, target, [text]).get(text)
+
+    def put_many(self, source: str, target: str, pairs: List[Tuple[str, str]]):
+        """保存 (原文, 译文) 列表"""
+        if not pairs:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO translation_memory '
+                '(source, target, text_hash, source_text, translated_text, hits, created_at) '
+                'VALUES (?, ?, ?, ?, ?, 0, ?)',
+                [(source, target, self.text_hash(text), text, translated, now) for text, translated in pairs]
+            )
+            self._conn.commit()
+
+    def put(self, source: str, target: str, text: str, translated: str):
+        self.put_many(source, target, [(text, translated)])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+本地腾讯翻译接口模拟服务，用于开发和测试时不访问真实接口
+
+用法：
+    python -m translate.stub_server --port 18080
+然后在 .env 中设置 TENCENT_HOST=127.0.0.1:18080、TENCENT_SCHEME=http，
+TENCENT_SECRET_ID、TENCENT_SECRET_KEY 与模拟服务的 --secret-id、--secret-key 一致。
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MAX_TEXT_LENGTH = 6000
+MAX_BATCH_ITEMS = 100
+STUB_SECRET_ID = 'stub-secret-id'
+STUB_SECRET_KEY = 'stub-secret-key'
+
+_AUTHORIZATION = re.compile(
+    r'^TC3-HMAC-SHA256 Credential=([^/]+)/(\d{4}-\d{2}-\d{2})/([^/]+)/tc3_request, '
+    r'SignedHeaders=([a-z0-9;-]+), Signature=([0-9a-f]{64})$'
+)
+
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+class TencentStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 记录收到的请求，便于测试断言
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _translate(self, text, target):
+        return f"[{target}] {text}"
+
+    def _send(self, body: dict):
+        data = json.dumps({'Response': {**body, 'RequestId': str(uuid.uuid4())}}, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, code, message):
+        self._send({'Error': {'Code': code, 'Message': message}})
+
+    def _check_signature(self, body: bytes):
+        """按 TC3-HMAC-SHA256 重新计算签名，返回错误信息，签名正确时返回 None"""
+        match = _AUTHORIZATION.match(self.headers.get('Authorization', ''))
+        if not match:
+            return 'Malformed Authorization header'
+        secret_id, date, service, signed_headers, signature = match.groups()
+        if secret_id != self.server.secret_id:
+            return 'Unknown SecretId'
+        timestamp = self.headers.get('X-TC-Timestamp', '')
+        if not timestamp.isdigit() or \
+                datetime.fromtimestamp(int(timestamp), timezone.utc).strftime('%Y-%m-%d') != date:
+            return 'Credential date does not match X-TC-Timestamp'
+
+        canonical_headers = ''.join(
+            f"{name}:{self.headers.get(name, '').strip().lower()}\n" for name in signed_headers.split(';')
+        )
+        canonical_request = '\n'.join([
+            'POST', '/', '', canonical_headers, signed_headers, hashlib.sha256(body).hexdigest()
+        ])
+        string_to_sign = '\n'.join([
+            'TC3-HMAC-SHA256', timestamp, f'{date}/{service}/tc3_request',
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+        signing_key = _hmac(_hmac(_hmac(f'TC3{self.server.secret_key}'.encode('utf-8'), date), service),
+                            'tc3_request')
+        expected = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            return 'Signature mismatch'
+        return None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = json.loads(body or b'{}')
+        action = self.headers.get('X-TC-Action')
+        self.requests.append({'action': action, 'payload': payload})
+
+        signature_error = self._check_signature(body)
+        if signature_error:
+            return self._error('AuthFailure.SignatureFailure', signature_error)
+
+        target = payload.get('Target')
+        if action == 'TextTranslate':
+            text = payload.get('SourceText', '')
+            if len(text) >= self.server.max_text_length:
+                return self._error('UnsupportedOperation.TextTooLong', 'Text too long')
+            return self._send({
+                'TargetText': self._translate(text, target),
+                'Source': payload.get('Source'),
+                'Target': target
+            })
+        if action == 'TextTranslateBatch':
+            texts = payload.get('SourceTextList', [])
+            if sum(len(text) for text in texts) >= self.server.max_text_length:
+                return self._error('UnsupportedOperation.TextTooLong', 'Text too long')
+            if len(texts) > self.server.max_batch_items:
+                return self._error('InvalidParameterValue', f'SourceTextList has more than '
+                                                            f'{self.server.max_batch_items} items')
+            return self._send({
+                'TargetTextList': [self._translate(text, target) for text in texts],
+                'Source': payload.get('Source'),
+                'Target': target
+            })
+        return self._error('InvalidAction', f'Unsupported action: {action}')
+
+
+def create_stub_server(host='127.0.0.1', port=0, secret_id=STUB_SECRET_ID, secret_key=STUB_SECRET_KEY,
+                       max_text_length=MAX_TEXT_LENGTH, max_batch_items=MAX_BATCH_ITEMS) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), TencentStubHandler)
+    server.secret_id = secret_id
+    server.secret_key = secret_key
+    server.max_text_length = max_text_length
+    server.max_batch_items = max_batch_items
+    return server
+
+
+def start_stub_server(host='127.0.0.1', port=0, **options) -> ThreadingHTTPServer:
+    """
+    在后台线程启动模拟服务，port=0 时自动分配端口（server.server_address[1]）
+
+    options 为 create_stub_server 的其他参数：密钥、单次文本长度和批量条数上限
+    """
+    server = create_stub_server(host, port, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tencent TMT stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--secret-id', default=STUB_SECRET_ID)
+    parser.add_argument('--secret-key', default=STUB_SECRET_KEY)
+    args = parser.parse_args()
+    print(f"Tencent TMT stub listening on {args.host}:{args.port}")
+    create_stub_server(args.host, args.port, args.secret_id, args.secret_key).serve_forever()
@@ -2,12 +2,24 @@
 import hashlib
 import hmac
 import json
+import threading
 import time
 from datetime import datetime
-from http.client import HTTPSConnection
-from conf import TENCENT_SECRET_ID, TENCENT_SECRET_KEY, TENCENT_SERVICE, TENCENT_HOST, TENCENT_VERSION, TENCENT_REGION
+from http.client import HTTPSConnection, HTTPConnection
+from queue import LifoQueue, Empty, Full
+from typing import List
+from conf import (
+    TENCENT_SECRET_ID, TENCENT_SECRET_KEY, TENCENT_SERVICE, TENCENT_HOST, TENCENT_VERSION, TENCENT_REGION,
+    TENCENT_SCHEME, TENCENT_BATCH_MAX_CHARS, TENCENT_BATCH_MAX_ITEMS, TRANSLATION_MEMORY_PATH,
+    TENCENT_POOL_SIZE, TENCENT_TIMEOUT
+)
+from translate.memory import TranslationMemory
+from ratelimit.limiter import rate_limiter
 
 class TencentTranslator:
+    _instance = None
+    _instance_lock = threading.Lock()
+
     def __init__(self):
         self.secret_id = TENCENT_SECRET_ID
         self.secret_key = TENCENT_SECRET_KEY
@@ -15,30 +27,84 @@ class TencentTranslator:
         self.host = TENCENT_HOST
         self.version = TENCENT_VERSION
         self.region = TENCENT_REGION
+        self.scheme = TENCENT_SCHEME
         self.action = "TextTranslate"
+        self.batch_action = "TextTranslateBatch"
         self.algorithm = "TC3-HMAC-SHA256"
+        self.memory = TranslationMemory(TRANSLATION_MEMORY_PATH) if TRANSLATION_MEMORY_PATH else None
+        # 空闲的长连接，后进先出，优先复用最近使用过的连接
+        self._pool = LifoQueue(maxsize=max(1, TENCENT_POOL_SIZE))
+        # 派生签名密钥只随 UTC 日期变化，按日期缓存
+        self._signing_key = None
+        self._signing_date = None
+        self._signing_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
 
     def _sign(self, key, msg):
         return hmac.new(key.encode("utf-8") if isinstance(key, str) else key,
                        msg.encode("utf-8"), hashlib.sha256).digest()
 
-    def translate(self, text, source_lang='en', target_lang='zh'):
+    def _get_signing_key(self, date):
+        with self._signing_lock:
+            if self._signing_date != date:
+                secret_date = self._sign(f"TC3{self.secret_key}", date)
+                secret_service = self._sign(secret_date, self.service)
+                self._signing_key = self._sign(secret_service, "tc3_request")
+                self._signing_date = date
+            return self._signing_key
+
+    def _acquire_connection(self):
+        try:
+            return self._pool.get_nowait(), True
+        except Empty:
+            connection_class = HTTPConnection if self.scheme == 'http' else HTTPSConnection
+            return connection_class(self.host, timeout=TENCENT_TIMEOUT), False
+
+    def _release_connection(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def _send(self, payload, headers):
+        """通过连接池发送请求，复用的连接可能已被服务端关闭，此时换新连接重试一次"""
+        while True:
+            conn, reused = self._acquire_connection()
+            try:
+                conn.request("POST", "/", payload, headers)
+                response = conn.getresponse()
+                body = response.read()
+            except Exception:
+                conn.close()
+                if reused:
+                    continue
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._release_connection(conn)
+            return body
+
+    def _request(self, action, params):
+        """签名并发送请求，返回响应中的 Response 字段"""
         timestamp = int(time.time())
         date = datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d")
 
         # 准备请求体
-        payload = json.dumps({
-            "SourceText": text,
-            "Source": source_lang,
-            "Target": target_lang,
-            "ProjectId": 0
-        })
+        payload = json.dumps(params)
 
         # 构建签名所需信息
         canonical_headers = (
             f"content-type:application/json; charset=utf-8\n"
             f"host:{self.host}\n"
-            f"x-tc-action:{self.action.lower()}\n"
+            f"x-tc-action:{action.lower()}\n"
         )
         signed_headers = "content-type;host;x-tc-action"
 
@@ -58,9 +124,7 @@ class TencentTranslator:
         )
 
         # 计算签名
-        secret_date = self._sign(f"TC3{self.secret_key}", date)
-        secret_service = self._sign(secret_date, self.service)
-        secret_signing = self._sign(secret_service, "tc3_request")
+        secret_signing = self._get_signing_key(date)
         signature = hmac.new(secret_signing,
                            string_to_sign.encode("utf-8"),
                            hashlib.sha256).hexdigest()
@@ -76,23 +140,88 @@ class TencentTranslator:
             "Authorization": authorization,
             "Content-Type": "application/json; charset=utf-8",
             "Host": self.host,
-            "X-TC-Action": self.action,
+            "X-TC-Action": action,
             "X-TC-Timestamp": str(timestamp),
             "X-TC-Version": self.version,
             "X-TC-Region": self.region
         }
 
-        try:
-            conn = HTTPSConnection(self.host)
-            conn.request("POST", "/", payload, headers)
-            response = conn.getresponse()
-            result = json.loads(response.read().decode())
-            
-            if "Response" in result and "TargetText" in result["Response"]:
-                return result["Response"]["TargetText"]
-            else:
+        with rate_limiter.limit('tencent'):
+            try:
+                result = json.loads(self._send(payload.encode("utf-8"), headers).decode())
+            except Exception as e:
+                raise Exception(f"Translation request failed: {str(e)}")
+
+            # 限流错误码为 RequestLimitExceeded，由限流器识别后收缩并发
+            if "Response" not in result or "Error" in result["Response"]:
                 raise Exception(f"Translation failed: {result}")
-        except Exception as e:
-            raise Exception(f"Translation request failed: {str(e)}")
-        finally:
-            conn.close()
\ No newline at end of file
+        return result["Response"]
+
+    def translate(self, text, source_lang='en', target_lang='zh'):
+        if not text:
+            return text
+        if self.memory:
+            cached = self.memory.get(source_lang, target_lang, text)
+            if cached is not None:
+                return cached
+
+        result = self._request(self.action, {
+            "SourceText": text,
+            "Source": source_lang,
+            "Target": target_lang,
+            "ProjectId": 0
+        })
+        if "TargetText" not in result:
+            raise Exception(f"Translation failed: {result}")
+
+        if self.memory:
+            self.memory.put(source_lang, target_lang, text, result["TargetText"])
+        return result["TargetText"]
+
+    def _pack_batches(self, texts: List[str]) -> List[List[str]]:
+        """按接口限制（总字符数、条数）把文本打包成多个批次"""
+        batches = []
+        current, current_chars = [], 0
+        for text in texts:
+            if current and (current_chars + len(text) >= TENCENT_BATCH_MAX_CHARS
+                            or len(current) >= TENCENT_BATCH_MAX_ITEMS):
+                batches.append(current)
+                current, current_chars = [], 0
+            current.append(text)
+            current_chars += len(text)
+        if current:
+            batches.append(current)
+        return batches
+
+    def translate_batch(self, texts: List[str], source_lang='en', target_lang='zh') -> List[str]:
+        """
+        批量翻译，按输入顺序返回译文
+
+        先查询翻译记忆库，剩余的不重复文本打包为尽量少的 TextTranslateBatch 请求。
+        空字符串直接返回空字符串，不发送给接口。
+        """
+        translations = self.memory.get_many(source_lang, target_lang, texts) if self.memory else {}
+        translations[''] = ''
+        pending = list(dict.fromkeys(text for text in texts if text not in translations))
+
+        for batch in self._pack_batches(pending):
+            if len(batch) == 1:
+                translations[batch[0]] = self.translate(batch[0], source_lang, target_lang)
+                continue
+
+            result = self._request(self.batch_action, {
+                "SourceTextList": batch,
+                "Source": source_lang,
+                "Target": target_lang,
+                "ProjectId": 0
+            })
+            target_texts = result.get("TargetTextList")
+            if not target_texts or len(target_texts) != len(batch):
+                raise Exception(f"Batch translation failed: {result}")
+
+            pairs = list(zip(batch, target_texts))
+            translations.update(pairs)
+            if self.memory:
+                self.memory.put_many(source_lang, target_lang, pairs)
+
+        return [translations[text] for text in texts]
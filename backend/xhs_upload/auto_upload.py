@@ -2,15 +2,17 @@
 # import time
 from app.utils.logger import logger
 import requests
-from xhs import XhsClient
-from conf import BASE_PATH
+from xhs import XhsClient, NoteType
+from conf import BASE_PATH, AGENT_SLICE_SIZE, PROMPT_CACHE_TTL, PROMPT_CACHE_MAX_REUSE
+from datetime import datetime, timedelta
+import hashlib
 import os
 import glob
 from typing import Union, List
 import json
 import random
-import openai
-from conf import OPENAI_API_KEY, OPENAI_API_BASE, OPENAI_ENHANCE_MODEL, PROMPT_ENHANCE_SYSTEM_MESSAGE, OPENAI_CAPTION_MODEL, PROMPT_CAPTION_SYSTEM_MESSAGE
+from llm.gateway import llm_gateway
+from conf import OPENAI_ENHANCE_MODEL, PROMPT_ENHANCE_SYSTEM_MESSAGE, OPENAI_CAPTION_MODEL, PROMPT_CAPTION_SYSTEM_MESSAGE
 import asyncio
 from app.models.user import User
 from app.extensions import db
@@ -19,18 +21,35 @@ from app.models.workflow_variable import WorkflowVariable
 from app.models.variable_definitions import VariableDefinitions
 from comfyui_api.utils.actions.prompt_to_image import prompt_to_image
 from comfyui_api.utils.actions.load_workflow import load_workflow
-from app.models.image import Image
+from app.models.agent_run import AgentRun, AgentRunStatus, AgentRunStage
+from app.models.prompt_cache import PromptCache
+from app.dispatcher import dispatcher, JobPriority
+from app.image_records import image_records
+from ratelimit.limiter import rate_limiter
 
 
+class RateLimitedXhsClient(XhsClient):
+    """所有小红书请求都经过按账号划分的限流"""
+
+    def __init__(self, *args, account=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.account = account
+
+    def request(self, method, url, **kwargs):
+        with rate_limiter.limit('xhs', self.account):
+            return super().request(method, url, **kwargs)
+
 class XhsUploader:
-    def __init__(self, cookie):
+    def __init__(self, cookie, account=None):
         # self.playwright = sync_playwright().start()
         # self.browser_context, self.context_page = self.get_context_page(self.playwright)
         self.cookie = cookie
+        # 限流按账号计算，未指定时用 cookie 摘要区分账号
+        self.account = account if account is not None else hashlib.md5((cookie or '').encode()).hexdigest()[:8]
         self.xhs_client = self.initXhsClient()
 
     def initXhsClient(self):
-        return XhsClient(cookie=self.cookie, sign=self.sign)
+        return RateLimitedXhsClient(cookie=self.cookie, sign=self.sign, account=self.account)
 
     def get_images_from_directory(self, directory: str) -> List[str]:
         """
@@ -107,8 +126,10 @@ class XhsUploader:
 
     def sign(self, uri, data, a1="", web_session=""):
         # 填写自己的 flask 签名服务端口地址
-        res = requests.post("http://192.168.1.150:5005/sign",
-                            json={"uri": uri, "data": data, "a1": a1, "web_session": web_session})
+        with rate_limiter.limit('xhs_sign'):
+            res = requests.post("http://192.168.1.150:5005/sign",
+                                json={"uri": uri, "data": data, "a1": a1, "web_session": web_session})
+            res.raise_for_status()
         signs = res.json()
         return {
             "x-s": signs["x-s"],
@@ -130,6 +151,43 @@ class XhsUploader:
         note = self.xhs_client.create_image_note(title, desc, processed_images, topics=topics, is_private=is_private)
         return note
 
+    def upload_image_file(self, image: str) -> str:
+        """
+        Upload a single local image to Xiaohongshu without creating a note.
+        
+        Args:
+            image (str): Local image path
+            
+        Returns:
+            str: File id to reference the image in publish_image_note
+        """
+        image_path = self.process_images([image])[0]
+        file_id, token = self.xhs_client.get_upload_files_permit("image")
+        self.xhs_client.upload_file(file_id, token, image_path)
+        return file_id
+
+    def publish_image_note(self, title, desc, file_ids, topics, is_private=True):
+        """
+        Create an image note from images already uploaded with upload_image_file.
+        
+        Args:
+            title (str): Note title
+            desc (str): Note description
+            file_ids (List[str]): Uploaded image file ids, in display order
+            is_private (bool): Whether the note is private
+        """
+        images = [{
+            "file_id": file_id,
+            "metadata": {"source": -1},
+            "stickers": {"version": 2, "floating": []},
+            "extra_info_json": '{"mimeType":"image/jpeg"}',
+        } for file_id in file_ids]
+        return self.xhs_client.create_note(title, desc, NoteType.NORMAL.value, ats=[], topics=topics,
+                                           image_info={"images": images}, is_private=is_private)
+
+class NonRetryableError(Exception):
+    """Pipeline failure that retrying cannot fix, e.g. a missing workflow or account"""
+
 def _generate_prompts(prompt_template: str, topic: str, image_count: int, image_style: str) -> List[str]:
     """Generate image prompts using OpenAI API"""
     logger.info('Generating prompts with params: topic=%s, count=%d, style=%s', topic, image_count, image_style)
@@ -141,15 +199,11 @@ def _generate_prompts(prompt_template: str, topic: str, image_count: int, image_
     )
     logger.debug('Base prompt: %s', base_prompt)
     
-    client = openai.OpenAI(
-        api_key=OPENAI_API_KEY,
-        base_url=OPENAI_API_BASE
-    )
-    
     batch_prompt = base_prompt.format(style=image_style)
     logger.info('System message: %s', prompt_template)
     
-    response = client.chat.completions.create(
+    response = llm_gateway.chat_completion(
+        'agent_prompts',
         model=OPENAI_ENHANCE_MODEL,
         messages=[
             {"role": "system", "content": prompt_template},
@@ -171,18 +225,54 @@ def _generate_prompts(prompt_template: str, topic: str, image_count: int, image_
     logger.info('Generated prompts: %s', prompts)
     return prompts
 
+def _prompt_cache_key(prompt_template: str, topic: str, image_count: int, image_style: str) -> str:
+    raw = json.dumps([prompt_template or '', topic or '', image_style or '', image_count], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def prepare_prompts(prompt_template: str, topic: str, image_count: int, image_style: str) -> List[str]:
+    """
+    Get image prompts for a run, reusing a cached set when the reuse policy allows it.
+    
+    A cached set is reused while it is younger than PROMPT_CACHE_TTL seconds and has
+    been reused fewer than PROMPT_CACHE_MAX_REUSE times. PROMPT_CACHE_TTL=0 disables reuse.
+    """
+    if PROMPT_CACHE_TTL <= 0:
+        return _generate_prompts(prompt_template, topic, image_count, image_style)
+
+    cache_key = _prompt_cache_key(prompt_template, topic, image_count, image_style)
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=PROMPT_CACHE_TTL)
+    entry = (PromptCache.query
+             .filter(PromptCache.cache_key == cache_key,
+                     PromptCache.created_at >= cutoff,
+                     PromptCache.reuse_count < PROMPT_CACHE_MAX_REUSE)
+             .order_by(PromptCache.created_at.desc())
+             .first())
+    if entry:
+        entry.reuse_count += 1
+        entry.last_used_at = now
+        db.session.commit()
+        logger.info('Reusing cached prompts %d (reuse %d/%d)', entry.id, entry.reuse_count, PROMPT_CACHE_MAX_REUSE)
+        return entry.prompts
+
+    prompts = _generate_prompts(prompt_template, topic, image_count, image_style)
+    PromptCache.query.filter(PromptCache.created_at < cutoff).delete()
+    db.session.add(PromptCache(cache_key=cache_key, prompts=prompts))
+    db.session.commit()
+    return prompts
+
 def _get_workflow_info(workflow_id: int) -> tuple:
     """Get workflow information and variables"""
     logger.info('Getting workflow info for ID: %d', workflow_id)
     
     workflow = Workflow.query.get(workflow_id)
     if not workflow:
-        raise Exception(f"Workflow not found with id: {workflow_id}")
+        raise NonRetryableError(f"Workflow not found with id: {workflow_id}")
     logger.debug('Found workflow: %s', workflow.name)
 
     workflow_path = os.path.join(BASE_PATH, workflow.file_path.replace('\\', '/'))
     if not os.path.exists(workflow_path):
-        raise Exception(f"Workflow file not found at path: {workflow_path}")
+        raise NonRetryableError(f"Workflow file not found at path: {workflow_path}")
     logger.debug('Workflow path: %s', workflow_path)
 
     workflow_data = load_workflow(workflow_path)
@@ -201,78 +291,125 @@ def _get_workflow_info(workflow_id: int) -> tuple:
                     if var.variable_definition.param_type == 'output'), None)
 
     if not prompt_var:
-        raise Exception("Workflow missing required prompt input variable")
+        raise NonRetryableError("Workflow missing required prompt input variable")
     if not output_var:
-        raise Exception("Workflow missing required output variable")
+        raise NonRetryableError("Workflow missing required output variable")
         
     return workflow, workflow_data, prompt_var, seed_var, output_var
 
 def _generate_images(workflow_data: dict, prompt_var: WorkflowVariable, seed_var: WorkflowVariable, 
                     output_var: WorkflowVariable, prompts: List[str], workflow: Workflow, 
-                    image_style: str, topic: str) -> List[str]:
-    """Generate images using the workflow"""
-    logger.info('Starting image generation for %d prompts', len(prompts))
+                    image_style: str, topic: str, done_indexes=(), on_images=None) -> List[dict]:
+    """
+    Generate images using the workflow
+    
+    Prompts whose index is in done_indexes are skipped. The image records of each slice
+    are written in one batch, then on_images is called with the saved entries so callers
+    can checkpoint them.
+    """
+    pending = [(index, prompt) for index, prompt in enumerate(prompts) if index not in done_indexes]
+    logger.info('Starting image generation for %d prompts (%d already done)',
+                len(pending), len(prompts) - len(pending))
     generated_images = []
     
-    for prompt in prompts:
-        variable_mapping = {
-            prompt_var.node_id: {
-                prompt_var.variable_definition.value_path: prompt
-            }
-        }
-        
-        seed_value = None
-        if seed_var:
-            seed_value = random.randint(100000000, 9999999999)
-            variable_mapping[seed_var.node_id] = {
-                seed_var.variable_definition.value_path: seed_value
+    # 按批提交给调度器，每批完成后再提交下一批，交互请求可以在批次之间插队
+    slice_size = max(1, AGENT_SLICE_SIZE)
+    for start in range(0, len(pending), slice_size):
+        jobs = []
+        for index, prompt in pending[start:start + slice_size]:
+            variable_mapping = {
+                prompt_var.node_id: {
+                    prompt_var.variable_definition.value_path: prompt
+                }
             }
-        logger.debug('Variable mapping: %s', variable_mapping)
-
-        result = prompt_to_image(
-            workflow=workflow_data,
-            variable_values=variable_mapping,
-            output_node_ids=[output_var.node_id],
-            save_previews=True
-        )
-        logger.debug('Generation result: %s', result)
-
-        if result:
-            image_path = os.path.join(BASE_PATH, 'output', 'images', result[0])
-            generated_images.append(image_path)
-            logger.info('Generated image: %s', image_path)
-
-            image = Image(
-                filename=result[0],
-                workflow_name=workflow.name,
-                file_path=os.path.join('output', 'images', result[0]),
-                workflow_id=workflow.id,
-                variables={
-                    'prompt': prompt,
-                    'seed': seed_value,
-                    'style': image_style,
-                    'topic': topic
+            
+            seed_value = None
+            if seed_var:
+                seed_value = random.randint(100000000, 9999999999)
+                variable_mapping[seed_var.node_id] = {
+                    seed_var.variable_definition.value_path: seed_value
                 }
+            logger.debug('Variable mapping: %s', variable_mapping)
+
+            future = dispatcher.submit(
+                JobPriority.AGENT,
+                prompt_to_image,
+                workflow=workflow_data,
+                variable_values=variable_mapping,
+                output_node_ids=[output_var.node_id],
+                save_previews=True
             )
-            db.session.add(image)
-            db.session.commit()
-            logger.info('Saved image record to database: %d', image.id)
+            jobs.append((index, prompt, seed_value, future))
+
+        # 等待整批完成，某张失败时先保存并记录其他已生成的图片，再抛出第一个错误
+        saved = []
+        first_error = None
+        for index, prompt, seed_value, future in jobs:
+            try:
+                entry = _save_generated_image(future.result(), index, prompt, seed_value,
+                                              workflow, image_style, topic)
+            except Exception as e:
+                logger.error('Image generation failed for prompt %d: %s', index, str(e))
+                if first_error is None:
+                    first_error = e
+                continue
+            if entry:
+                saved.append(entry)
+
+        # 整批图片记录一次写入，拿到图片 ID 后再写入断点
+        image_records.flush()
+        entries = []
+        for entry, pending_id in saved:
+            entry['image_id'] = pending_id.result()
+            logger.info('Saved image record to database: %d', entry['image_id'])
+            entries.append(entry)
+        generated_images.extend(entries)
+        if on_images and entries:
+            on_images(entries)
+        if first_error is not None:
+            raise first_error
 
     return generated_images
 
+def _save_generated_image(result: List[str], index: int, prompt: str, seed_value, workflow: Workflow,
+                          image_style: str, topic: str) -> tuple:
+    """Queue one generated image record, return its checkpoint entry and the pending record id"""
+    logger.debug('Generation result: %s', result)
+    if not result:
+        return None
+
+    image_path = os.path.join(BASE_PATH, 'output', 'images', result[0])
+    logger.info('Generated image: %s', image_path)
+
+    pending_id = image_records.add(
+        filename=result[0],
+        workflow_name=workflow.name,
+        file_path=os.path.join('output', 'images', result[0]),
+        workflow_id=workflow.id,
+        variables={
+            'prompt': prompt,
+            'seed': seed_value,
+            'style': image_style,
+            'topic': topic
+        }
+    )
+
+    return {
+        'index': index,
+        'prompt': prompt,
+        'seed': seed_value,
+        'filename': result[0],
+        'path': image_path,
+        'image_id': None
+    }, pending_id
+
 def _generate_caption(image_style: str, topic: str, prompts: List[str]) -> dict:
     """Generate caption for Xiaohongshu note using GPT-4"""
     logger.info('Generating caption for Xiaohongshu note')
     
-    # Prepare input for caption generation
-    
-    client = openai.OpenAI(
-        api_key=OPENAI_API_KEY,
-        base_url=OPENAI_API_BASE
-    )
-    
     logger.info('Sending request to OpenAI for caption generation')
-    response = client.chat.completions.create(
+    response = llm_gateway.chat_completion(
+        'agent_caption',
         model=OPENAI_CAPTION_MODEL,
         messages=[
             {"role": "system", "content": PROMPT_CAPTION_SYSTEM_MESSAGE},
@@ -290,23 +427,14 @@ def _generate_caption(image_style: str, topic: str, prompts: List[str]) -> dict:
         logger.error(f"Failed to parse OpenAI response as JSON: {str(e)}")
         raise Exception(f"Failed to generate caption: {str(e)}")
 
-def _upload_to_xiaohongshu(generated_images: List[str], image_style: str, topic: str, 
-                          account_id: int, prompts: List[str]) -> dict:
-    """Upload generated images to Xiaohongshu"""
-    logger.info('Uploading %d images to Xiaohongshu', len(generated_images))
-    
-    # Generate caption using GPT-4
-    caption = _generate_caption(image_style, topic, prompts)
-    logger.info('Generated caption: %s', caption)
-    
-    note = None
+def _get_uploader(account_id) -> XhsUploader:
     user = User.query.get(account_id)
     if not user:
-        raise Exception(f"User not found with id: {account_id}")
+        raise NonRetryableError(f"User not found with id: {account_id}")
+    return XhsUploader(cookie=user.cookie, account=user.id)
 
-    uploader = XhsUploader(cookie=user.cookie)
-    
-    # Process and format topics
+def _resolve_topics(uploader: XhsUploader, caption: dict, topic: str) -> dict:
+    """Resolve caption topics to Xiaohongshu topic entries"""
     formatted_topics = []
     desc_append_topics = []
     
@@ -329,67 +457,133 @@ def _upload_to_xiaohongshu(generated_images: List[str], image_style: str, topic:
             'link': topic_info.get('link')
         })
         desc_append_topics.append(f'#{topic_info.get("name")}[话题]#')
-    
-    # Upload note with formatted topics
-    note = uploader.upload_note(
-        title=caption.get('title', "又是一些精美的壁纸"),
-        desc=' '.join(desc_append_topics),  # Add formatted topics to description
-        images=generated_images,
-        topics=formatted_topics,
-        is_private=True
-    )
-    
-    logger.info('Successfully uploaded note to Xiaohongshu')
-    return note
 
-def auto_gen_and_upload(topic, image_count, prompt_template, image_style, account_id, workflow_id):
-    """Main function to generate images and upload to Xiaohongshu"""
+    return {'topics': formatted_topics, 'desc_topics': desc_append_topics}
+
+def _get_or_create_run(run_id, params: dict) -> AgentRun:
+    if run_id is not None:
+        run = AgentRun.query.get(run_id)
+        if not run:
+            raise NonRetryableError(f"Agent run not found with id: {run_id}")
+        return run
+
+    run = AgentRun(params=params)
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+def auto_gen_and_upload(topic, image_count, prompt_template, image_style, account_id, workflow_id, run_id=None):
+    """
+    Main function to generate images and upload to Xiaohongshu
+    
+    Every stage checkpoints its outputs on an AgentRun. Calling again with the
+    same run_id resumes from the last completed stage instead of starting over.
+    """
+    run = None
     try:
         logger.info('Starting auto generation and upload process')
-        logger.info('Parameters: topic=%s, count=%d, style=%s, account=%s, workflow=%d', 
-                    topic, image_count, image_style, account_id, workflow_id)
+        logger.info('Parameters: topic=%s, count=%d, style=%s, account=%s, workflow=%d, run=%s', 
+                    topic, image_count, image_style, account_id, workflow_id, run_id)
         
         # Limit image count to maximum 15
         image_count = min(image_count, 15)
 
-        # 1. Generate prompts
-        prompts = _generate_prompts(prompt_template, topic, image_count, image_style)
+        run = _get_or_create_run(run_id, {
+            'topic': topic,
+            'image_count': image_count,
+            'prompt_template': prompt_template,
+            'image_style': image_style,
+            'account_id': account_id,
+            'workflow_id': workflow_id
+        })
+        run.checkpoint(status=AgentRunStatus.RUNNING, attempts=run.attempts + 1, last_error=None)
+        if run.stage != AgentRunStage.CREATED:
+            logger.info('Resuming run %d from stage %s (attempt %d)', run.id, run.stage.value, run.attempts)
 
-        try:
-            # 2. Get workflow information
+        # 1. Generate prompts
+        if run.prompts is None:
+            prompts = prepare_prompts(prompt_template, topic, image_count, image_style)
+            run.checkpoint(AgentRunStage.PROMPTS, prompts=prompts)
+        prompts = run.prompts
+
+        # 2. Get workflow information
+        done_indexes = {entry['index'] for entry in run.images or []}
+        if len(done_indexes) < len(prompts):
             workflow, workflow_data, prompt_var, seed_var, output_var = _get_workflow_info(workflow_id)
 
-            # 3. Generate images
-            generated_images = _generate_images(
+            # 3. Generate images, checkpointing each slice as it is saved
+            _generate_images(
                 workflow_data, prompt_var, seed_var, output_var, 
-                prompts, workflow, image_style, topic
+                prompts, workflow, image_style, topic,
+                done_indexes=done_indexes,
+                on_images=lambda entries: run.checkpoint(images=(run.images or []) + entries)
             )
+            run.checkpoint(AgentRunStage.IMAGES)
+
+        generated_images = [entry['path'] for entry in sorted(run.images or [], key=lambda e: e['index'])]
+        if not generated_images:
+            raise Exception("No images were generated")
+
+        # 4. Generate caption
+        if run.caption is None:
+            caption = _generate_caption(image_style, topic, prompts)
+            logger.info('Generated caption: %s', caption)
+            run.checkpoint(AgentRunStage.CAPTION, caption=caption)
+
+        uploader = _get_uploader(account_id)
+
+        # 5. Resolve topics
+        if run.topics is None:
+            run.checkpoint(AgentRunStage.TOPICS, topics=_resolve_topics(uploader, run.caption, topic))
+
+        # 6. Upload images, checkpointing each file id
+        uploaded_paths = {item['path'] for item in run.uploaded_files or []}
+        logger.info('Uploading %d images to Xiaohongshu', len(generated_images) - len(uploaded_paths))
+        for image_path in generated_images:
+            if image_path in uploaded_paths:
+                continue
+            file_id = uploader.upload_image_file(image_path)
+            run.checkpoint(uploaded_files=(run.uploaded_files or []) + [{'path': image_path, 'file_id': file_id}])
+        run.checkpoint(AgentRunStage.UPLOADED)
+
+        # 7. Publish note with formatted topics
+        if run.note is None:
+            file_ids = {item['path']: item['file_id'] for item in run.uploaded_files}
+            note = uploader.publish_image_note(
+                title=run.caption.get('title', "又是一些精美的壁纸"),
+                desc=' '.join(run.topics['desc_topics']),  # Add formatted topics to description
+                file_ids=[file_ids[path] for path in generated_images],
+                topics=run.topics['topics'],
+                is_private=True
+            )
+            logger.info('Successfully uploaded note to Xiaohongshu')
+            run.checkpoint(AgentRunStage.PUBLISHED, note=note)
 
-            # 4. Upload to Xiaohongshu
-            if generated_images:
-                note = _upload_to_xiaohongshu(generated_images, image_style, topic, account_id, prompts)
-                
-                return {
-                    "success": True,
-                    "message": "Successfully generated and uploaded images",
-                    "data": {
-                        "note": note,
-                        "prompts": prompts,
-                        "images": generated_images
-                    }
-                }
-            else:
-                raise Exception("No images were generated")
-
-        except Exception as e:
-            logger.error("Error during image generation: %s", str(e), exc_info=True)
-            raise e
+        run.checkpoint(status=AgentRunStatus.SUCCESS, finished_at=datetime.utcnow())
+        return {
+            "success": True,
+            "message": "Successfully generated and uploaded images",
+            "run_id": run.id,
+            "data": {
+                "note": run.note,
+                "prompts": prompts,
+                "images": generated_images
+            }
+        }
 
     except Exception as e:
         logger.error("Error in auto_gen_and_upload: %s", str(e), exc_info=True)
+        if run is not None:
+            try:
+                db.session.rollback()
+                run.checkpoint(status=AgentRunStatus.FAILED, last_error=str(e))
+            except Exception as inner_e:
+                logger.error("Error saving agent run state: %s", str(inner_e))
         return {
             "success": False,
             "message": str(e),
+            "run_id": run.id if run is not None else None,
+            "retryable": not isinstance(e, NonRetryableError),
             "data": None
         }
 
@@ -143,6 +143,8 @@ export interface ListImagesResponse {
     page_size: number
     total_pages: number
     total_images: number
+    next_cursor?: string | null
+    has_next?: boolean
   }
 }
 
@@ -221,6 +223,7 @@ export interface ListWorkflowResponse {
     pages: number
     has_next: boolean
     has_prev: boolean
+    next_cursor?: string | null
   }
 }
 